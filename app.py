@@ -6,27 +6,78 @@ FilePath: /app2/app.py
 '''
 import os
 from flask import Flask
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_jwt_extended import JWTManager
 from config import Config
 from database import db
+from services.serializer import FastJSONProvider
+from services.read_receipts import read_receipts, group_read_receipts
+from services.last_seen import last_seen_buffer
+from services.presence import presence
+from services.compression import compression
+from services.blob_store import blob_store
+from services.rate_limit import rate_limiter
+from services.user_cache import user_cache
+from services.token_blocklist import token_blocklist
+from services.friend_requests import pending_requests
+from services.block_list import block_list
+from services.recent_messages import recent_messages
+from services.single_flight import single_flight
+from services.friend_suggestions import friend_suggestions
+from services.registration_filter import registration_filter
+from services.provisioning import provisioner
 
 # 初始化Flask应用
 app = Flask(__name__)
 app.config.from_object(Config)
+app.json = FastJSONProvider(app, backend=app.config['JSON_BACKEND'])
+
+# 部署在反向代理之后时从代理设置的请求头取真实客户端IP（限流按IP计数）
+if app.config['TRUSTED_PROXIES']:
+    proxies = app.config['TRUSTED_PROXIES']
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies, x_host=proxies)
 
 # 初始化扩展
 db.init_app(app)
 jwt = JWTManager(app)
+user_cache.init_app(app)
+token_blocklist.init_app(app)
+rate_limiter.init_app(app)
+read_receipts.init_app(app)
+group_read_receipts.init_app(app)
+last_seen_buffer.init_app(app)
+presence.init_app(app)
+compression.init_app(app)
+blob_store.init_app(app)
+pending_requests.init_app(app)
+block_list.init_app(app)
+recent_messages.init_app(app)
+single_flight.init_app(app)
+friend_suggestions.init_app(app)
+registration_filter.init_app(app)
+provisioner.init_app(app)
 
 # 导入路由
 from routes.auth import auth_bp
 from routes.friend import friend_bp
 from routes.message import message_bp
+from routes.presence import presence_bp
+from routes.sync import sync_bp
+from routes.group import group_bp
+from routes.attachment import attachment_bp
+from routes.user import user_bp
+from routes.admin import admin_bp
 
 # 注册蓝图
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
 app.register_blueprint(friend_bp, url_prefix='/api/friend')
 app.register_blueprint(message_bp, url_prefix='/api/message')
+app.register_blueprint(presence_bp, url_prefix='/api/presence')
+app.register_blueprint(sync_bp, url_prefix='/api/sync')
+app.register_blueprint(group_bp, url_prefix='/api/group')
+app.register_blueprint(attachment_bp, url_prefix='/api/attachment')
+app.register_blueprint(user_bp, url_prefix='/api/users')
+app.register_blueprint(admin_bp, url_prefix='/api/admin')
 
 @app.route('/api/health')
 def health_check():
@@ -39,8 +90,17 @@ def create_tables():
         from models.user import User
         from models.friendship import Friendship  
         from models.message import Message
+        from models.read_state import ReadState
+        from models.friendship_change import FriendshipChange
+        from models.group import Group, GroupMember
+        from models.group_message import GroupMessage
+        from models.attachment import Attachment
+        from models.revoked_token import RevokedToken
+        from models.friend_suggestion import FriendSuggestion
+        from migrations import run_migrations
         
         db.create_all()
+        run_migrations()
         print("✅ 数据库表创建成功！")
 
 if __name__ == '__main__':
@@ -36,7 +36,7 @@ def check_database():
         # 检查好友关系
         print("\n👥 好友关系:")
         cursor = conn.execute("""
-            SELECT u1.username, u2.username, f.status, f.created_at
+            SELECT u1.username, u2.username, f.user_status, f.friend_status, f.created_at
             FROM friendships f
             JOIN users u1 ON f.user_id = u1.id
             JOIN users u2 ON f.friend_id = u2.id
@@ -45,18 +45,20 @@ def check_database():
         friendships = cursor.fetchall()
         
         if friendships:
-            for user, friend, status, created_at in friendships:
-                print(f"  {user} -> {friend} ({status}) - {created_at}")
+            for user, friend, user_status, friend_status, created_at in friendships:
+                print(f"  {user} <-> {friend} ({user_status}/{friend_status}) - {created_at}")
         else:
             print("  暂无好友关系")
         
         # 检查消息
         print("\n💬 消息记录:")
         cursor = conn.execute("""
-            SELECT u1.username, u2.username, m.content, m.is_read, m.created_at
+            SELECT u1.username, u2.username, m.content,
+                   m.id <= COALESCE(rs.last_read_message_id, 0) AS is_read, m.created_at
             FROM messages m
             JOIN users u1 ON m.sender_id = u1.id
             JOIN users u2 ON m.receiver_id = u2.id
+            LEFT JOIN read_states rs ON rs.user_id = m.receiver_id AND rs.partner_id = m.sender_id
             ORDER BY m.created_at DESC
             LIMIT 10
         """)
@@ -74,9 +76,13 @@ def check_database():
         # 统计信息
         print("\n📊 统计信息:")
         user_count = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
-        friendship_count = conn.execute("SELECT COUNT(*) FROM friendships WHERE status='accepted'").fetchone()[0]
+        friendship_count = conn.execute("SELECT COUNT(*) FROM friendships WHERE user_status='accepted' AND friend_status='accepted'").fetchone()[0]
         message_count = conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
-        unread_count = conn.execute("SELECT COUNT(*) FROM messages WHERE is_read=0").fetchone()[0]
+        unread_count = conn.execute("""
+            SELECT COUNT(*) FROM messages m
+            LEFT JOIN read_states rs ON rs.user_id = m.receiver_id AND rs.partner_id = m.sender_id
+            WHERE m.id > COALESCE(rs.last_read_message_id, 0)
+        """).fetchone()[0]
         
         print(f"  用户总数: {user_count}")
         print(f"  好友关系数: {friendship_count // 2}")  # 除以2因为是双向关系
@@ -1,4 +1,5 @@
 import os
+from datetime import timedelta
 from dotenv import load_dotenv
 
 # 加载环境变量
@@ -25,7 +26,96 @@ class Config:
     
     # JWT配置
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'your-super-secret-jwt-key-change-this-in-production')
-    JWT_ACCESS_TOKEN_EXPIRES = False  # 不自动过期，可根据需要调整
+    # 访问令牌短期有效，过期后用刷新令牌换取新的访问令牌
+    JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=int(os.getenv('JWT_ACCESS_TOKEN_MINUTES', '15')))
+    JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=int(os.getenv('JWT_REFRESH_TOKEN_DAYS', '30')))
+    
+    # 令牌吊销名单配置（其他 worker 的吊销记录最多延迟多少秒生效、布隆过滤器容量）
+    REVOCATION_SYNC_INTERVAL = float(os.getenv('REVOCATION_SYNC_INTERVAL', '5'))
+    REVOCATION_BLOOM_CAPACITY = int(os.getenv('REVOCATION_BLOOM_CAPACITY', '100000'))
+    
+    # 已读回执配置（刷写间隔为秒，<= 0 表示同步写入）
+    READ_RECEIPT_FLUSH_INTERVAL = float(os.getenv('READ_RECEIPT_FLUSH_INTERVAL', '1.0'))
+    READ_RECEIPT_BATCH_SIZE = int(os.getenv('READ_RECEIPT_BATCH_SIZE', '500'))
+    
+    # 最后在线时间配置（内存缓冲后批量落库）
+    LAST_SEEN_FLUSH_INTERVAL = float(os.getenv('LAST_SEEN_FLUSH_INTERVAL', '30'))
+    LAST_SEEN_BATCH_SIZE = int(os.getenv('LAST_SEEN_BATCH_SIZE', '1000'))
+    ONLINE_WINDOW_SECONDS = int(os.getenv('ONLINE_WINDOW_SECONDS', '300'))  # 最后活跃时间在内存中保留的秒数
+    
+    # 在线状态配置（心跳和输入状态的过期秒数）
+    PRESENCE_TTL_SECONDS = int(os.getenv('PRESENCE_TTL_SECONDS', '60'))
+    TYPING_TTL_SECONDS = int(os.getenv('TYPING_TTL_SECONDS', '8'))
+    
+    # 多 worker 共享状态的存储地址（如 redis://localhost:6379/0），留空时使用进程内存
+    SHARED_STORE_URL = os.getenv('SHARED_STORE_URL', '')
+    
+    # JSON 序列化后端：auto（安装了 orjson 时使用）、orjson 或 stdlib
+    JSON_BACKEND = os.getenv('JSON_BACKEND', 'auto')
+    
+    # 响应压缩配置（超过阈值字节数的响应按 Accept-Encoding 使用 br / gzip 压缩）
+    COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', '1024'))
+    COMPRESS_LEVEL = int(os.getenv('COMPRESS_LEVEL', '6'))
+    
+    # 群聊成员数量上限
+    GROUP_MAX_MEMBERS = int(os.getenv('GROUP_MAX_MEMBERS', '5000'))
+    
+    # 消息内容超过该字节数时压缩存储
+    MESSAGE_COMPRESS_MIN_SIZE = int(os.getenv('MESSAGE_COMPRESS_MIN_SIZE', '1024'))
+    
+    # 附件存储配置（目录留空时使用 instance/attachments，大小上限单位为字节）
+    ATTACHMENT_DIR = os.getenv('ATTACHMENT_DIR', '')
+    ATTACHMENT_MAX_SIZE = int(os.getenv('ATTACHMENT_MAX_SIZE', str(50 * 1024 * 1024)))
+    ATTACHMENT_CACHE_MAX_AGE = int(os.getenv('ATTACHMENT_CACHE_MAX_AGE', '86400'))
+    # 由 Nginx / Apache 通过 X-Sendfile 发送附件文件
+    USE_X_SENDFILE = os.getenv('USE_X_SENDFILE', 'False').lower() == 'true'
+    
+    # 应用前面的反向代理层数（如 Nginx 为 1），用于从 X-Forwarded-For 等请求头取真实客户端IP；直接对外服务时为 0
+    TRUSTED_PROXIES = int(os.getenv('TRUSTED_PROXIES', '0'))
+    
+    # 限流配置：按端点或蓝图设置 "次数/时间单位"，未匹配的请求使用默认规则
+    RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'True').lower() == 'true'
+    RATE_LIMIT_DEFAULT = os.getenv('RATE_LIMIT_DEFAULT', '600/minute')
+    RATE_LIMITS = os.getenv(
+        'RATE_LIMITS',
+        'auth.login=10/minute;auth.register=5/minute;message.send_message=60/minute;'
+        'friend.search_users=30/minute;friend.add_friend=20/minute;user.match_contacts=10/minute;'
+        'attachment.upload_attachment=20/minute'
+    )
+    
+    # 已登录用户信息的进程内缓存（过期秒数、最多缓存的用户数）
+    USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', '300'))
+    USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+    
+    # 待处理好友请求数的缓存过期秒数
+    FRIEND_REQUEST_COUNT_TTL = int(os.getenv('FRIEND_REQUEST_COUNT_TTL', '600'))
+    
+    # 屏蔽关系的进程内缓存（过期秒数、最多缓存的用户数）
+    BLOCK_CACHE_TTL = int(os.getenv('BLOCK_CACHE_TTL', '300'))
+    BLOCK_CACHE_SIZE = int(os.getenv('BLOCK_CACHE_SIZE', '10000'))
+    
+    # 会话最近消息的进程内缓存（每个会话保存的消息数、最多缓存的会话数、整体重新加载的间隔秒数）
+    RECENT_MESSAGES_PER_CONVERSATION = int(os.getenv('RECENT_MESSAGES_PER_CONVERSATION', '50'))
+    RECENT_CONVERSATIONS_MAX = int(os.getenv('RECENT_CONVERSATIONS_MAX', '10000'))
+    RECENT_MESSAGES_TTL = int(os.getenv('RECENT_MESSAGES_TTL', '30'))
+    
+    # 相同并发读请求合并（开关、等待第一个请求的最长秒数）
+    SINGLE_FLIGHT_ENABLED = os.getenv('SINGLE_FLIGHT_ENABLED', 'True').lower() == 'true'
+    SINGLE_FLIGHT_TIMEOUT = int(os.getenv('SINGLE_FLIGHT_TIMEOUT', '10'))
+    
+    # 好友推荐：应用进程内重新计算的间隔秒数（默认 0，由 cron 定时执行 suggest_friends.py；只适合单 worker 部署）、每人推荐数
+    FRIEND_SUGGESTION_INTERVAL = int(os.getenv('FRIEND_SUGGESTION_INTERVAL', '0'))
+    FRIEND_SUGGESTION_LIMIT = int(os.getenv('FRIEND_SUGGESTION_LIMIT', '20'))
+    
+    # 注册查重的布隆过滤器容量（已占用的用户名和邮箱数）
+    REGISTRATION_BLOOM_CAPACITY = int(os.getenv('REGISTRATION_BLOOM_CAPACITY', '1000000'))
+    
+    # 管理接口令牌（留空时管理接口不可用）；HTTP 接口一次最多导入的用户数；
+    # 命令行批量导入用户的哈希进程数（0 为 CPU 核数）和每批行数
+    ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+    ADMIN_IMPORT_MAX_ROWS = int(os.getenv('ADMIN_IMPORT_MAX_ROWS', '50'))
+    PROVISION_WORKERS = int(os.getenv('PROVISION_WORKERS', '0'))
+    PROVISION_BATCH_SIZE = int(os.getenv('PROVISION_BATCH_SIZE', '1000'))
     
     # Flask配置
     SECRET_KEY = os.getenv('SECRET_KEY', JWT_SECRET_KEY)
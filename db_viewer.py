@@ -78,7 +78,7 @@ class DatabaseViewer:
         with self.get_connection() as conn:
             cursor = conn.execute("""
                 SELECT f.id, u1.username as user, u2.username as friend, 
-                       f.status, f.created_at
+                       f.user_status, f.friend_status, f.created_at
                 FROM friendships f
                 JOIN users u1 ON f.user_id = u1.id
                 JOIN users u2 ON f.friend_id = u2.id
@@ -87,12 +87,12 @@ class DatabaseViewer:
             friendships = cursor.fetchall()
             
             if friendships:
-                headers = ["ID", "用户", "好友", "状态", "创建时间"]
+                headers = ["ID", "用户", "好友", "用户状态", "好友状态", "创建时间"]
                 formatted_friendships = []
                 for friendship in friendships:
                     formatted_friendship = list(friendship)
-                    if formatted_friendship[4]:
-                        formatted_friendship[4] = formatted_friendship[4][:19]
+                    if formatted_friendship[5]:
+                        formatted_friendship[5] = formatted_friendship[5][:19]
                     formatted_friendships.append(formatted_friendship)
                 
                 print(tabulate(formatted_friendships, headers=headers, tablefmt="grid"))
@@ -108,10 +108,12 @@ class DatabaseViewer:
         with self.get_connection() as conn:
             cursor = conn.execute("""
                 SELECT m.id, u1.username as sender, u2.username as receiver, 
-                       m.content, m.message_type, m.is_read, m.created_at
+                       m.content, m.message_type,
+                       m.id <= COALESCE(rs.last_read_message_id, 0) AS is_read, m.created_at
                 FROM messages m
                 JOIN users u1 ON m.sender_id = u1.id
                 JOIN users u2 ON m.receiver_id = u2.id
+                LEFT JOIN read_states rs ON rs.user_id = m.receiver_id AND rs.partner_id = m.sender_id
                 ORDER BY m.created_at DESC
                 LIMIT ?
             """, (limit,))
@@ -148,16 +150,18 @@ class DatabaseViewer:
             
             # 好友关系总数
             friendship_count = conn.execute(
-                "SELECT COUNT(*) FROM friendships WHERE status='accepted'"
+                "SELECT COUNT(*) FROM friendships WHERE user_status='accepted' AND friend_status='accepted'"
             ).fetchone()[0]
             
             # 消息总数
             message_count = conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
             
             # 未读消息数
-            unread_count = conn.execute(
-                "SELECT COUNT(*) FROM messages WHERE is_read=0"
-            ).fetchone()[0]
+            unread_count = conn.execute("""
+                SELECT COUNT(*) FROM messages m
+                LEFT JOIN read_states rs ON rs.user_id = m.receiver_id AND rs.partner_id = m.sender_id
+                WHERE m.id > COALESCE(rs.last_read_message_id, 0)
+            """).fetchone()[0]
             
             stats = [
                 ["用户总数", user_count],
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据库迁移脚本
+
+db.create_all() 只会创建缺失的表，已有表上的新列、新索引和数据迁移在这里完成。
+每个迁移只执行一次，执行记录保存在 schema_migrations 表中。
+"""
+
+from datetime import datetime
+from sqlalchemy import Text, bindparam, func, inspect, select, text, type_coerce
+from database import db
+
+
+def _connection():
+    return db.session.connection()
+
+
+def _has_column(table_name, column_name):
+    """检查表中是否已有某列"""
+    columns = inspect(_connection()).get_columns(table_name)
+    return any(column['name'] == column_name for column in columns)
+
+
+def _ensure_index(model, index_name):
+    """按模型定义补建缺失的索引"""
+    existing = {index['name'] for index in inspect(_connection()).get_indexes(model.__tablename__)}
+    existing |= {
+        constraint['name']
+        for constraint in inspect(_connection()).get_unique_constraints(model.__tablename__)
+    }
+    if index_name in existing:
+        return
+    for index in model.__table__.indexes:
+        if index.name == index_name:
+            index.create(_connection())
+            return
+
+
+def _add_column(model, column_name):
+    """按模型定义补建缺失的可空列"""
+    table_name = model.__tablename__
+    if _has_column(table_name, column_name):
+        return
+    column = model.__table__.c[column_name]
+    column_type = column.type.compile(dialect=_connection().dialect)
+    db.session.execute(text(f'ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}'))
+
+
+def migrate_read_states():
+    """把 messages.is_read 迁移为 read_states 已读水位"""
+    from models.message import Message
+    
+    _ensure_index(Message, 'idx_messages_conversation')
+    
+    # 每个会话取已读消息的最大ID作为水位
+    db.session.execute(text("""
+        INSERT INTO read_states (user_id, partner_id, last_read_message_id, updated_at)
+        SELECT m.receiver_id, m.sender_id, MAX(m.id), :now
+        FROM messages m
+        WHERE m.is_read = 1
+          AND NOT EXISTS (
+              SELECT 1 FROM read_states rs
+              WHERE rs.user_id = m.receiver_id AND rs.partner_id = m.sender_id
+          )
+        GROUP BY m.receiver_id, m.sender_id
+    """), {'now': datetime.utcnow()})
+
+
+def migrate_message_receiver_index():
+    """为增量同步补建 messages (receiver_id, id) 索引"""
+    from models.message import Message
+    
+    _ensure_index(Message, 'idx_messages_receiver')
+
+
+def migrate_message_attachments():
+    """为单聊和群聊消息补建附件列及索引"""
+    from models.message import Message
+    from models.group_message import GroupMessage
+    
+    for model, index_name in (
+        (Message, 'idx_messages_attachment'),
+        (GroupMessage, 'idx_group_messages_attachment'),
+    ):
+        _add_column(model, 'attachment_id')
+        _ensure_index(model, index_name)
+
+
+def migrate_compress_message_content():
+    """压缩已有的长消息内容，按ID分批处理"""
+    from models.message import Message
+    from models.group_message import GroupMessage
+    from models.types import COMPRESSED_PREFIX, CompressedText
+    
+    batch_size = 1000
+    min_size = CompressedText.min_size()
+    # 阈值是 UTF-8 字节数，各数据库的 length() 按字符计（MySQL 按字节）：
+    # 一个字符最多 4 字节，按字符数粗筛，是否达到阈值逐行按字节判断
+    min_chars = (min_size + 3) // 4
+    for model in (Message, GroupMessage):
+        table = model.__table__
+        last_id = 0
+        while True:
+            # 按原始文本读取，未压缩的长内容写回时由 CompressedText 压缩
+            rows = db.session.execute(
+                select(table.c.id, type_coerce(table.c.content, Text).label('content'))
+                .where(table.c.id > last_id, func.length(table.c.content) >= min_chars)
+                .order_by(table.c.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            updates = [
+                {'row_id': row.id, 'content': row.content}
+                for row in rows
+                if not row.content.startswith(COMPRESSED_PREFIX) and len(row.content.encode('utf-8')) >= min_size
+            ]
+            if updates:
+                db.session.execute(
+                    table.update().where(table.c.id == bindparam('row_id')),
+                    updates
+                )
+
+
+def migrate_message_client_id():
+    """为发送去重补建 messages.client_msg_id 列及唯一索引"""
+    from models.message import Message
+    
+    _add_column(Message, 'client_msg_id')
+    _ensure_index(Message, 'idx_messages_client_msg')
+
+
+def migrate_canonical_friendships():
+    """把双行存储的好友关系合并为每对用户一行，两侧状态分别写入 user_status / friend_status"""
+    from models.friendship import Friendship
+    
+    _add_column(Friendship, 'user_status')
+    _add_column(Friendship, 'friend_status')
+    _ensure_index(Friendship, 'idx_friendships_friend')
+    
+    # 已经是 (较小ID, 较大ID) 方向的行，status 就是较小ID一侧的状态
+    db.session.execute(text("""
+        UPDATE friendships SET user_status = status
+        WHERE user_id < friend_id AND user_status IS NULL
+    """))
+    
+    # 反向的行按ID分批并入对应的规范行，没有对应规范行时新建一行
+    batch_size = 1000
+    last_id = 0
+    while True:
+        rows = db.session.execute(text("""
+            SELECT id, user_id, friend_id, status, created_at FROM friendships
+            WHERE id > :last_id AND user_id > friend_id
+            ORDER BY id LIMIT :limit
+        """), {'last_id': last_id, 'limit': batch_size}).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        
+        existing = {
+            (row.user_id, row.friend_id)
+            for row in db.session.execute(
+                text("""
+                    SELECT user_id, friend_id FROM friendships
+                    WHERE friend_id IN :high_ids AND user_id < friend_id
+                """).bindparams(bindparam('high_ids', expanding=True)),
+                {'high_ids': list({row.user_id for row in rows})}
+            )
+        }
+        updates = []
+        inserts = []
+        for row in rows:
+            params = {
+                'low': row.friend_id, 'high': row.user_id,
+                'status': row.status, 'created_at': row.created_at
+            }
+            if (row.friend_id, row.user_id) in existing:
+                updates.append(params)
+            else:
+                inserts.append(params)
+        if updates:
+            db.session.execute(text("""
+                UPDATE friendships SET friend_status = :status
+                WHERE user_id = :low AND friend_id = :high
+            """), updates)
+        if inserts:
+            db.session.execute(text("""
+                INSERT INTO friendships (user_id, friend_id, friend_status, status, created_at)
+                VALUES (:low, :high, :status, :status, :created_at)
+            """), inserts)
+    
+    db.session.execute(text("DELETE FROM friendships WHERE user_id >= friend_id"))
+
+
+def migrate_friend_request_indexes():
+    """为好友请求收件箱补建 (用户, 状态, 时间) 索引"""
+    from models.friendship import Friendship
+    
+    _ensure_index(Friendship, 'idx_friendships_user_status')
+    _ensure_index(Friendship, 'idx_friendships_friend_status')
+
+
+def migrate_user_contact_hashes():
+    """为通讯录匹配补建 users.username_hash / email_hash 列，按ID分批回填后建索引"""
+    from models.user import User
+    
+    _add_column(User, 'username_hash')
+    _add_column(User, 'email_hash')
+    
+    users = User.__table__
+    batch_size = 1000
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(users.c.id, users.c.username, users.c.email)
+            .where(users.c.id > last_id)
+            .order_by(users.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        db.session.execute(
+            users.update().where(users.c.id == bindparam('row_id')),
+            [
+                {
+                    'row_id': row.id,
+                    'username_hash': User.contact_hash(row.username),
+                    'email_hash': User.contact_hash(row.email)
+                }
+                for row in rows
+            ]
+        )
+    
+    _ensure_index(User, 'ix_users_username_hash')
+    _ensure_index(User, 'ix_users_email_hash')
+
+
+def migrate_read_state_sync_indexes():
+    """为增量同步补建 read_states (用户, 更新时间) 索引"""
+    from models.read_state import ReadState
+    
+    _ensure_index(ReadState, 'idx_read_states_user_updated')
+    _ensure_index(ReadState, 'idx_read_states_partner_updated')
+
+
+def migrate_revoked_before_microseconds():
+    """revoked_tokens.revoked_before 由秒改为微秒"""
+    db.session.execute(text("UPDATE revoked_tokens SET revoked_before = revoked_before * 1000000"))
+
+
+# 按顺序执行的迁移列表，只能追加不能修改
+MIGRATIONS = [
+    ('0001_read_states', migrate_read_states),
+    ('0002_message_receiver_index', migrate_message_receiver_index),
+    ('0003_message_attachments', migrate_message_attachments),
+    ('0004_compress_message_content', migrate_compress_message_content),
+    ('0005_message_client_id', migrate_message_client_id),
+    ('0006_canonical_friendships', migrate_canonical_friendships),
+    ('0007_friend_request_indexes', migrate_friend_request_indexes),
+    ('0008_user_contact_hashes', migrate_user_contact_hashes),
+    ('0009_read_state_sync_indexes', migrate_read_state_sync_indexes),
+    ('0010_revoked_before_microseconds', migrate_revoked_before_microseconds),
+]
+
+
+def run_migrations():
+    """执行所有尚未执行的迁移，需要在应用上下文中调用"""
+    db.session.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            name VARCHAR(100) PRIMARY KEY,
+            applied_at DATETIME NOT NULL
+        )
+    """))
+    applied = {row[0] for row in db.session.execute(text("SELECT name FROM schema_migrations"))}
+    db.session.commit()
+    
+    for name, migrate in MIGRATIONS:
+        if name in applied:
+            continue
+        try:
+            migrate()
+            db.session.execute(
+                text("INSERT INTO schema_migrations (name, applied_at) VALUES (:name, :now)"),
+                {'name': name, 'now': datetime.utcnow()}
+            )
+            db.session.commit()
+            print(f"✅ 迁移完成: {name}")
+        except Exception:
+            db.session.rollback()
+            raise
+
+
+if __name__ == '__main__':
+    from app import app
+    
+    with app.app_context():
+        db.create_all()
+        run_migrations()
@@ -0,0 +1,66 @@
+from datetime import datetime
+from database import db
+
+
+class Attachment(db.Model):
+    """附件模型
+    
+    文件内容按 SHA-256 存放在本地 blob 目录，内容相同的文件只存一份；
+    每次上传各自一条记录，保存文件名、类型和上传者。
+    """
+    __tablename__ = 'attachments'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    uploader_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    sha256 = db.Column(db.String(64), nullable=False, index=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    mime_type = db.Column(db.String(100), nullable=False, default='application/octet-stream')
+    filename = db.Column(db.String(255), nullable=False, default='')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # 在浏览器中直接显示的图片类型，上传时按文件头识别；SVG 等其他类型一律按文件下载
+    INLINE_IMAGE_TYPES = ('image/png', 'image/jpeg', 'image/gif', 'image/webp')
+    
+    def is_image(self):
+        return self.mime_type in Attachment.INLINE_IMAGE_TYPES
+    
+    def message_type(self):
+        """引用该附件的消息类型"""
+        return 'image' if self.is_image() else 'file'
+    
+    def is_visible_to(self, user_id):
+        """上传者本人，以及引用该附件的消息的收发双方、群成员可以访问"""
+        from models.message import Message
+        from models.group import GroupMember
+        from models.group_message import GroupMessage
+        
+        if self.uploader_id == user_id:
+            return True
+        
+        in_message = db.session.query(Message.id).filter(
+            Message.attachment_id == self.id,
+            db.or_(Message.sender_id == user_id, Message.receiver_id == user_id)
+        ).first()
+        if in_message:
+            return True
+        
+        in_group = db.session.query(GroupMessage.id).join(
+            GroupMember, GroupMember.group_id == GroupMessage.group_id
+        ).filter(
+            GroupMessage.attachment_id == self.id,
+            GroupMember.user_id == user_id
+        ).first()
+        return in_group is not None
+    
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'size': self.size,
+            'mime_type': self.mime_type,
+            'sha256': self.sha256,
+            'url': f'/api/attachment/{self.id}',
+            'thumbnail_url': f'/api/attachment/{self.id}/thumbnail' if self.is_image() else None,
+            'created_at': self.created_at
+        }
@@ -0,0 +1,24 @@
+import json
+from datetime import datetime
+from database import db
+
+
+class FriendSuggestion(db.Model):
+    """预先计算的好友推荐（可能认识的人）
+    
+    每个用户一行，由后台任务按好友关系图定期重建，接口按主键读取。
+    """
+    __tablename__ = 'friend_suggestions'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    suggestions = db.Column(db.Text, nullable=False)  # JSON：[[用户ID, 共同好友数], ...]，按推荐顺序排列
+    computed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    
+    @staticmethod
+    def encode(items):
+        """把 [(用户ID, 共同好友数), ...] 编码为存储格式"""
+        return json.dumps([[int(user_id), int(mutual)] for user_id, mutual in items], separators=(',', ':'))
+    
+    def items(self):
+        """[(用户ID, 共同好友数), ...]"""
+        return [(user_id, mutual) for user_id, mutual in json.loads(self.suggestions)]
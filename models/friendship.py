@@ -1,26 +1,190 @@
 from datetime import datetime
+from sqlalchemy import and_, func, or_, select, union_all
 from database import db
 
 
 class Friendship(db.Model):
-    """好友关系模型"""
+    """好友关系模型
+    
+    每对用户只存一行：user_id 为较小的用户ID，friend_id 为较大的用户ID，
+    user_status / friend_status 分别是两侧用户对这段关系的状态，双方都为 accepted 时才是好友。
+    """
     __tablename__ = 'friendships'
     
+    ACCEPTED = 'accepted'
+    PENDING = 'pending'
+    BLOCKED = 'blocked'
+    
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    friend_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    status = db.Column(db.String(20), default='pending')  # pending, accepted, blocked
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)  # 较小的用户ID
+    friend_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)  # 较大的用户ID
+    user_status = db.Column(db.String(20))  # user_id 一侧的状态：accepted, pending, blocked
+    friend_status = db.Column(db.String(20))  # friend_id 一侧的状态
+    status = db.Column(db.String(20))  # 已废弃：旧的双行存储使用，仅为兼容旧数据保留
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    # 添加唯一约束，防止重复的好友关系
-    __table_args__ = (db.UniqueConstraint('user_id', 'friend_id', name='unique_friendship'),)
+    # 添加唯一约束，防止重复的好友关系；按较大ID一侧查询时走 idx_friendships_friend
+    # 两侧各有一个 (用户, 状态, 时间) 索引，收到的好友请求按索引范围读取
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'friend_id', name='unique_friendship'),
+        db.Index('idx_friendships_friend', 'friend_id', 'user_id'),
+        db.Index('idx_friendships_user_status', 'user_id', 'user_status', 'created_at'),
+        db.Index('idx_friendships_friend_status', 'friend_id', 'friend_status', 'created_at'),
+        db.CheckConstraint('user_id < friend_id', name='ck_friendship_canonical'),
+    )
     
-    def to_dict(self):
-        """转换为字典"""
+    # 列表接口按列查询，跳过 ORM 对象构建
+    serialize_columns = ('id', 'user_id', 'friend_id', 'user_status', 'friend_status', 'created_at')
+    
+    @classmethod
+    def list_columns(cls):
+        """按列序列化时需要查询的列"""
+        return [getattr(cls, name) for name in cls.serialize_columns]
+    
+    @staticmethod
+    def row_to_dict(row):
+        """把查询出的列元组（或模型对象）转换为字典，datetime 由 JSON 序列化器输出"""
         return {
-            'id': self.id,
-            'user_id': self.user_id,
-            'friend_id': self.friend_id,
-            'status': self.status,
-            'created_at': self.created_at.isoformat() if self.created_at else None
+            'id': row.id,
+            'user_id': row.user_id,
+            'friend_id': row.friend_id,
+            'user_status': row.user_status,
+            'friend_status': row.friend_status,
+            'created_at': row.created_at
         }
+    
+    def to_dict(self):
+        """转换为字典"""
+        return Friendship.row_to_dict(self)
+    
+    @staticmethod
+    def canonical(user_a, user_b):
+        """一对用户在表中的 (user_id, friend_id)"""
+        return (user_a, user_b) if user_a < user_b else (user_b, user_a)
+    
+    @staticmethod
+    def get(user_a, user_b):
+        """查找两个用户之间的关系行，按唯一索引单点查询"""
+        low, high = Friendship.canonical(user_a, user_b)
+        return Friendship.query.filter_by(user_id=low, friend_id=high).first()
+    
+    @staticmethod
+    def are_friends(user_a, user_b):
+        """两个用户是否互为好友"""
+        low, high = Friendship.canonical(user_a, user_b)
+        return db.session.query(Friendship.id).filter(
+            Friendship.user_id == low,
+            Friendship.friend_id == high,
+            Friendship.user_status == Friendship.ACCEPTED,
+            Friendship.friend_status == Friendship.ACCEPTED
+        ).first() is not None
+    
+    @property
+    def accepted(self):
+        """双方是否都已同意，即互为好友"""
+        return self.user_status == Friendship.ACCEPTED and self.friend_status == Friendship.ACCEPTED
+    
+    def status_of(self, user_id):
+        """user_id 一侧的状态"""
+        return self.user_status if user_id == self.user_id else self.friend_status
+    
+    def set_status(self, user_id, status):
+        """设置 user_id 一侧的状态"""
+        if user_id == self.user_id:
+            self.user_status = status
+        else:
+            self.friend_status = status
+    
+    def other_id(self, user_id):
+        """关系中的另一方"""
+        return self.friend_id if user_id == self.user_id else self.user_id
+    
+    @staticmethod
+    def friends_subquery(user_id, candidate_ids=None):
+        """user_id 的好友 (friend_id, created_at) 子查询，传 candidate_ids 时只在其中查找
+        
+        拆成两个分别走索引的查询再 UNION ALL，避免 user_id = ? OR friend_id = ? 的 OR 条件。
+        """
+        accepted = (Friendship.user_status == Friendship.ACCEPTED) & (Friendship.friend_status == Friendship.ACCEPTED)
+        as_low = select(
+            Friendship.friend_id.label('friend_id'), Friendship.created_at.label('created_at')
+        ).where(Friendship.user_id == user_id, accepted)
+        as_high = select(
+            Friendship.user_id.label('friend_id'), Friendship.created_at.label('created_at')
+        ).where(Friendship.friend_id == user_id, accepted)
+        if candidate_ids is not None:
+            as_low = as_low.where(Friendship.friend_id.in_(candidate_ids))
+            as_high = as_high.where(Friendship.user_id.in_(candidate_ids))
+        return union_all(as_low, as_high).subquery()
+    
+    @staticmethod
+    def friend_ids(user_id, candidate_ids=None):
+        """user_id 的好友ID集合，传 candidate_ids 时只在其中查找"""
+        if candidate_ids is not None:
+            candidate_ids = list(candidate_ids)
+            if not candidate_ids:
+                return set()
+        friends = Friendship.friends_subquery(user_id, candidate_ids)
+        return {friend_id for (friend_id,) in db.session.query(friends.c.friend_id)}
+    
+    @staticmethod
+    def _sides():
+        """(本方ID列, 本方状态列, 对方ID列, 对方状态列)，分别对应本方为较小ID和较大ID两种情况"""
+        return (
+            (Friendship.user_id, Friendship.user_status, Friendship.friend_id, Friendship.friend_status),
+            (Friendship.friend_id, Friendship.friend_status, Friendship.user_id, Friendship.user_status),
+        )
+    
+    @staticmethod
+    def requests_subquery(user_id, incoming=True, before=None, limit=None):
+        """待处理好友请求 (other_id, created_at, id) 子查询
+        
+        incoming 为 True 时是 user_id 收到的请求，否则是发出的请求。
+        before 为 (created_at, id) 时只取更早的请求；每一侧先按时间倒序取 limit 条再合并。
+        """
+        mine, theirs = (Friendship.PENDING, Friendship.ACCEPTED) if incoming else (Friendship.ACCEPTED, Friendship.PENDING)
+        branches = []
+        for self_id, self_status, other_id, other_status in Friendship._sides():
+            query = select(
+                other_id.label('other_id'), Friendship.created_at.label('created_at'), Friendship.id.label('id')
+            ).where(self_id == user_id, self_status == mine, other_status == theirs)
+            if before is not None:
+                created_at, row_id = before
+                query = query.where(or_(
+                    Friendship.created_at < created_at,
+                    and_(Friendship.created_at == created_at, Friendship.id < row_id)
+                ))
+            if limit is not None:
+                query = query.order_by(Friendship.created_at.desc(), Friendship.id.desc()).limit(limit)
+            branches.append(select(*query.subquery().c))
+        return union_all(*branches).subquery()
+    
+    @staticmethod
+    def pending_count(user_id):
+        """user_id 收到的待处理好友请求数，两侧都只扫描 (用户, 状态) 索引"""
+        total = 0
+        for self_id, self_status, _, _ in Friendship._sides():
+            total += db.session.query(func.count(Friendship.id)).filter(
+                self_id == user_id, self_status == Friendship.PENDING
+            ).scalar()
+        return total
+    
+    @staticmethod
+    def block_lists(user_id):
+        """(user_id 屏蔽的用户ID列表, 屏蔽了 user_id 的用户ID列表)，一次查询"""
+        branches = [
+            select(
+                other_id.label('other_id'), self_status.label('self_status'), other_status.label('other_status')
+            ).where(
+                self_id == user_id,
+                or_(self_status == Friendship.BLOCKED, other_status == Friendship.BLOCKED)
+            )
+            for self_id, self_status, other_id, other_status in Friendship._sides()
+        ]
+        blocked, blocked_by = [], []
+        for row in db.session.execute(union_all(*branches)):
+            if row.self_status == Friendship.BLOCKED:
+                blocked.append(row.other_id)
+            if row.other_status == Friendship.BLOCKED:
+                blocked_by.append(row.other_id)
+        return blocked, blocked_by
@@ -0,0 +1,60 @@
+from datetime import datetime
+from database import db
+from services.cursor import settle_horizon
+
+
+class FriendshipChange(db.Model):
+    """好友变更日志模型
+    
+    每次好友关系变化或好友资料变化都为受影响的用户追加一条记录，自增ID即好友列表的版本号，
+    客户端凭上次拿到的版本号增量同步好友列表。自增ID不保证按提交顺序可见，
+    版本号只推进到稳定窗口（services.cursor.SETTLE_SECONDS）之前的记录，更新的记录会再次下发。
+    """
+    __tablename__ = 'friendship_changes'
+    
+    ADDED = 'added'
+    REMOVED = 'removed'
+    CHANGED = 'changed'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)  # 好友列表发生变化的用户
+    friend_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    action = db.Column(db.String(20), nullable=False)  # added, removed, changed
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (db.Index('idx_friendship_changes_user', 'user_id', 'id'),)
+    
+    @staticmethod
+    def record(user_id, friend_id, action):
+        """记录一条好友变更，随调用方的事务一起提交"""
+        db.session.add(FriendshipChange(user_id=user_id, friend_id=friend_id, action=action))
+    
+    @staticmethod
+    def record_profile_change(user_id, friend_ids):
+        """用户资料变化后为其全部好友各记录一条 changed，随调用方的事务一起提交"""
+        now = datetime.utcnow()
+        rows = [
+            {'user_id': friend_id, 'friend_id': user_id, 'action': FriendshipChange.CHANGED, 'created_at': now}
+            for friend_id in friend_ids
+        ]
+        if rows:
+            db.session.execute(FriendshipChange.__table__.insert(), rows)
+    
+    @staticmethod
+    def current_version(user_id):
+        """用户好友列表的当前版本号（稳定窗口之前的最大变更ID），没有变更记录时为 0"""
+        version = db.session.query(db.func.max(FriendshipChange.id)).filter(
+            FriendshipChange.user_id == user_id,
+            FriendshipChange.created_at <= settle_horizon()
+        ).scalar()
+        return version or 0
+    
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'friend_id': self.friend_id,
+            'action': self.action,
+            'created_at': self.created_at
+        }
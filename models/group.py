@@ -0,0 +1,69 @@
+from datetime import datetime
+from database import db
+
+
+class Group(db.Model):
+    """群聊模型"""
+    __tablename__ = 'chat_groups'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    owner_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'owner_id': self.owner_id,
+            'created_at': self.created_at
+        }
+
+
+class GroupMember(db.Model):
+    """群成员模型
+    
+    每条群消息只存一份，成员的未读状态由已读水位 last_read_message_id 推导。
+    """
+    __tablename__ = 'group_members'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    group_id = db.Column(db.Integer, db.ForeignKey('chat_groups.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    role = db.Column(db.String(20), default='member')  # owner, admin, member
+    last_read_message_id = db.Column(db.Integer, nullable=False, default=0)
+    joined_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('group_id', 'user_id', name='unique_group_member'),
+        db.Index('idx_group_members_user', 'user_id', 'group_id'),
+    )
+    
+    @staticmethod
+    def get(group_id, user_id):
+        """查找群成员记录，不是成员时返回 None"""
+        return GroupMember.query.filter_by(group_id=group_id, user_id=user_id).first()
+    
+    @staticmethod
+    def advance(group_id, user_id, message_id):
+        """把成员的已读水位推进到 message_id（只增不减），不提交事务"""
+        GroupMember.query.filter(
+            GroupMember.group_id == group_id,
+            GroupMember.user_id == user_id,
+            GroupMember.last_read_message_id < message_id
+        ).update({'last_read_message_id': message_id}, synchronize_session=False)
+    
+    def can_manage(self):
+        """是否有管理成员的权限"""
+        return self.role in ('owner', 'admin')
+    
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            'group_id': self.group_id,
+            'user_id': self.user_id,
+            'role': self.role,
+            'last_read_message_id': self.last_read_message_id,
+            'joined_at': self.joined_at
+        }
@@ -0,0 +1,53 @@
+from datetime import datetime
+from database import db
+from models.types import CompressedText, preview_column
+
+
+class GroupMessage(db.Model):
+    """群消息模型，每条消息只存一份"""
+    __tablename__ = 'group_messages'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    group_id = db.Column(db.Integer, db.ForeignKey('chat_groups.id'), nullable=False)
+    sender_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    content = db.Column(CompressedText, nullable=False)  # 长文本透明压缩存储
+    message_type = db.Column(db.String(20), default='text')  # text, image, file
+    attachment_id = db.Column(db.Integer, db.ForeignKey('attachments.id'))  # 图片、文件消息引用的附件
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # 群历史、最新消息和未读数都按 (群ID, 消息ID) 走索引
+    __table_args__ = (
+        db.Index('idx_group_messages_group', 'group_id', 'id'),
+        db.Index('idx_group_messages_attachment', 'attachment_id'),
+    )
+    
+    # 列表接口按列查询，跳过 ORM 对象构建
+    serialize_columns = ('id', 'group_id', 'sender_id', 'content', 'message_type', 'attachment_id', 'created_at')
+    
+    @classmethod
+    def list_columns(cls, preview=None):
+        """按列序列化时需要查询的列
+        
+        preview 为内容预览的字符数，传入时内容只从数据库读取开头部分
+        """
+        return [
+            preview_column(cls.content, preview) if name == 'content' and preview else getattr(cls, name)
+            for name in cls.serialize_columns
+        ]
+    
+    @staticmethod
+    def row_to_dict(row):
+        """把查询出的列元组（或模型对象）转换为字典，datetime 由 JSON 序列化器输出"""
+        return {
+            'id': row.id,
+            'group_id': row.group_id,
+            'sender_id': row.sender_id,
+            'content': row.content,
+            'message_type': row.message_type,
+            'attachment_id': row.attachment_id,
+            'created_at': row.created_at
+        }
+    
+    def to_dict(self):
+        """转换为字典"""
+        return GroupMessage.row_to_dict(self)
@@ -1,5 +1,6 @@
 from datetime import datetime
 from database import db
+from models.types import CompressedText, preview_column
 
 
 class Message(db.Model):
@@ -9,23 +10,81 @@ class Message(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     sender_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     receiver_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    content = db.Column(db.Text, nullable=False)
+    content = db.Column(CompressedText, nullable=False)  # 长文本透明压缩存储
     message_type = db.Column(db.String(20), default='text')  # text, image, file
-    is_read = db.Column(db.Boolean, default=False)
+    attachment_id = db.Column(db.Integer, db.ForeignKey('attachments.id'))  # 图片、文件消息引用的附件
+    client_msg_id = db.Column(db.String(64))  # 客户端生成的消息ID，用于重试去重
+    is_read = db.Column(db.Boolean, default=False)  # 已废弃：已读状态由 read_states 水位推导，仅为兼容旧数据保留
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # 关联用户
     sender = db.relationship('User', foreign_keys=[sender_id], backref='sent_messages')
     receiver = db.relationship('User', foreign_keys=[receiver_id], backref='received_messages')
     
-    def to_dict(self):
-        """转换为字典"""
+    # 会话查询、未读数统计按 (发送者, 接收者, ID) 走索引，增量同步按 (接收者, ID) 走索引
+    __table_args__ = (
+        db.Index('idx_messages_conversation', 'sender_id', 'receiver_id', 'id'),
+        db.Index('idx_messages_receiver', 'receiver_id', 'id'),
+        db.Index('idx_messages_attachment', 'attachment_id'),
+        # 同一发送者的客户端消息ID唯一，重试的发送不会重复写入
+        db.Index('idx_messages_client_msg', 'sender_id', 'client_msg_id', unique=True),
+    )
+    
+    # 列表接口按列查询，跳过 ORM 对象构建
+    serialize_columns = ('id', 'sender_id', 'receiver_id', 'content', 'message_type', 'attachment_id', 'client_msg_id', 'created_at')
+    
+    @classmethod
+    def list_columns(cls, preview=None):
+        """按列序列化时需要查询的列
+        
+        preview 为内容预览的字符数，传入时内容只从数据库读取开头部分
+        """
+        return [
+            preview_column(cls.content, preview) if name == 'content' and preview else getattr(cls, name)
+            for name in cls.serialize_columns
+        ]
+    
+    @staticmethod
+    def row_to_dict(row, read_watermark):
+        """把查询出的列元组（或模型对象）转换为字典，datetime 由 JSON 序列化器输出
+        
+        read_watermark 为接收者在该会话中的已读水位
+        """
         return {
-            'id': self.id,
-            'sender_id': self.sender_id,
-            'receiver_id': self.receiver_id,
-            'content': self.content,
-            'message_type': self.message_type,
-            'is_read': self.is_read,
-            'created_at': self.created_at.isoformat() if self.created_at else None
+            'id': row.id,
+            'sender_id': row.sender_id,
+            'receiver_id': row.receiver_id,
+            'content': row.content,
+            'message_type': row.message_type,
+            'attachment_id': row.attachment_id,
+            'client_msg_id': row.client_msg_id,
+            'is_read': row.id is not None and row.id <= read_watermark,
+            'created_at': row.created_at
         }
+    
+    @staticmethod
+    def latest_ids_between(user_a, user_b):
+        """两个用户各自发给对方的最新消息ID，返回 {发送者ID: 消息ID}，没有消息时为 0
+        
+        两个方向各是 (发送者, 接收者, ID) 索引上的一次取最大值，合并为一条语句
+        """
+        def latest(sender_id, receiver_id):
+            return db.session.query(db.func.max(Message.id)).filter(
+                Message.sender_id == sender_id,
+                Message.receiver_id == receiver_id
+            ).scalar_subquery()
+        
+        sent_by_a, sent_by_b = db.session.query(latest(user_a, user_b), latest(user_b, user_a)).one()
+        return {user_a: sent_by_a or 0, user_b: sent_by_b or 0}
+    
+    @staticmethod
+    def get_by_client_id(sender_id, client_msg_id):
+        """按客户端消息ID查找发送者已发出的消息"""
+        return Message.query.filter_by(sender_id=sender_id, client_msg_id=client_msg_id).first()
+    
+    def to_dict(self, read_watermark):
+        """转换为字典
+        
+        read_watermark 为接收者在该会话中的已读水位，由调用方批量查询后传入
+        """
+        return Message.row_to_dict(self, read_watermark)
@@ -0,0 +1,99 @@
+from datetime import datetime
+from database import db
+from sqlalchemy import or_, and_
+from sqlalchemy.exc import IntegrityError
+
+
+class ReadState(db.Model):
+    """已读水位模型
+    
+    记录用户在与某个聊天对象的会话中已读到的最大消息ID，
+    消息是否已读、未读数都由水位推导，标记已读只需更新一行。
+    """
+    __tablename__ = 'read_states'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)  # 阅读者
+    partner_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)  # 聊天对象（消息发送者）
+    last_read_message_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'partner_id', name='unique_read_state'),
+        db.Index('idx_read_states_partner', 'partner_id'),
+        # 增量同步按 (阅读者, 更新时间)、(聊天对象, 更新时间) 走索引
+        db.Index('idx_read_states_user_updated', 'user_id', 'updated_at'),
+        db.Index('idx_read_states_partner_updated', 'partner_id', 'updated_at'),
+    )
+    
+    @staticmethod
+    def get_watermark(user_id, partner_id):
+        """获取用户在某个会话中的已读水位，没有记录时为 0"""
+        last_read_id = db.session.query(ReadState.last_read_message_id).filter_by(
+            user_id=user_id, partner_id=partner_id
+        ).scalar()
+        return last_read_id or 0
+    
+    @staticmethod
+    def watermarks_between(user_id, partner_id):
+        """获取两人互相的已读水位，返回 {阅读者ID: 水位}"""
+        rows = db.session.query(ReadState.user_id, ReadState.last_read_message_id).filter(
+            or_(
+                and_(ReadState.user_id == user_id, ReadState.partner_id == partner_id),
+                and_(ReadState.user_id == partner_id, ReadState.partner_id == user_id)
+            )
+        ).all()
+        watermarks = {user_id: 0, partner_id: 0}
+        watermarks.update(dict(rows))
+        return watermarks
+    
+    @staticmethod
+    def watermarks_for_user(user_id):
+        """用户在各个会话中的已读水位，返回 {聊天对象ID: 水位}"""
+        rows = db.session.query(ReadState.partner_id, ReadState.last_read_message_id).filter(
+            ReadState.user_id == user_id
+        ).all()
+        return dict(rows)
+    
+    @staticmethod
+    def watermarks_for_partner(partner_id):
+        """各个聊天对象对该用户所发消息的已读水位，返回 {阅读者ID: 水位}"""
+        rows = db.session.query(ReadState.user_id, ReadState.last_read_message_id).filter(
+            ReadState.partner_id == partner_id
+        ).all()
+        return dict(rows)
+    
+    @staticmethod
+    def advance(user_id, partner_id, message_id):
+        """把已读水位推进到 message_id（只增不减），不提交事务"""
+        updated = ReadState.query.filter(
+            ReadState.user_id == user_id,
+            ReadState.partner_id == partner_id,
+            ReadState.last_read_message_id < message_id
+        ).update({
+            'last_read_message_id': message_id,
+            'updated_at': datetime.utcnow()
+        }, synchronize_session=False)
+        
+        if updated or ReadState.query.filter_by(user_id=user_id, partner_id=partner_id).first():
+            return
+        
+        try:
+            with db.session.begin_nested():
+                db.session.add(ReadState(
+                    user_id=user_id,
+                    partner_id=partner_id,
+                    last_read_message_id=message_id
+                ))
+        except IntegrityError:
+            # 并发插入时已有记录，退回到更新
+            ReadState.advance(user_id, partner_id, message_id)
+    
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            'user_id': self.user_id,
+            'partner_id': self.partner_id,
+            'last_read_message_id': self.last_read_message_id,
+            'updated_at': self.updated_at
+        }
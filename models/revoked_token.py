@@ -0,0 +1,21 @@
+from datetime import datetime
+from database import db
+
+
+class RevokedToken(db.Model):
+    """已吊销的令牌
+    
+    token_key 为单个令牌的 jti，或 user:<用户ID>（吊销该用户的全部令牌，如修改密码后）。
+    签发时间（微秒，见 services.token_blocklist.ISSUED_AT_CLAIM）不晚于 revoked_before 的令牌视为已吊销。
+    """
+    __tablename__ = 'revoked_tokens'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    token_key = db.Column(db.String(64), nullable=False, index=True)
+    revoked_before = db.Column(db.BigInteger, nullable=False)  # Unix 时间戳（微秒）
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)  # 之后相关令牌都已过期，记录可以清理
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    @staticmethod
+    def user_key(user_id):
+        return f'user:{user_id}'
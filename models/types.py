@@ -0,0 +1,76 @@
+import base64
+import zlib
+from flask import current_app, has_app_context
+from sqlalchemy import case, func, type_coerce
+from sqlalchemy.types import Text, TypeDecorator
+
+# 压缩内容的格式标记，没有标记的旧数据按原文读取；
+# 不含字母，避免在大小写不敏感的排序规则下误匹配
+COMPRESSED_PREFIX = '\x1b#1:'
+
+
+class CompressedText(TypeDecorator):
+    """透明压缩的长文本列
+    
+    超过 MESSAGE_COMPRESS_MIN_SIZE 字节且压缩后更短的内容以
+    标记 + base64(zlib) 的形式保存，读取时自动解压。
+    """
+    
+    impl = Text
+    cache_ok = True
+    
+    @staticmethod
+    def min_size():
+        if has_app_context():
+            return current_app.config.get('MESSAGE_COMPRESS_MIN_SIZE', 1024)
+        return 1024
+    
+    @staticmethod
+    def compress(value):
+        """按需压缩，返回要保存的文本"""
+        raw = value.encode('utf-8')
+        # 原文恰好以标记开头时必须压缩，否则读取时会被误当成压缩内容
+        forced = value.startswith(COMPRESSED_PREFIX)
+        if len(raw) < CompressedText.min_size() and not forced:
+            return value
+        encoded = COMPRESSED_PREFIX + base64.b64encode(zlib.compress(raw, 6)).decode('ascii')
+        if forced or len(encoded) < len(raw):
+            return encoded
+        return value
+    
+    @staticmethod
+    def decompress(value):
+        if not value.startswith(COMPRESSED_PREFIX):
+            return value
+        return zlib.decompress(base64.b64decode(value[len(COMPRESSED_PREFIX):])).decode('utf-8')
+    
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return self.compress(value)
+    
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return self.decompress(value)
+
+
+def preview_column(column, length):
+    """只读取内容开头的列表达式
+    
+    未压缩的内容在数据库里截取前 length + 1 个字符（多取一个用于判断是否截断），
+    压缩内容无法截取，整段读出后解压。
+    """
+    raw = type_coerce(column, Text)
+    is_compressed = func.substr(raw, 1, len(COMPRESSED_PREFIX)) == COMPRESSED_PREFIX
+    return type_coerce(
+        case((is_compressed, raw), else_=func.substr(raw, 1, length + 1)),
+        CompressedText
+    ).label(column.key)
+
+
+def truncate_preview(text, length):
+    """截取预览，返回 (预览文本, 是否被截断)"""
+    if text is None or len(text) <= length:
+        return text, False
+    return text[:length], True
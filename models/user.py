@@ -1,4 +1,6 @@
+import hashlib
 from datetime import datetime
+from sqlalchemy.orm import validates
 from database import db
 import bcrypt
 
@@ -14,22 +16,62 @@ class User(db.Model):
     avatar = db.Column(db.String(255), default='')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_seen = db.Column(db.DateTime, default=datetime.utcnow)
+    # 通讯录匹配用的哈希，由 username / email 赋值时自动计算，见 contact_hash
+    username_hash = db.Column(db.String(64), index=True)
+    email_hash = db.Column(db.String(64), index=True)
+    
+    @staticmethod
+    def contact_hash(value):
+        """通讯录匹配使用的哈希：去掉首尾空白并转小写后的 SHA-256 十六进制"""
+        return hashlib.sha256(value.strip().lower().encode('utf-8')).hexdigest()
+    
+    @validates('username', 'email')
+    def _update_contact_hash(self, key, value):
+        setattr(self, f'{key}_hash', User.contact_hash(value) if value else None)
+        return value
+    
+    @staticmethod
+    def hash_password(password):
+        """计算密码哈希（批量导入时在进程池中调用）"""
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
     
     def set_password(self, password):
         """设置密码哈希"""
-        self.password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        self.password_hash = User.hash_password(password)
     
     def check_password(self, password):
         """验证密码"""
         return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
     
-    def to_dict(self):
-        """转换为字典"""
+    # 列表接口按列查询，跳过 ORM 对象构建
+    serialize_columns = ('id', 'username', 'email', 'avatar', 'created_at', 'last_seen')
+    
+    @classmethod
+    def list_columns(cls):
+        """按列序列化时需要查询的列"""
+        return [getattr(cls, name) for name in cls.serialize_columns]
+    
+    @staticmethod
+    def row_to_dict(row):
+        """把查询出的列元组（或模型对象）转换为字典，datetime 由 JSON 序列化器输出"""
         return {
-            'id': self.id,
-            'username': self.username,
-            'email': self.email,
-            'avatar': self.avatar,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'last_seen': self.last_seen.isoformat() if self.last_seen else None
+            'id': row.id,
+            'username': row.username,
+            'email': row.email,
+            'avatar': row.avatar,
+            'created_at': row.created_at,
+            'last_seen': row.last_seen
         }
+    
+    @staticmethod
+    def row_to_public_dict(row):
+        """对其他用户公开的精简资料（不含邮箱等）"""
+        return {
+            'id': row.id,
+            'username': row.username,
+            'avatar': row.avatar
+        }
+    
+    def to_dict(self):
+        """转换为字典"""
+        return User.row_to_dict(self)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量导入用户
+
+用法:
+    python provision_users.py users.csv [--workers 8] [--errors errors.csv]
+
+文件为 CSV（表头包含 username,email,password）或 JSON Lines（每行一个对象）。
+密码哈希在进程池中并行计算，用户按批写入；失败的行及原因输出到 --errors 指定的 CSV 文件。
+"""
+
+import argparse
+import csv
+import sys
+import time
+from app import app, create_tables
+from services.provisioning import provisioner, read_users
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量导入用户")
+    parser.add_argument("file", help="用户文件（CSV 或 JSON Lines）")
+    parser.add_argument("--workers", type=int, default=None, help="计算密码哈希的进程数，默认为 CPU 核数")
+    parser.add_argument("--errors", default=None, help="失败行的输出文件（CSV）")
+    args = parser.parse_args()
+    
+    with open(args.file, "rb") as f:
+        try:
+            users = read_users(f.read(), args.file)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return 1
+    
+    create_tables()
+    started = time.monotonic()
+    
+    def progress(done, created, failed):
+        elapsed = time.monotonic() - started
+        print(f"  {done}/{len(users)}  已创建 {created}  失败 {failed}  ({elapsed:.0f} 秒)")
+    
+    print(f"📥 开始导入 {len(users)} 个用户...")
+    with app.app_context():
+        result = provisioner.provision(users, workers=args.workers, progress=progress)
+    
+    print(f"✅ 导入完成: 创建 {result['created']} 个，失败 {result['failed']} 个，"
+          f"耗时 {time.monotonic() - started:.1f} 秒")
+    
+    if result["errors"]:
+        if args.errors:
+            with open(args.errors, "w", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=["row", "username", "error"])
+                writer.writeheader()
+                writer.writerows(result["errors"])
+            print(f"⚠️  失败的行已写入 {args.errors}")
+        else:
+            for error in result["errors"][:20]:
+                print(f"  第{error['row']}行 {error['username']}: {error['error']}")
+            if len(result["errors"]) > 20:
+                print(f"  ... 共 {len(result['errors'])} 行失败，使用 --errors 输出全部")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+import hmac
+from functools import wraps
+from flask import Blueprint, request, jsonify, current_app
+from services.provisioning import provisioner, read_users
+
+admin_bp = Blueprint('admin', __name__)
+
+
+def admin_required(view):
+    """管理接口使用 X-Admin-Token 请求头认证，未配置 ADMIN_TOKEN 时接口不可用"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = current_app.config.get('ADMIN_TOKEN')
+        provided = request.headers.get('X-Admin-Token', '')
+        if not token or not hmac.compare_digest(provided.encode('utf-8'), token.encode('utf-8')):
+            return jsonify({'error': '无权访问'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@admin_bp.route('/users/import', methods=['POST'])
+@admin_required
+def import_users():
+    """批量导入少量用户：上传 CSV / JSON Lines 文件（file 字段），或 JSON 请求体 {"users": [...]}"""
+    try:
+        upload = request.files.get('file')
+        if upload:
+            try:
+                users = read_users(upload.read(), upload.filename or '')
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+        else:
+            data = request.get_json(silent=True)
+            users = data.get('users') if isinstance(data, dict) else None
+            if not isinstance(users, list):
+                return jsonify({'error': '请上传用户文件或提供 users 列表'}), 400
+        
+        if not users:
+            return jsonify({'error': '用户列表不能为空'}), 400
+        
+        # 请求在同步 worker 中执行，受 worker 超时限制；大批量导入使用 provision_users.py
+        max_rows = current_app.config['ADMIN_IMPORT_MAX_ROWS']
+        if len(users) > max_rows:
+            return jsonify({
+                'error': f'一次最多导入{max_rows}个用户，更多用户请在服务器上使用 provision_users.py 导入'
+            }), 413
+        
+        # 不在多线程的 worker 进程中 fork 进程池，哈希在当前线程中计算
+        result = provisioner.provision(users, workers=1)
+        
+        return jsonify({
+            'message': '导入完成',
+            'total': len(users),
+            **result
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'导入用户失败: {str(e)}'}), 500
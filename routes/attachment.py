@@ -0,0 +1,163 @@
+import mimetypes
+import os
+from flask import Blueprint, request, jsonify, send_file, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from models.attachment import Attachment
+from database import db
+from services.blob_store import blob_store, BlobTooLargeError
+
+attachment_bp = Blueprint('attachment', __name__)
+
+# 允许的缩略图边长，避免任意尺寸撑满缓存目录
+THUMBNAIL_SIZES = (128, 256, 512)
+
+
+def _no_sniff(response):
+    """附件与 API 同源：禁止浏览器猜测类型，并禁止内容中的脚本执行"""
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    response.headers['Content-Security-Policy'] = "default-src 'none'; sandbox"
+    return response
+
+
+def _get_visible_attachment(attachment_id, user_id):
+    """查找当前用户可以访问的附件，不可见时返回 None"""
+    attachment = Attachment.query.get(attachment_id)
+    if not attachment or not attachment.is_visible_to(user_id):
+        return None
+    return attachment
+
+
+@attachment_bp.route('/upload', methods=['POST'])
+@jwt_required()
+def upload_attachment():
+    """上传附件（multipart 的 file 字段，或直接以请求体上传）"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        
+        if request.content_length and request.content_length > blob_store.max_size:
+            return jsonify({'error': '文件大小超过上限'}), 413
+        
+        upload = request.files.get('file')
+        if upload is not None:
+            stream = upload.stream
+            filename = upload.filename or ''
+            mime_type = upload.mimetype
+        else:
+            # 请求体即文件内容，文件名通过参数传递，边读边写不经过表单解析
+            stream = request.stream
+            filename = request.args.get('filename', '')
+            mime_type = request.mimetype
+        
+        filename = os.path.basename(filename.replace('\\', '/'))[:255]
+        if not mime_type or mime_type == 'application/octet-stream':
+            mime_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        
+        try:
+            digest, size = blob_store.save(stream)
+        except BlobTooLargeError as e:
+            return jsonify({'error': str(e)}), 413
+        
+        if size == 0:
+            return jsonify({'error': '文件内容不能为空'}), 400
+        
+        # 客户端声明的类型不可信：只有文件头确实是常见位图格式的才作为图片
+        image_type = blob_store.sniff_image_type(digest)
+        if image_type:
+            mime_type = image_type
+        elif mime_type in Attachment.INLINE_IMAGE_TYPES:
+            mime_type = 'application/octet-stream'
+        
+        attachment = Attachment(
+            uploader_id=current_user_id,
+            sha256=digest,
+            size=size,
+            mime_type=mime_type[:100],
+            filename=filename
+        )
+        db.session.add(attachment)
+        db.session.commit()
+        
+        return jsonify({
+            'message': '上传成功',
+            'attachment': attachment.to_dict()
+        }), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'上传附件失败: {str(e)}'}), 500
+
+
+@attachment_bp.route('/<int:attachment_id>', methods=['GET'])
+@jwt_required()
+def download_attachment(attachment_id):
+    """下载附件，支持 Range 断点续传和条件请求"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        attachment = _get_visible_attachment(attachment_id, current_user_id)
+        if not attachment:
+            return jsonify({'error': '附件不存在'}), 404
+        
+        # 按路径发送：由 WSGI 服务器的 file_wrapper（sendfile）或 X-Sendfile 直接发送文件
+        # 只有识别过的位图在浏览器中直接显示，其他类型一律作为下载
+        return _no_sniff(send_file(
+            blob_store.path(attachment.sha256),
+            mimetype=attachment.mime_type,
+            as_attachment=not attachment.is_image(),
+            download_name=attachment.filename or attachment.sha256,
+            conditional=True,
+            etag=attachment.sha256,
+            max_age=current_app.config['ATTACHMENT_CACHE_MAX_AGE']
+        ))
+        
+    except Exception as e:
+        return jsonify({'error': f'下载附件失败: {str(e)}'}), 500
+
+
+@attachment_bp.route('/<int:attachment_id>/thumbnail', methods=['GET'])
+@jwt_required()
+def get_thumbnail(attachment_id):
+    """获取图片附件的缩略图，首次访问时生成"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        size = request.args.get('size', 256, type=int)
+        
+        if size not in THUMBNAIL_SIZES:
+            return jsonify({'error': f'缩略图尺寸只能是 {", ".join(map(str, THUMBNAIL_SIZES))}'}), 400
+        
+        attachment = _get_visible_attachment(attachment_id, current_user_id)
+        if not attachment:
+            return jsonify({'error': '附件不存在'}), 404
+        
+        if not attachment.is_image():
+            return jsonify({'error': '只有图片附件有缩略图'}), 400
+        
+        thumb_path = blob_store.thumbnail(attachment.sha256, size)
+        if not thumb_path:
+            return jsonify({'error': '无法生成缩略图'}), 404
+        
+        return _no_sniff(send_file(
+            thumb_path,
+            mimetype='image/jpeg',
+            conditional=True,
+            etag=f'{attachment.sha256}-{size}',
+            max_age=current_app.config['ATTACHMENT_CACHE_MAX_AGE']
+        ))
+        
+    except Exception as e:
+        return jsonify({'error': f'获取缩略图失败: {str(e)}'}), 500
+
+
+@attachment_bp.route('/<int:attachment_id>/info', methods=['GET'])
+@jwt_required()
+def get_attachment_info(attachment_id):
+    """获取附件信息"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        attachment = _get_visible_attachment(attachment_id, current_user_id)
+        if not attachment:
+            return jsonify({'error': '附件不存在'}), 404
+        
+        return jsonify({'attachment': attachment.to_dict()}), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'获取附件信息失败: {str(e)}'}), 500
@@ -1,12 +1,43 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import (
+    create_access_token, create_refresh_token, decode_token,
+    jwt_required, get_jwt, get_jwt_identity, current_user
+)
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
 from models.user import User
+from models.friendship import Friendship
+from models.friendship_change import FriendshipChange
 from database import db
-from datetime import datetime, timedelta
+from services.last_seen import last_seen_buffer
+from services.user_cache import user_cache
+from services.token_blocklist import token_blocklist
+from services.registration_filter import registration_filter
 
 auth_bp = Blueprint('auth', __name__)
 
 
+def _issue_tokens(user_id):
+    """签发访问令牌和刷新令牌"""
+    return {
+        'access_token': create_access_token(identity=str(user_id)),
+        'refresh_token': create_refresh_token(identity=str(user_id)),
+        'expires_in': int(current_app.config['JWT_ACCESS_TOKEN_EXPIRES'].total_seconds())
+    }
+
+
+def _registration_conflict(username, email):
+    """用一次查询检查用户名和邮箱是否已被占用，返回错误信息或 None"""
+    rows = db.session.query(User.username, User.email).filter(
+        or_(User.username == username, User.email == email)
+    ).limit(2).all()
+    if any(row.username.lower() == username.lower() for row in rows):
+        return '用户名已存在'
+    if rows:
+        return '邮箱已存在'
+    return None
+
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     """用户注册"""
@@ -21,30 +52,30 @@ def register():
         email = data['email'].strip()
         password = data['password']
         
-        # 检查用户名是否已存在
-        if User.query.filter_by(username=username).first():
-            return jsonify({'error': '用户名已存在'}), 400
-        
-        # 检查邮箱是否已存在
-        if User.query.filter_by(email=email).first():
-            return jsonify({'error': '邮箱已存在'}), 400
+        # 检查用户名和邮箱是否已存在：布隆过滤器判断一定未被占用时不查数据库
+        if registration_filter.might_exist(username, email):
+            error = _registration_conflict(username, email)
+            if error:
+                return jsonify({'error': error}), 400
         
         # 创建新用户
         user = User(username=username, email=email)
         user.set_password(password)
         
         db.session.add(user)
-        db.session.commit()
-        
-        # 生成访问令牌
-        access_token = create_access_token(
-            identity=str(user.id), 
-            expires_delta=timedelta(days=7)
-        )
-        
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # 其他进程刚注册了相同的用户名或邮箱，由唯一约束兜底
+            db.session.rollback()
+            registration_filter.add(username, email)
+            return jsonify({'error': _registration_conflict(username, email) or '用户名或邮箱已存在'}), 400
+        registration_filter.add(username, email)
+        
+        # 生成访问令牌和刷新令牌
         return jsonify({
             'message': '注册成功',
-            'access_token': access_token,
+            **_issue_tokens(user.id),
             'user': user.to_dict()
         }), 201
         
@@ -73,20 +104,15 @@ def login():
         if not user or not user.check_password(password):
             return jsonify({'error': '用户名或密码错误'}), 401
         
-        # 更新最后登录时间
-        user.last_seen = datetime.utcnow()
-        db.session.commit()
-        
-        # 生成访问令牌
-        access_token = create_access_token(
-            identity=str(user.id),
-            expires_delta=timedelta(days=7)
-        )
+        # 更新最后登录时间（写入内存缓冲，由后台批量落库）
+        user_info = user.to_dict()
+        user_info['last_seen'] = last_seen_buffer.touch(user.id)
         
+        # 生成访问令牌和刷新令牌
         return jsonify({
             'message': '登录成功',
-            'access_token': access_token,
-            'user': user.to_dict()
+            **_issue_tokens(user.id),
+            'user': user_info
         }), 200
         
     except Exception as e:
@@ -118,9 +144,13 @@ def change_password():
         
         # 设置新密码
         user.set_password(new_password)
+        # 吊销此前签发的全部令牌，当前设备使用新签发的令牌
+        token_blocklist.revoke_user(current_user_id)
+        token_blocklist.revoke_token(get_jwt())
         db.session.commit()
+        user_cache.invalidate(current_user_id)
         
-        return jsonify({'message': '密码修改成功'}), 200
+        return jsonify({'message': '密码修改成功', **_issue_tokens(current_user_id)}), 200
         
     except Exception as e:
         db.session.rollback()
@@ -131,14 +161,86 @@ def change_password():
 @jwt_required()
 def get_profile():
     """获取用户信息"""
+    try:
+        # 当前用户由 user_cache 解析，通常不需要查询数据库
+        user = current_user.to_dict()
+        user['last_seen'] = last_seen_buffer.get_last_seen([current_user.id])[current_user.id]
+        
+        return jsonify({'user': user}), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'获取用户信息失败: {str(e)}'}), 500
+
+
+@auth_bp.route('/profile', methods=['PUT'])
+@jwt_required()
+def update_profile():
+    """修改用户资料（目前只有头像），好友在下次增量同步好友列表时收到 changed"""
     try:
         current_user_id = int(get_jwt_identity())
-        user = User.query.get(current_user_id)
+        data = request.get_json()
+        
+        if not data or 'avatar' not in data or not isinstance(data['avatar'], str):
+            return jsonify({'error': '头像地址是必需的'}), 400
         
+        avatar = data['avatar'].strip()
+        if len(avatar) > 255:
+            return jsonify({'error': '头像地址过长'}), 400
+        
+        user = User.query.get(current_user_id)
         if not user:
             return jsonify({'error': '用户不存在'}), 404
         
-        return jsonify({'user': user.to_dict()}), 200
+        if user.avatar != avatar:
+            user.avatar = avatar
+            FriendshipChange.record_profile_change(current_user_id, Friendship.friend_ids(current_user_id))
+            db.session.commit()
+            user_cache.invalidate(current_user_id)
+        
+        return jsonify({'message': '资料修改成功', 'user': user.to_dict()}), 200
         
     except Exception as e:
-        return jsonify({'error': f'获取用户信息失败: {str(e)}'}), 500
+        db.session.rollback()
+        return jsonify({'error': f'资料修改失败: {str(e)}'}), 500
+
+
+@auth_bp.route('/refresh', methods=['POST'])
+@jwt_required(refresh=True)
+def refresh():
+    """用刷新令牌换取新的访问令牌"""
+    try:
+        access_token = create_access_token(identity=get_jwt_identity())
+        
+        return jsonify({
+            'access_token': access_token,
+            'expires_in': int(current_app.config['JWT_ACCESS_TOKEN_EXPIRES'].total_seconds())
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'刷新令牌失败: {str(e)}'}), 500
+
+
+@auth_bp.route('/logout', methods=['POST'])
+@jwt_required(verify_type=False)
+def logout():
+    """退出登录：吊销当前令牌，请求体中可附带刷新令牌一并吊销"""
+    try:
+        current_user_id = get_jwt_identity()
+        token_blocklist.revoke_token(get_jwt())
+        
+        data = request.get_json(silent=True) or {}
+        if data.get('refresh_token'):
+            try:
+                refresh_data = decode_token(data['refresh_token'], allow_expired=True)
+            except Exception:
+                return jsonify({'error': '刷新令牌无效'}), 400
+            if refresh_data['sub'] == current_user_id:
+                token_blocklist.revoke_token(refresh_data)
+        
+        db.session.commit()
+        
+        return jsonify({'message': '已退出登录'}), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'退出登录失败: {str(e)}'}), 500
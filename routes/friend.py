@@ -1,17 +1,32 @@
+from datetime import datetime
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required, get_jwt_identity, current_user
 from models.user import User
 from models.friendship import Friendship
+from models.friendship_change import FriendshipChange
+from models.friend_suggestion import FriendSuggestion
+from sqlalchemy.exc import IntegrityError
 from database import db
-from sqlalchemy import or_, and_
+from services.cursor import encode_cursor, decode_cursor, settled_cursor
+from services.block_list import block_list
+from services.friend_requests import pending_requests
+from services.last_seen import last_seen_buffer
+from services.presence import presence
+from services.streaming import stream_json_list
+from services.user_cache import user_cache
+from services.single_flight import single_flight
 
 friend_bp = Blueprint('friend', __name__)
 
+# 单次增量同步最多返回的变更记录数
+FRIEND_CHANGES_LIMIT = 1000
+
 
 @friend_bp.route('/add', methods=['POST'])
+@friend_bp.route('/request', methods=['POST'])
 @jwt_required()
 def add_friend():
-    """添加好友"""
+    """发送好友请求，对方已向自己发出请求时直接成为好友"""
     try:
         current_user_id = int(get_jwt_identity())
         data = request.get_json()
@@ -22,7 +37,6 @@ def add_friend():
         friend_username = data['friend_username'].strip()
         
         # 不能添加自己为好友
-        current_user = User.query.get(current_user_id)
         if current_user.username == friend_username:
             return jsonify({'error': '不能添加自己为好友'}), 400
         
@@ -31,68 +45,344 @@ def add_friend():
         if not friend:
             return jsonify({'error': '用户不存在'}), 404
         
-        # 检查是否已经是好友或已发送好友请求
-        existing_friendship = Friendship.query.filter(
-            or_(
-                and_(Friendship.user_id == current_user_id, Friendship.friend_id == friend.id),
-                and_(Friendship.user_id == friend.id, Friendship.friend_id == current_user_id)
-            )
-        ).first()
+        # 屏蔽关系只查缓存
+        if friend.id in block_list.blocked(current_user_id):
+            return jsonify({'error': '请先解除对该用户的屏蔽'}), 400
+        if friend.id in block_list.blocked_by(current_user_id):
+            return jsonify({'error': '无法添加该用户为好友'}), 403
+        
+        # 检查是否已经是好友或已发送好友请求（每对用户只有一行）
+        friendship = Friendship.get(current_user_id, friend.id)
         
-        if existing_friendship:
-            if existing_friendship.status == 'accepted':
+        if friendship:
+            my_status = friendship.status_of(current_user_id)
+            their_status = friendship.status_of(friend.id)
+            if friendship.accepted:
                 return jsonify({'error': '已经是好友了'}), 400
-            elif existing_friendship.status == 'pending':
+            elif my_status == Friendship.ACCEPTED and their_status == Friendship.PENDING:
                 return jsonify({'error': '好友请求已发送，请等待对方同意'}), 400
+            elif my_status == Friendship.PENDING and their_status == Friendship.ACCEPTED:
+                # 对方已向自己发出请求，视为同意
+                _accept(friendship, current_user_id, friend.id)
+                return jsonify({
+                    'message': '好友添加成功',
+                    'friend': friend.to_dict()
+                }), 200
+            return jsonify({'error': '无法添加该用户为好友'}), 403
         
-        # 创建好友关系（双向）
-        # 当前用户 -> 好友
-        friendship1 = Friendship(user_id=current_user_id, friend_id=friend.id, status='accepted')
-        # 好友 -> 当前用户
-        friendship2 = Friendship(user_id=friend.id, friend_id=current_user_id, status='accepted')
-        
-        db.session.add(friendship1)
-        db.session.add(friendship2)
+        low, high = Friendship.canonical(current_user_id, friend.id)
+        friendship = Friendship(user_id=low, friend_id=high)
+        friendship.set_status(current_user_id, Friendship.ACCEPTED)
+        friendship.set_status(friend.id, Friendship.PENDING)
+        db.session.add(friendship)
         db.session.commit()
+        pending_requests.invalidate(friend.id)
         
         return jsonify({
-            'message': '好友添加成功',
-            'friend': friend.to_dict()
+            'message': '好友请求已发送',
+            'user': friend.to_dict()
         }), 200
         
+    except IntegrityError:
+        # 双方同时发出请求时唯一约束冲突，让客户端重试
+        db.session.rollback()
+        return jsonify({'error': '好友关系已变化，请重试'}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'添加好友失败: {str(e)}'}), 500
 
 
+def _accept(friendship, user_id, requester_id):
+    """user_id 同意 requester_id 的好友请求并提交"""
+    friendship.set_status(user_id, Friendship.ACCEPTED)
+    friendship.created_at = datetime.utcnow()
+    FriendshipChange.record(user_id, requester_id, FriendshipChange.ADDED)
+    FriendshipChange.record(requester_id, user_id, FriendshipChange.ADDED)
+    db.session.commit()
+    pending_requests.invalidate(user_id)
+
+
+def _get_incoming_request(user_id, data):
+    """按请求体中的 user_id 查找发给当前用户的待处理请求，返回 (请求者ID, 关系行)，ID格式错误时抛出 ValueError"""
+    if not data or not data.get('user_id'):
+        return None, None
+    requester_id = int(data['user_id'])
+    friendship = Friendship.get(user_id, requester_id)
+    if (
+        friendship is None
+        or friendship.status_of(user_id) != Friendship.PENDING
+        or friendship.status_of(requester_id) != Friendship.ACCEPTED
+    ):
+        return requester_id, None
+    return requester_id, friendship
+
+
+@friend_bp.route('/accept', methods=['POST'])
+@jwt_required()
+def accept_request():
+    """同意好友请求"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        data = request.get_json()
+        
+        try:
+            requester_id, friendship = _get_incoming_request(current_user_id, data)
+        except (TypeError, ValueError):
+            return jsonify({'error': '用户ID格式错误'}), 400
+        if requester_id is None:
+            return jsonify({'error': '用户ID是必需的'}), 400
+        if friendship is None:
+            return jsonify({'error': '好友请求不存在'}), 404
+        
+        _accept(friendship, current_user_id, requester_id)
+        
+        requester = User.query.get(requester_id)
+        return jsonify({
+            'message': '好友添加成功',
+            'friend': requester.to_dict()
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'同意好友请求失败: {str(e)}'}), 500
+
+
+@friend_bp.route('/decline', methods=['POST'])
+@jwt_required()
+def decline_request():
+    """拒绝好友请求，对方之后可以重新发送"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        data = request.get_json()
+        
+        try:
+            requester_id, friendship = _get_incoming_request(current_user_id, data)
+        except (TypeError, ValueError):
+            return jsonify({'error': '用户ID格式错误'}), 400
+        if requester_id is None:
+            return jsonify({'error': '用户ID是必需的'}), 400
+        if friendship is None:
+            return jsonify({'error': '好友请求不存在'}), 404
+        
+        db.session.delete(friendship)
+        db.session.commit()
+        pending_requests.invalidate(current_user_id)
+        
+        return jsonify({'message': '已拒绝好友请求'}), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'拒绝好友请求失败: {str(e)}'}), 500
+
+
+@friend_bp.route('/requests/<direction>', methods=['GET'])
+@jwt_required()
+def get_requests(direction):
+    """收到（incoming）或发出（outgoing）的待处理好友请求，按时间倒序游标分页"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        if direction not in ('incoming', 'outgoing'):
+            return jsonify({'error': '不支持的请求类型'}), 404
+        
+        limit = max(1, min(request.args.get('limit', 50, type=int), 500))
+        before = None
+        cursor = request.args.get('cursor')
+        if cursor:
+            try:
+                created_at, row_id = decode_cursor(cursor, 2)
+                before = (datetime.fromisoformat(created_at), int(row_id))
+            except (TypeError, ValueError):
+                return jsonify({'error': '游标格式错误'}), 400
+        
+        requests = Friendship.requests_subquery(
+            current_user_id, incoming=direction == 'incoming', before=before, limit=limit + 1
+        )
+        rows = db.session.query(
+            *User.list_columns(),
+            requests.c.created_at.label('requested_at'),
+            requests.c.id.label('request_id')
+        ).join(
+            requests, User.id == requests.c.other_id
+        ).order_by(
+            requests.c.created_at.desc(), requests.c.id.desc()
+        ).limit(limit + 1).all()
+        
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        result = {
+            'requests': [_serialize_request(row) for row in rows],
+            'next_cursor': encode_cursor(rows[-1].requested_at.isoformat(), rows[-1].request_id) if has_more else None
+        }
+        if direction == 'incoming':
+            result['pending_count'] = pending_requests.get(current_user_id)
+        
+        return jsonify(result), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'获取好友请求失败: {str(e)}'}), 500
+
+
+def _serialize_request(row):
+    return {
+        'user': User.row_to_dict(row),
+        'requested_at': row.requested_at
+    }
+
+
+@friend_bp.route('/requests/count', methods=['GET'])
+@jwt_required()
+def get_request_count():
+    """收到的待处理好友请求数（缓存）"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        return jsonify({'pending_count': pending_requests.get(current_user_id)}), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'获取好友请求数失败: {str(e)}'}), 500
+
+
 @friend_bp.route('/list', methods=['GET'])
 @jwt_required()
+@single_flight.coalesce
 def get_friends():
-    """获取好友列表"""
+    """获取好友列表
+    
+    - 默认返回全部好友；传 limit 时按用户名游标分页，用 next_cursor 获取下一页
+    - stream=1 时流式返回全部好友
+    - since=<version> 时只返回该版本之后新增、变化和删除的好友
+    """
+    try:
+        current_user_id = int(get_jwt_identity())
+        since = request.args.get('since', type=int)
+        limit = request.args.get('limit', type=int)
+        cursor = request.args.get('cursor')
+        
+        if since is not None:
+            return jsonify(_get_friend_changes(current_user_id, since)), 200
+        
+        # 先取版本号再查列表：期间发生的变更会在下次增量同步时再次下发，客户端按ID覆盖即可
+        version = FriendshipChange.current_version(current_user_id)
+        
+        # 查询已接受的好友关系（按列查询，不构建 ORM 对象）
+        query = _friends_query(current_user_id).order_by(User.username)
+        
+        if cursor:
+            try:
+                last_username, = decode_cursor(cursor, 1)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            query = query.filter(User.username > last_username)
+        
+        # 流式模式：通过服务端游标逐批读取并输出
+        if request.args.get('stream', 0, type=int):
+            rows = query.execution_options(stream_results=True).yield_per(500)
+            return stream_json_list('friends', rows, _serialize_friend, extra={'version': version})
+        
+        result = {'version': version}
+        if limit:
+            limit = max(1, min(limit, 500))
+            rows = query.limit(limit + 1).all()
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            result['next_cursor'] = encode_cursor(rows[-1].username) if has_more else None
+        else:
+            rows = query.all()
+        
+        friends = [_serialize_friend(row) for row in rows]
+        result['friends'] = friends
+        result['count'] = len(friends)
+        
+        return jsonify(result), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'获取好友列表失败: {str(e)}'}), 500
+
+
+def _friends_query(user_id):
+    """用户已接受好友的按列查询"""
+    friends = Friendship.friends_subquery(user_id)
+    return db.session.query(
+        *User.list_columns(),
+        friends.c.created_at.label('friendship_created')
+    ).join(
+        friends, User.id == friends.c.friend_id
+    )
+
+
+def _serialize_friend(row):
+    friend_info = User.row_to_dict(row)
+    friend_info['friendship_created'] = row.friendship_created
+    return friend_info
+
+
+def _get_friend_changes(user_id, since):
+    """好友列表在 since 版本之后的变更，同一好友的多次变更只保留最后一次"""
+    changes = db.session.query(
+        FriendshipChange.id, FriendshipChange.friend_id, FriendshipChange.action, FriendshipChange.created_at
+    ).filter(
+        FriendshipChange.user_id == user_id,
+        FriendshipChange.id > since
+    ).order_by(FriendshipChange.id).limit(FRIEND_CHANGES_LIMIT + 1).all()
+    
+    has_more = len(changes) > FRIEND_CHANGES_LIMIT
+    changes = changes[:FRIEND_CHANGES_LIMIT]
+    
+    latest = {}
+    for change in changes:
+        latest[change.friend_id] = change.action
+    
+    # 新增和变化的好友需要返回资料；已不再是好友的按删除处理
+    upsert_ids = [friend_id for friend_id, action in latest.items() if action != FriendshipChange.REMOVED]
+    profiles = {}
+    if upsert_ids:
+        profiles = {
+            row.id: row
+            for row in _friends_query(user_id).filter(User.id.in_(upsert_ids))
+        }
+    
+    added, changed, removed = [], [], []
+    for friend_id, action in latest.items():
+        if friend_id not in profiles:
+            removed.append(friend_id)
+        elif action == FriendshipChange.ADDED:
+            added.append(_serialize_friend(profiles[friend_id]))
+        else:
+            changed.append(_serialize_friend(profiles[friend_id]))
+    
+    return {
+        'added': added,
+        'changed': changed,
+        'removed': removed,
+        # 版本号只推进到稳定窗口之前，晚提交的变更下次会一起下发
+        'version': settled_cursor(changes, since),
+        'has_more': has_more
+    }
+
+
+@friend_bp.route('/online', methods=['GET'])
+@jwt_required()
+def get_online_friends():
+    """获取在线好友（与 /api/presence/status 一样以心跳为准）"""
     try:
         current_user_id = int(get_jwt_identity())
         
-        # 查询所有已接受的好友关系
-        friendships = db.session.query(Friendship, User).join(
-            User, User.id == Friendship.friend_id
-        ).filter(
-            Friendship.user_id == current_user_id,
-            Friendship.status == 'accepted'
-        ).order_by(User.username).all()
+        friend_ids = list(Friendship.friend_ids(current_user_id))
+        statuses = presence.get_status(friend_ids)
+        online_ids = [friend_id for friend_id, status in statuses.items() if status == presence.ONLINE]
         
-        friends = []
-        for friendship, friend in friendships:
-            friend_info = friend.to_dict()
-            friend_info['friendship_created'] = friendship.created_at.isoformat() if friendship.created_at else None
-            friends.append(friend_info)
+        # 最后活跃时间优先读内存缓冲
+        last_seen = last_seen_buffer.get_last_seen(online_ids)
+        online = [{'id': friend_id, 'last_seen': last_seen[friend_id]} for friend_id in online_ids]
+        online.sort(key=lambda x: x['last_seen'] or datetime.min, reverse=True)
         
         return jsonify({
-            'friends': friends,
-            'count': len(friends)
+            'online': online,
+            'count': len(online)
         }), 200
         
     except Exception as e:
-        return jsonify({'error': f'获取好友列表失败: {str(e)}'}), 500
+        return jsonify({'error': f'获取在线好友失败: {str(e)}'}), 500
 
 
 @friend_bp.route('/remove', methods=['POST'])
@@ -106,17 +396,27 @@ def remove_friend():
         if not data or not data.get('friend_id'):
             return jsonify({'error': '好友ID是必需的'}), 400
         
-        friend_id = data['friend_id']
+        try:
+            friend_id = int(data['friend_id'])
+        except (TypeError, ValueError):
+            return jsonify({'error': '好友ID格式错误'}), 400
         
-        # 删除双向好友关系
-        Friendship.query.filter(
-            or_(
-                and_(Friendship.user_id == current_user_id, Friendship.friend_id == friend_id),
-                and_(Friendship.user_id == friend_id, Friendship.friend_id == current_user_id)
-            )
-        ).delete()
+        # 删除好友关系（每对用户只有一行），也用于撤回自己发出的好友请求
+        friendship = Friendship.get(current_user_id, friend_id)
+        # 屏蔽关系只能通过解除屏蔽清除
+        if friendship and Friendship.BLOCKED in (friendship.user_status, friendship.friend_status):
+            friendship = None
+        
+        if friendship:
+            if friendship.accepted:
+                FriendshipChange.record(current_user_id, friend_id, FriendshipChange.REMOVED)
+                FriendshipChange.record(friend_id, current_user_id, FriendshipChange.REMOVED)
+            db.session.delete(friendship)
         
         db.session.commit()
+        if friendship:
+            pending_requests.invalidate(current_user_id, friend_id)
+            block_list.invalidate(current_user_id, friend_id)
         
         return jsonify({'message': '好友删除成功'}), 200
         
@@ -125,22 +425,196 @@ def remove_friend():
         return jsonify({'error': f'删除好友失败: {str(e)}'}), 500
 
 
+@friend_bp.route('/block', methods=['POST'])
+@jwt_required()
+def block_user():
+    """屏蔽用户：解除好友关系，对方不能再发消息、发好友请求或搜索到自己"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        data = request.get_json()
+        
+        if not data or not data.get('user_id'):
+            return jsonify({'error': '用户ID是必需的'}), 400
+        
+        try:
+            user_id = int(data['user_id'])
+        except (TypeError, ValueError):
+            return jsonify({'error': '用户ID格式错误'}), 400
+        if user_id == current_user_id:
+            return jsonify({'error': '不能屏蔽自己'}), 400
+        if not user_cache.get(user_id):
+            return jsonify({'error': '用户不存在'}), 404
+        
+        friendship = Friendship.get(current_user_id, user_id)
+        if friendship is None:
+            low, high = Friendship.canonical(current_user_id, user_id)
+            friendship = Friendship(user_id=low, friend_id=high)
+            db.session.add(friendship)
+        elif friendship.status_of(current_user_id) == Friendship.BLOCKED:
+            return jsonify({'message': '已屏蔽该用户'}), 200
+        elif friendship.accepted:
+            FriendshipChange.record(current_user_id, user_id, FriendshipChange.REMOVED)
+            FriendshipChange.record(user_id, current_user_id, FriendshipChange.REMOVED)
+        
+        friendship.set_status(current_user_id, Friendship.BLOCKED)
+        # 自己发给对方的好友请求一并撤回
+        if friendship.status_of(user_id) == Friendship.PENDING:
+            friendship.set_status(user_id, None)
+        db.session.commit()
+        block_list.invalidate(current_user_id, user_id)
+        pending_requests.invalidate(current_user_id, user_id)
+        
+        return jsonify({'message': '已屏蔽该用户'}), 200
+        
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': '好友关系已变化，请重试'}), 409
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'屏蔽用户失败: {str(e)}'}), 500
+
+
+@friend_bp.route('/unblock', methods=['POST'])
+@jwt_required()
+def unblock_user():
+    """解除屏蔽，之后需要重新发送好友请求"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        data = request.get_json()
+        
+        if not data or not data.get('user_id'):
+            return jsonify({'error': '用户ID是必需的'}), 400
+        
+        try:
+            user_id = int(data['user_id'])
+        except (TypeError, ValueError):
+            return jsonify({'error': '用户ID格式错误'}), 400
+        friendship = Friendship.get(current_user_id, user_id)
+        if friendship is None or friendship.status_of(current_user_id) != Friendship.BLOCKED:
+            return jsonify({'error': '未屏蔽该用户'}), 404
+        
+        # 对方也屏蔽了自己时保留对方一侧的状态
+        if friendship.status_of(user_id) == Friendship.BLOCKED:
+            friendship.set_status(current_user_id, None)
+        else:
+            db.session.delete(friendship)
+        db.session.commit()
+        block_list.invalidate(current_user_id, user_id)
+        
+        return jsonify({'message': '已解除屏蔽'}), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'解除屏蔽失败: {str(e)}'}), 500
+
+
+@friend_bp.route('/blocked', methods=['GET'])
+@jwt_required()
+def get_blocked_users():
+    """获取已屏蔽的用户列表"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        
+        users = user_cache.get_many(list(block_list.blocked(current_user_id)))
+        user_list = sorted((user.to_dict() for user in users.values()), key=lambda user: user['username'])
+        
+        return jsonify({
+            'users': user_list,
+            'count': len(user_list)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'获取屏蔽列表失败: {str(e)}'}), 500
+
+
+@friend_bp.route('/suggestions', methods=['GET'])
+@jwt_required()
+def get_suggestions():
+    """可能认识的人：读取后台任务预先计算的结果（按主键读取一行）"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        
+        suggestion = db.session.get(FriendSuggestion, current_user_id)
+        items = suggestion.items() if suggestion else []
+        
+        # 计算之后新屏蔽的用户只查缓存过滤
+        blocked = block_list.blocked(current_user_id)
+        blocked_by = block_list.blocked_by(current_user_id)
+        items = [item for item in items if item[0] not in blocked and item[0] not in blocked_by]
+        
+        users = user_cache.get_many([user_id for user_id, _ in items])
+        result = []
+        for user_id, mutual in items:
+            if user_id in users:
+                user_info = users[user_id].to_public_dict()
+                user_info['mutual_count'] = mutual
+                result.append(user_info)
+        
+        return jsonify({
+            'suggestions': result,
+            'count': len(result),
+            'computed_at': suggestion.computed_at if suggestion else None
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'获取好友推荐失败: {str(e)}'}), 500
+
+
+@friend_bp.route('/mutual', methods=['GET'])
+@jwt_required()
+def get_mutual_friends():
+    """与某个用户的共同好友"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        user_id = request.args.get('user_id', type=int)
+        
+        if not user_id:
+            return jsonify({'error': '用户ID是必需的'}), 400
+        if block_list.is_blocked(current_user_id, user_id) or not user_cache.get(user_id):
+            return jsonify({'error': '用户不存在'}), 404
+        
+        # 两个好友子查询按 friend_id 连接，一次查询
+        mine = Friendship.friends_subquery(current_user_id)
+        theirs = Friendship.friends_subquery(user_id)
+        mutual_ids = [
+            friend_id for (friend_id,) in db.session.query(mine.c.friend_id).join(
+                theirs, mine.c.friend_id == theirs.c.friend_id
+            )
+        ]
+        
+        users = user_cache.get_many(mutual_ids)
+        friends = sorted((user.to_public_dict() for user in users.values()), key=lambda user: user['username'])
+        
+        return jsonify({
+            'friends': friends,
+            'count': len(friends)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'获取共同好友失败: {str(e)}'}), 500
+
+
 @friend_bp.route('/search', methods=['GET'])
 @jwt_required()
 def search_users():
     """搜索用户"""
     try:
+        current_user_id = int(get_jwt_identity())
         keyword = request.args.get('keyword', '').strip()
         
         if not keyword:
             return jsonify({'error': '搜索关键词不能为空'}), 400
         
-        # 搜索用户名包含关键词的用户
-        users = User.query.filter(
+        # 搜索用户名包含关键词的用户，屏蔽了自己的用户不出现在结果中
+        query = db.session.query(*User.list_columns()).filter(
             User.username.contains(keyword)
-        ).limit(20).all()
+        )
+        blocked_by = block_list.blocked_by(current_user_id)
+        if blocked_by:
+            query = query.filter(User.id.notin_(list(blocked_by)))
+        rows = query.limit(20).all()
         
-        user_list = [user.to_dict() for user in users]
+        user_list = [User.row_to_dict(row) for row in rows]
         
         return jsonify({
             'users': user_list,
@@ -0,0 +1,462 @@
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from models.user import User
+from models.friendship import Friendship
+from models.group import Group, GroupMember
+from models.group_message import GroupMessage
+from models.attachment import Attachment
+from models.types import truncate_preview
+from database import db
+from services.read_receipts import group_read_receipts
+from sqlalchemy import and_, desc, func
+
+group_bp = Blueprint('group', __name__)
+
+
+def _parse_user_ids(values):
+    """解析用户ID列表，格式错误时抛出 ValueError"""
+    if not isinstance(values, list):
+        raise ValueError('用户ID列表格式错误')
+    return {int(value) for value in values}
+
+
+def _non_friend_ids(user_id, candidate_ids):
+    """候选用户中不是 user_id 好友的ID"""
+    if not candidate_ids:
+        return set()
+    return set(candidate_ids) - Friendship.friend_ids(user_id, candidate_ids)
+
+
+@group_bp.route('/create', methods=['POST'])
+@jwt_required()
+def create_group():
+    """创建群聊"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        data = request.get_json()
+        
+        if not data or not data.get('name') or not data['name'].strip():
+            return jsonify({'error': '群名称是必需的'}), 400
+        
+        name = data['name'].strip()[:100]
+        try:
+            member_ids = _parse_user_ids(data.get('member_ids', [])) - {current_user_id}
+        except (TypeError, ValueError):
+            return jsonify({'error': '成员ID列表格式错误'}), 400
+        
+        if len(member_ids) + 1 > current_app.config['GROUP_MAX_MEMBERS']:
+            return jsonify({'error': '群成员数量超过上限'}), 400
+        
+        # 只能邀请好友入群
+        if _non_friend_ids(current_user_id, member_ids):
+            return jsonify({'error': '只能邀请好友入群'}), 403
+        
+        group = Group(name=name, owner_id=current_user_id)
+        db.session.add(group)
+        db.session.flush()
+        
+        db.session.add(GroupMember(group_id=group.id, user_id=current_user_id, role='owner'))
+        db.session.add_all([
+            GroupMember(group_id=group.id, user_id=member_id, role='member')
+            for member_id in member_ids
+        ])
+        db.session.commit()
+        
+        return jsonify({
+            'message': '群聊创建成功',
+            'group': group.to_dict(),
+            'member_count': len(member_ids) + 1
+        }), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'创建群聊失败: {str(e)}'}), 500
+
+
+@group_bp.route('/members/add', methods=['POST'])
+@jwt_required()
+def add_members():
+    """添加群成员（群主和管理员）"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        data = request.get_json()
+        
+        if not data or not data.get('group_id') or not data.get('user_ids'):
+            return jsonify({'error': '群ID和用户ID列表都是必需的'}), 400
+        
+        try:
+            group_id = int(data['group_id'])
+        except (TypeError, ValueError):
+            return jsonify({'error': '群ID格式错误'}), 400
+        try:
+            user_ids = _parse_user_ids(data['user_ids'])
+        except (TypeError, ValueError):
+            return jsonify({'error': '用户ID列表格式错误'}), 400
+        
+        membership = GroupMember.get(group_id, current_user_id)
+        if not membership or not membership.can_manage():
+            return jsonify({'error': '只有群主和管理员可以添加成员'}), 403
+        
+        # 跳过已经在群里的用户
+        existing_ids = {
+            user_id for (user_id,) in db.session.query(GroupMember.user_id).filter(
+                GroupMember.group_id == group_id,
+                GroupMember.user_id.in_(user_ids)
+            )
+        }
+        new_ids = user_ids - existing_ids
+        
+        if _non_friend_ids(current_user_id, new_ids):
+            return jsonify({'error': '只能邀请好友入群'}), 403
+        
+        member_count = GroupMember.query.filter_by(group_id=group_id).count()
+        if member_count + len(new_ids) > current_app.config['GROUP_MAX_MEMBERS']:
+            return jsonify({'error': '群成员数量超过上限'}), 400
+        
+        # 新成员从入群时的最新消息开始计算未读
+        latest_id = db.session.query(func.max(GroupMessage.id)).filter(
+            GroupMessage.group_id == group_id
+        ).scalar() or 0
+        db.session.add_all([
+            GroupMember(group_id=group_id, user_id=user_id, role='member', last_read_message_id=latest_id)
+            for user_id in new_ids
+        ])
+        db.session.commit()
+        
+        return jsonify({
+            'message': f'已添加 {len(new_ids)} 名成员',
+            'added': sorted(new_ids)
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'添加群成员失败: {str(e)}'}), 500
+
+
+@group_bp.route('/members/remove', methods=['POST'])
+@jwt_required()
+def remove_member():
+    """移除群成员或退出群聊"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        data = request.get_json()
+        
+        if not data or not data.get('group_id') or not data.get('user_id'):
+            return jsonify({'error': '群ID和用户ID都是必需的'}), 400
+        
+        try:
+            group_id = int(data['group_id'])
+            user_id = int(data['user_id'])
+        except (TypeError, ValueError):
+            return jsonify({'error': '群ID或用户ID格式错误'}), 400
+        
+        membership = GroupMember.get(group_id, current_user_id)
+        if not membership:
+            return jsonify({'error': '不是群成员'}), 403
+        
+        target = membership if user_id == current_user_id else GroupMember.get(group_id, user_id)
+        if not target:
+            return jsonify({'error': '该用户不是群成员'}), 404
+        
+        if target.role == 'owner':
+            return jsonify({'error': '群主不能退出或被移除'}), 400
+        
+        if target is not membership and not membership.can_manage():
+            return jsonify({'error': '只有群主和管理员可以移除成员'}), 403
+        
+        db.session.delete(target)
+        db.session.commit()
+        group_read_receipts.discard((group_id, user_id))
+        
+        return jsonify({'message': '已退出群聊' if user_id == current_user_id else '成员移除成功'}), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'移除群成员失败: {str(e)}'}), 500
+
+
+@group_bp.route('/members', methods=['GET'])
+@jwt_required()
+def get_members():
+    """获取群成员列表（按用户ID分页）"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        group_id = request.args.get('group_id', type=int)
+        after_id = request.args.get('after_id', 0, type=int)
+        limit = max(1, min(request.args.get('limit', 100, type=int), 500))
+        
+        if not group_id:
+            return jsonify({'error': '群ID是必需的'}), 400
+        
+        if not GroupMember.get(group_id, current_user_id):
+            return jsonify({'error': '只能查看所在群的成员'}), 403
+        
+        rows = db.session.query(
+            User.id, User.username, User.avatar, GroupMember.role, GroupMember.joined_at
+        ).join(
+            GroupMember, GroupMember.user_id == User.id
+        ).filter(
+            GroupMember.group_id == group_id,
+            GroupMember.user_id > after_id
+        ).order_by(GroupMember.user_id).limit(limit + 1).all()
+        
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        return jsonify({
+            'members': [
+                {
+                    'id': row.id,
+                    'username': row.username,
+                    'avatar': row.avatar,
+                    'role': row.role,
+                    'joined_at': row.joined_at
+                }
+                for row in rows
+            ],
+            'next_after_id': rows[-1].id if has_more else None
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'获取群成员失败: {str(e)}'}), 500
+
+
+@group_bp.route('/list', methods=['GET'])
+@jwt_required()
+def get_groups():
+    """获取群聊列表（含最新消息和未读数）"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        # 最新消息只返回前 preview 个字符的预览
+        preview = request.args.get('preview', type=int)
+        if preview is not None:
+            preview = max(1, min(preview, 1000))
+        
+        memberships = db.session.query(
+            Group.id, Group.name, Group.owner_id, Group.created_at,
+            GroupMember.role, GroupMember.last_read_message_id
+        ).join(
+            GroupMember, GroupMember.group_id == Group.id
+        ).filter(
+            GroupMember.user_id == current_user_id
+        ).all()
+        group_ids = [row.id for row in memberships]
+        
+        last_messages = {}
+        unread_counts = {}
+        if group_ids:
+            # 每个群的最新消息：按群分组取最大消息ID
+            latest_ids = db.session.query(func.max(GroupMessage.id)).filter(
+                GroupMessage.group_id.in_(group_ids)
+            ).group_by(GroupMessage.group_id)
+            last_messages = {
+                row.group_id: row
+                for row in db.session.query(*GroupMessage.list_columns(preview)).filter(
+                    GroupMessage.id.in_(latest_ids)
+                )
+            }
+            
+            # 未读数 = 各群水位之后的消息数，一次分组查询
+            unread_counts = dict(
+                db.session.query(GroupMessage.group_id, func.count(GroupMessage.id)).join(
+                    GroupMember,
+                    and_(GroupMember.group_id == GroupMessage.group_id, GroupMember.user_id == current_user_id)
+                ).filter(
+                    GroupMessage.id > GroupMember.last_read_message_id
+                ).group_by(GroupMessage.group_id).all()
+            )
+        
+        group_list = []
+        for row in memberships:
+            last_read_id = group_read_receipts.watermark(row.id, current_user_id, row.last_read_message_id)
+            unread_count = unread_counts.get(row.id, 0)
+            if unread_count and last_read_id > row.last_read_message_id:
+                # 已读但尚未落库，按最新水位重新计数
+                unread_count = GroupMessage.query.filter(
+                    GroupMessage.group_id == row.id,
+                    GroupMessage.id > last_read_id
+                ).count()
+            
+            last_message = last_messages.get(row.id)
+            message_dict = GroupMessage.row_to_dict(last_message) if last_message else None
+            if message_dict and preview:
+                message_dict['content'], message_dict['truncated'] = truncate_preview(
+                    message_dict['content'], preview
+                )
+            
+            group_list.append({
+                'group': {
+                    'id': row.id,
+                    'name': row.name,
+                    'owner_id': row.owner_id,
+                    'created_at': row.created_at
+                },
+                'role': row.role,
+                'last_message': message_dict,
+                'unread_count': unread_count
+            })
+        
+        # 按最后消息排序，没有消息的群排在最后
+        group_list.sort(
+            key=lambda x: x['last_message']['id'] if x['last_message'] else 0,
+            reverse=True
+        )
+        
+        return jsonify({
+            'groups': group_list,
+            'count': len(group_list)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'获取群聊列表失败: {str(e)}'}), 500
+
+
+@group_bp.route('/send', methods=['POST'])
+@jwt_required()
+def send_group_message():
+    """发送群消息（只写一行，不按成员复制）"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        data = request.get_json()
+        
+        if not data or not data.get('group_id') or not (data.get('content') or data.get('attachment_id')):
+            return jsonify({'error': '群ID和消息内容（或附件）都是必需的'}), 400
+        
+        try:
+            group_id = int(data['group_id'])
+            attachment_id = int(data['attachment_id']) if data.get('attachment_id') else None
+        except (TypeError, ValueError):
+            return jsonify({'error': '群ID或附件ID格式错误'}), 400
+        content = (data.get('content') or '').strip()
+        message_type = data.get('message_type', 'text')
+        
+        if not GroupMember.get(group_id, current_user_id):
+            return jsonify({'error': '只能在所在的群里发送消息'}), 403
+        
+        # 附件需要先上传，消息只引用附件ID
+        if attachment_id:
+            attachment = Attachment.query.get(attachment_id)
+            if not attachment or not attachment.is_visible_to(current_user_id):
+                return jsonify({'error': '附件不存在'}), 404
+            if message_type == 'text':
+                message_type = attachment.message_type()
+        
+        message = GroupMessage(
+            group_id=group_id,
+            sender_id=current_user_id,
+            content=content,
+            message_type=message_type,
+            attachment_id=attachment.id if attachment_id else None
+        )
+        db.session.add(message)
+        db.session.commit()
+        
+        # 自己发的消息视为已读
+        group_read_receipts.mark_read(group_id, current_user_id, message.id)
+        
+        return jsonify({
+            'message': '消息发送成功',
+            'data': message.to_dict()
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'发送群消息失败: {str(e)}'}), 500
+
+
+@group_bp.route('/history', methods=['GET'])
+@jwt_required()
+def get_group_history():
+    """获取群聊历史消息（按消息ID向前翻页）"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        group_id = request.args.get('group_id', type=int)
+        before_id = request.args.get('before_id', type=int)
+        limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+        
+        if not group_id:
+            return jsonify({'error': '群ID是必需的'}), 400
+        
+        membership = GroupMember.get(group_id, current_user_id)
+        if not membership:
+            return jsonify({'error': '只能查看所在群的聊天记录'}), 403
+        
+        query = db.session.query(
+            *GroupMessage.list_columns(),
+            User.username.label('sender_username')
+        ).outerjoin(
+            User, User.id == GroupMessage.sender_id
+        ).filter(
+            GroupMessage.group_id == group_id
+        )
+        if before_id:
+            query = query.filter(GroupMessage.id < before_id)
+        
+        rows = query.order_by(desc(GroupMessage.id)).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        # 查看最新一页时投递已读水位，由后台批量落库
+        last_read_id = group_read_receipts.watermark(
+            group_id, current_user_id, membership.last_read_message_id
+        )
+        if not before_id and rows and rows[0].id > last_read_id:
+            group_read_receipts.mark_read(group_id, current_user_id, rows[0].id)
+        
+        message_list = []
+        for row in reversed(rows):
+            msg_dict = GroupMessage.row_to_dict(row)
+            msg_dict['sender_username'] = row.sender_username or 'Unknown'
+            message_list.append(msg_dict)
+        
+        return jsonify({
+            'messages': message_list,
+            'last_read_message_id': last_read_id,
+            'has_more': has_more,
+            'next_before_id': rows[-1].id if has_more else None
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'获取群聊记录失败: {str(e)}'}), 500
+
+
+@group_bp.route('/mark_read', methods=['POST'])
+@jwt_required()
+def mark_group_read():
+    """标记群消息为已读"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        data = request.get_json()
+        
+        if not data or not data.get('group_id'):
+            return jsonify({'error': '群ID是必需的'}), 400
+        
+        try:
+            group_id = int(data['group_id'])
+        except (TypeError, ValueError):
+            return jsonify({'error': '群ID格式错误'}), 400
+        membership = GroupMember.get(group_id, current_user_id)
+        if not membership:
+            return jsonify({'error': '不是群成员'}), 403
+        
+        latest_id = db.session.query(func.max(GroupMessage.id)).filter(
+            GroupMessage.group_id == group_id
+        ).scalar() or 0
+        last_read_id = group_read_receipts.watermark(
+            group_id, current_user_id, membership.last_read_message_id
+        )
+        
+        target_id = max(latest_id, last_read_id)
+        if target_id > membership.last_read_message_id:
+            GroupMember.advance(group_id, current_user_id, target_id)
+            db.session.commit()
+        group_read_receipts.discard((group_id, current_user_id))
+        
+        return jsonify({
+            'message': '已标记为已读',
+            'last_read_message_id': target_id
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'标记群消息已读失败: {str(e)}'}), 500
@@ -3,12 +3,37 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from models.user import User
 from models.message import Message
 from models.friendship import Friendship
+from models.read_state import ReadState
+from models.attachment import Attachment
+from models.types import truncate_preview
 from database import db
-from sqlalchemy import or_, and_, desc, func
+from services.read_receipts import read_receipts
+from services.presence import presence
+from services.block_list import block_list
+from services.user_cache import user_cache
+from services.recent_messages import recent_messages
+from services.single_flight import single_flight
+from sqlalchemy import or_, and_, desc, func, case
+from sqlalchemy.exc import IntegrityError
 
 message_bp = Blueprint('message', __name__)
 
 
+def _duplicate_send_response(message, receiver_id):
+    """重试的发送请求：直接返回第一次发送的消息"""
+    if message.receiver_id != int(receiver_id):
+        return jsonify({'error': '客户端消息ID已用于其他会话'}), 409
+    read_watermark = read_receipts.watermark(
+        message.receiver_id, message.sender_id,
+        ReadState.get_watermark(message.receiver_id, message.sender_id)
+    )
+    return jsonify({
+        'message': '消息发送成功',
+        'data': message.to_dict(read_watermark),
+        'duplicate': True
+    }), 200
+
+
 @message_bp.route('/send', methods=['POST'])
 @jwt_required()
 def send_message():
@@ -17,46 +42,80 @@ def send_message():
         current_user_id = int(get_jwt_identity())
         data = request.get_json()
         
-        if not data or not data.get('receiver_id') or not data.get('content'):
-            return jsonify({'error': '接收者ID和消息内容都是必需的'}), 400
+        if not data or not data.get('receiver_id') or not (data.get('content') or data.get('attachment_id')):
+            return jsonify({'error': '接收者ID和消息内容（或附件）都是必需的'}), 400
         
-        receiver_id = data['receiver_id']
-        content = data['content'].strip()
+        try:
+            receiver_id = int(data['receiver_id'])
+            attachment_id = int(data['attachment_id']) if data.get('attachment_id') else None
+        except (TypeError, ValueError):
+            return jsonify({'error': '接收者ID或附件ID格式错误'}), 400
+        content = (data.get('content') or '').strip()
         message_type = data.get('message_type', 'text')
+        client_msg_id = data.get('client_msg_id')
+        
+        if client_msg_id is not None:
+            if not isinstance(client_msg_id, str) or not 0 < len(client_msg_id) <= 64:
+                return jsonify({'error': '客户端消息ID格式错误'}), 400
+            
+            # 客户端超时重试时，已写入的消息直接返回，不再重复校验和写入
+            existing = Message.get_by_client_id(current_user_id, client_msg_id)
+            if existing:
+                return _duplicate_send_response(existing, receiver_id)
         
         # 不能给自己发消息
         if current_user_id == receiver_id:
             return jsonify({'error': '不能给自己发消息'}), 400
         
+        # 任意一方屏蔽了对方时不能发送（只查内存中的屏蔽集合）
+        if block_list.is_blocked(current_user_id, receiver_id):
+            return jsonify({'error': '无法给该用户发送消息'}), 403
+        
         # 检查接收者是否存在
-        receiver = User.query.get(receiver_id)
+        receiver = user_cache.get(receiver_id)
         if not receiver:
             return jsonify({'error': '接收者不存在'}), 404
         
-        # 检查是否为好友关系
-        friendship = Friendship.query.filter(
-            Friendship.user_id == current_user_id,
-            Friendship.friend_id == receiver_id,
-            Friendship.status == 'accepted'
-        ).first()
-        
-        if not friendship:
+        # 检查是否为好友关系（按唯一索引单点查询）
+        if not Friendship.are_friends(current_user_id, receiver_id):
             return jsonify({'error': '只能给好友发送消息'}), 403
         
+        # 附件需要先上传，消息只引用附件ID
+        if attachment_id:
+            attachment = Attachment.query.get(attachment_id)
+            if not attachment or not attachment.is_visible_to(current_user_id):
+                return jsonify({'error': '附件不存在'}), 404
+            if message_type == 'text':
+                message_type = attachment.message_type()
+        
         # 创建消息
         message = Message(
             sender_id=current_user_id,
             receiver_id=receiver_id,
             content=content,
-            message_type=message_type
+            message_type=message_type,
+            attachment_id=attachment.id if attachment_id else None,
+            client_msg_id=client_msg_id
         )
         
         db.session.add(message)
-        db.session.commit()
-        
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # 并发的重试请求已经写入了同一条消息
+            db.session.rollback()
+            existing = Message.get_by_client_id(current_user_id, client_msg_id) if client_msg_id else None
+            if not existing:
+                raise
+            return _duplicate_send_response(existing, receiver_id)
+        
+        # 消息已发出，清除发送者的输入状态
+        presence.set_typing(current_user_id, receiver_id, False)
+        
+        # 新消息的ID大于任何已读水位，必然未读
         return jsonify({
             'message': '消息发送成功',
-            'data': message.to_dict()
+            'data': message.to_dict(read_watermark=0)
         }), 200
         
     except Exception as e:
@@ -77,40 +136,78 @@ def get_message_history():
         if not friend_id:
             return jsonify({'error': '好友ID是必需的'}), 400
         
-        # 检查是否为好友关系
-        friendship = Friendship.query.filter(
-            Friendship.user_id == current_user_id,
-            Friendship.friend_id == friend_id,
-            Friendship.status == 'accepted'
-        ).first()
-        
-        if not friendship:
+        # 检查是否为好友关系（按唯一索引单点查询）
+        if not Friendship.are_friends(current_user_id, friend_id):
             return jsonify({'error': '只能查看好友的聊天记录'}), 403
         
-        # 查询聊天记录
-        messages = Message.query.filter(
-            or_(
-                and_(Message.sender_id == current_user_id, Message.receiver_id == friend_id),
-                and_(Message.sender_id == friend_id, Message.receiver_id == current_user_id)
+        # 第一页优先从最近消息缓存读取，缓存不够一页时查询数据库
+        recent = latest_ids = None
+        if page == 1 and per_page > 0:
+            cached = recent_messages.get(current_user_id, friend_id)
+            total, latest_ids = cached.total, cached.latest_ids
+            if len(cached.messages) >= per_page or len(cached.messages) == total:
+                recent = cached.messages[-per_page:]
+        
+        if recent is not None:
+            senders = user_cache.get_many([current_user_id, friend_id])
+            rows = [
+                (row, senders[row.sender_id].username if row.sender_id in senders else None)
+                for row in reversed(recent)
+            ]
+            pages = (total + per_page - 1) // per_page
+            pagination = {
+                'page': 1,
+                'pages': pages,
+                'per_page': per_page,
+                'total': total,
+                'has_next': pages > 1,
+                'has_prev': False
+            }
+        else:
+            # 查询聊天记录（按列查询并连接发送者用户名，不构建 ORM 对象）
+            messages = db.session.query(
+                *Message.list_columns(),
+                User.username.label('sender_username')
+            ).outerjoin(
+                User, User.id == Message.sender_id
+            ).filter(
+                or_(
+                    and_(Message.sender_id == current_user_id, Message.receiver_id == friend_id),
+                    and_(Message.sender_id == friend_id, Message.receiver_id == current_user_id)
+                )
+            ).order_by(desc(Message.created_at)).paginate(
+                page=page, per_page=per_page, error_out=False
             )
-        ).order_by(desc(Message.created_at)).paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+            rows = [(row, row.sender_username) for row in messages.items]
+            if latest_ids is None:
+                latest_ids = Message.latest_ids_between(current_user_id, friend_id)
+            pagination = {
+                'page': messages.page,
+                'pages': messages.pages,
+                'per_page': messages.per_page,
+                'total': messages.total,
+                'has_next': messages.has_next,
+                'has_prev': messages.has_prev
+            }
         
-        # 标记接收到的消息为已读
-        Message.query.filter(
-            Message.sender_id == friend_id,
-            Message.receiver_id == current_user_id,
-            Message.is_read == False
-        ).update({'is_read': True})
-        db.session.commit()
+        # 双方的已读水位（含尚未落库的部分）
+        stored = ReadState.watermarks_between(current_user_id, friend_id)
+        watermarks = {
+            current_user_id: read_receipts.watermark(current_user_id, friend_id, stored[current_user_id]),
+            friend_id: read_receipts.watermark(friend_id, current_user_id, stored[friend_id])
+        }
+        
+        # 标记接收到的消息为已读：只在确有未读消息时投递已读水位，由后台批量落库
+        latest_id = latest_ids[friend_id]
+        if latest_id and latest_id > watermarks[current_user_id]:
+            read_receipts.mark_read(current_user_id, friend_id, latest_id)
+            watermarks[current_user_id] = latest_id
         
         message_list = []
-        for message in messages.items:
-            msg_dict = message.to_dict()
+        for row, sender_username in rows:
+            msg_dict = Message.row_to_dict(row, watermarks[row.receiver_id])
             # 添加发送者信息
-            sender = User.query.get(message.sender_id)
-            msg_dict['sender_username'] = sender.username if sender else 'Unknown'
+            msg_dict['sender_username'] = sender_username or 'Unknown'
             message_list.append(msg_dict)
         
         # 反转消息列表，使最新的消息在最后
@@ -118,14 +215,8 @@ def get_message_history():
         
         return jsonify({
             'messages': message_list,
-            'pagination': {
-                'page': messages.page,
-                'pages': messages.pages,
-                'per_page': messages.per_page,
-                'total': messages.total,
-                'has_next': messages.has_next,
-                'has_prev': messages.has_prev
-            }
+            'presence': presence.conversation_state(current_user_id, friend_id),
+            'pagination': pagination
         }), 200
         
     except Exception as e:
@@ -134,43 +225,87 @@ def get_message_history():
 
 @message_bp.route('/chats', methods=['GET'])
 @jwt_required()
+@single_flight.coalesce
 def get_chat_list():
     """获取聊天列表（最近联系人）"""
     try:
         current_user_id = int(get_jwt_identity())
-        
-        # 获取所有涉及当前用户的消息，按聊天对象分组
-        # 使用 Python 代码处理而不是复杂的 SQL 函数
-        all_messages = Message.query.filter(
+        # 最后一条消息只返回前 preview 个字符的预览
+        preview = request.args.get('preview', type=int)
+        if preview is not None:
+            preview = max(1, min(preview, 1000))
+        
+        # 每个聊天对象只取最新一条消息：按聊天对象分组取最大消息ID
+        partner_column = case(
+            (Message.sender_id == current_user_id, Message.receiver_id),
+            else_=Message.sender_id
+        )
+        latest_ids = db.session.query(func.max(Message.id)).filter(
             or_(Message.sender_id == current_user_id, Message.receiver_id == current_user_id)
-        ).order_by(desc(Message.created_at)).all()
-        
-        # 按聊天对象分组，保留最新消息
-        chat_partners = {}
-        for message in all_messages:
-            # 确定聊天对象
-            partner_id = message.receiver_id if message.sender_id == current_user_id else message.sender_id
-            
-            # 如果还没有这个聊天对象的记录，或者当前消息更新，则更新记录
-            if partner_id not in chat_partners:
-                chat_partners[partner_id] = message
+        ).group_by(partner_column)
+        
+        last_messages = db.session.query(*Message.list_columns(preview)).filter(
+            Message.id.in_(latest_ids)
+        ).all()
+        chat_partners = {
+            row.receiver_id if row.sender_id == current_user_id else row.sender_id: row
+            for row in last_messages
+        }
+        
+        # 一次查询所有聊天对象的用户信息
+        partners = {
+            row.id: row
+            for row in db.session.query(*User.list_columns()).filter(User.id.in_(list(chat_partners)))
+        }
+        
+        # 当前用户的已读水位，以及各聊天对象对当前用户消息的已读水位
+        read_by_me = ReadState.watermarks_for_user(current_user_id)
+        read_by_partners = ReadState.watermarks_for_partner(current_user_id)
+        
+        # 未读数 = 各聊天对象发来的、已落库水位之后的消息数，一次分组查询
+        unread_counts = dict(
+            db.session.query(Message.sender_id, func.count(Message.id)).outerjoin(
+                ReadState,
+                and_(ReadState.user_id == current_user_id, ReadState.partner_id == Message.sender_id)
+            ).filter(
+                Message.receiver_id == current_user_id,
+                Message.id > func.coalesce(ReadState.last_read_message_id, 0)
+            ).group_by(Message.sender_id).all()
+        )
         
         # 构建聊天列表
         chat_list = []
         for partner_id, last_message in chat_partners.items():
-            chat_partner = User.query.get(partner_id)
+            chat_partner = partners.get(partner_id)
             
             if chat_partner:
-                # 计算未读消息数
-                unread_count = Message.query.filter(
-                    Message.sender_id == partner_id,
-                    Message.receiver_id == current_user_id,
-                    Message.is_read == False
-                ).count()
+                stored_read_id = read_by_me.get(partner_id, 0)
+                last_read_id = read_receipts.watermark(current_user_id, partner_id, stored_read_id)
+                unread_count = unread_counts.get(partner_id, 0)
+                if unread_count and last_read_id > stored_read_id:
+                    # 已读但尚未落库，按最新水位重新计数
+                    unread_count = Message.query.filter(
+                        Message.sender_id == partner_id,
+                        Message.receiver_id == current_user_id,
+                        Message.id > last_read_id
+                    ).count()
+                
+                if last_message.receiver_id == current_user_id:
+                    read_watermark = last_read_id
+                else:
+                    read_watermark = read_receipts.watermark(
+                        partner_id, current_user_id, read_by_partners.get(partner_id, 0)
+                    )
+                
+                message_dict = Message.row_to_dict(last_message, read_watermark)
+                if preview:
+                    message_dict['content'], message_dict['truncated'] = truncate_preview(
+                        message_dict['content'], preview
+                    )
                 
                 chat_info = {
-                    'partner': chat_partner.to_dict(),
-                    'last_message': last_message.to_dict(),
+                    'partner': User.row_to_dict(chat_partner),
+                    'last_message': message_dict,
                     'unread_count': unread_count
                 }
                 chat_list.append(chat_info)
@@ -198,33 +333,30 @@ def get_last_message():
         if not friend_id:
             return jsonify({'error': '好友ID是必需的'}), 400
         
-        # 检查是否为好友关系
-        friendship = Friendship.query.filter(
-            Friendship.user_id == current_user_id,
-            Friendship.friend_id == friend_id,
-            Friendship.status == 'accepted'
-        ).first()
-        
-        if not friendship:
+        # 检查是否为好友关系（按唯一索引单点查询）
+        if not Friendship.are_friends(current_user_id, friend_id):
             return jsonify({'error': '只能查看好友的消息'}), 403
         
-        # 查询最后一条消息
-        last_message = Message.query.filter(
-            or_(
-                and_(Message.sender_id == current_user_id, Message.receiver_id == friend_id),
-                and_(Message.sender_id == friend_id, Message.receiver_id == current_user_id)
-            )
-        ).order_by(desc(Message.created_at)).first()
-        
-        if not last_message:
+        # 最后一条消息从最近消息缓存读取
+        cached = recent_messages.get(current_user_id, friend_id).messages
+        if not cached:
             return jsonify({'message': '暂无消息记录'}), 200
+        last_message = cached[-1]
         
         # 添加发送者信息
-        msg_dict = last_message.to_dict()
-        sender = User.query.get(last_message.sender_id)
+        read_watermark = read_receipts.watermark(
+            last_message.receiver_id,
+            last_message.sender_id,
+            ReadState.get_watermark(last_message.receiver_id, last_message.sender_id)
+        )
+        msg_dict = Message.row_to_dict(last_message, read_watermark)
+        sender = user_cache.get(last_message.sender_id)
         msg_dict['sender_username'] = sender.username if sender else 'Unknown'
         
-        return jsonify({'last_message': msg_dict}), 200
+        return jsonify({
+            'last_message': msg_dict,
+            'presence': presence.conversation_state(current_user_id, friend_id)
+        }), 200
         
     except Exception as e:
         return jsonify({'error': f'获取最后消息失败: {str(e)}'}), 500
@@ -241,16 +373,34 @@ def mark_messages_read():
         if not data or not data.get('sender_id'):
             return jsonify({'error': '发送者ID是必需的'}), 400
         
-        sender_id = data['sender_id']
+        try:
+            sender_id = int(data['sender_id'])
+        except (TypeError, ValueError):
+            return jsonify({'error': '发送者ID格式错误'}), 400
         
-        # 标记来自指定发送者的所有未读消息为已读
-        updated_count = Message.query.filter(
+        # 标记来自指定发送者的所有未读消息为已读：只需把水位推进到最新一条
+        stored_id = ReadState.get_watermark(current_user_id, sender_id)
+        last_read_id = read_receipts.watermark(current_user_id, sender_id, stored_id)
+        latest_id = db.session.query(func.max(Message.id)).filter(
             Message.sender_id == sender_id,
-            Message.receiver_id == current_user_id,
-            Message.is_read == False
-        ).update({'is_read': True})
-        
-        db.session.commit()
+            Message.receiver_id == current_user_id
+        ).scalar() or 0
+        
+        updated_count = 0
+        if latest_id > last_read_id:
+            updated_count = Message.query.filter(
+                Message.sender_id == sender_id,
+                Message.receiver_id == current_user_id,
+                Message.id > last_read_id
+            ).count()
+        
+        target_id = max(latest_id, last_read_id)
+        if target_id > stored_id:
+            ReadState.advance(current_user_id, sender_id, target_id)
+            db.session.commit()
+        
+        # 已同步落库，丢弃管道中该会话尚未刷写的已读水位
+        read_receipts.discard((current_user_id, sender_id))
         
         return jsonify({
             'message': f'已标记 {updated_count} 条消息为已读'
@@ -0,0 +1,134 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from models.friendship import Friendship
+from services.presence import presence
+from services.block_list import block_list
+from services.last_seen import last_seen_buffer
+
+presence_bp = Blueprint('presence', __name__)
+
+
+@presence_bp.route('/heartbeat', methods=['POST'])
+@jwt_required()
+def heartbeat():
+    """在线心跳（不访问数据库）"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        presence.heartbeat(current_user_id)
+        
+        return jsonify({
+            'status': presence.ONLINE,
+            'ttl': presence.presence_ttl
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'心跳失败: {str(e)}'}), 500
+
+
+@presence_bp.route('/offline', methods=['POST'])
+@jwt_required()
+def go_offline():
+    """主动下线"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        presence.go_offline(current_user_id)
+        
+        return jsonify({'status': presence.OFFLINE}), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'下线失败: {str(e)}'}), 500
+
+
+@presence_bp.route('/typing', methods=['POST'])
+@jwt_required()
+def set_typing():
+    """设置正在输入状态（只能对可以发消息的好友设置）"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        data = request.get_json()
+        
+        if not data or not data.get('partner_id'):
+            return jsonify({'error': '聊天对象ID是必需的'}), 400
+        
+        try:
+            partner_id = int(data['partner_id'])
+        except (TypeError, ValueError):
+            return jsonify({'error': '聊天对象ID格式错误'}), 400
+        typing = bool(data.get('typing', True))
+        
+        # 与发送消息的条件一致：清除输入状态不需要检查
+        if typing:
+            if block_list.is_blocked(current_user_id, partner_id):
+                return jsonify({'error': '无法向该用户发送输入状态'}), 403
+            if not Friendship.are_friends(current_user_id, partner_id):
+                return jsonify({'error': '只能向好友发送输入状态'}), 403
+        
+        presence.set_typing(current_user_id, partner_id, typing)
+        
+        return jsonify({
+            'typing': typing,
+            'ttl': presence.typing_ttl
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'设置输入状态失败: {str(e)}'}), 500
+
+
+@presence_bp.route('/typing', methods=['GET'])
+@jwt_required()
+def get_typing():
+    """查询好友是否正在给自己输入消息"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        friend_id = request.args.get('friend_id', type=int)
+        
+        if not friend_id:
+            return jsonify({'error': '好友ID是必需的'}), 400
+        
+        return jsonify({
+            'friend_id': friend_id,
+            'typing': presence.is_typing(friend_id, current_user_id)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'查询输入状态失败: {str(e)}'}), 500
+
+
+@presence_bp.route('/status', methods=['GET'])
+@jwt_required()
+def get_status():
+    """批量查询好友在线状态"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        ids = request.args.get('ids', '')
+        
+        try:
+            user_ids = {int(user_id) for user_id in ids.split(',') if user_id.strip()}
+        except ValueError:
+            return jsonify({'error': '用户ID格式错误'}), 400
+        
+        if not user_ids:
+            return jsonify({'error': '用户ID列表不能为空'}), 400
+        
+        if len(user_ids) > 200:
+            return jsonify({'error': '一次最多查询200个用户'}), 400
+        
+        # 只返回好友的状态
+        friend_ids = sorted(Friendship.friend_ids(current_user_id, user_ids))
+        
+        statuses = presence.get_status(friend_ids)
+        last_seen = last_seen_buffer.get_last_seen(friend_ids)
+        
+        return jsonify({
+            'statuses': [
+                {
+                    'id': friend_id,
+                    'status': statuses[friend_id],
+                    'last_seen': last_seen[friend_id]
+                }
+                for friend_id in friend_ids
+            ]
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'查询在线状态失败: {str(e)}'}), 500
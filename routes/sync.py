@@ -0,0 +1,176 @@
+from datetime import datetime, timedelta
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from models.message import Message
+from models.read_state import ReadState
+from models.friendship_change import FriendshipChange
+from models.group import GroupMember
+from models.group_message import GroupMessage
+from database import db
+from services.cursor import encode_cursor, decode_cursor, settle_horizon, settled_cursor
+from services.read_receipts import read_receipts, group_read_receipts
+from sqlalchemy import or_, and_
+
+sync_bp = Blueprint('sync', __name__)
+
+# 单次同步最多返回的消息数、群消息数和好友变更数
+SYNC_MESSAGE_LIMIT = 500
+SYNC_FRIENDSHIP_LIMIT = 1000
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def _parse_since(since):
+    """解析同步游标，返回 (消息ID, 好友变更ID, 已读水位更新时间, 群消息ID)"""
+    if not since:
+        return 0, 0, EPOCH, 0
+    values = [int(value) for value in decode_cursor(since, 4)]
+    return values[0], values[1], EPOCH + timedelta(microseconds=values[2]), values[3]
+
+
+def _page(rows, limit, previous, horizon):
+    """截取一页并计算新游标，返回 (本页的行, 新游标, 是否还有更多)
+    
+    整页都在稳定窗口内时游标不动，此时不提示还有更多，避免客户端立即重复拉取同一页
+    """
+    page = rows[:limit]
+    cursor = settled_cursor(page, previous, horizon)
+    return page, cursor, len(rows) > limit and cursor != previous
+
+
+def _changed_read_states(user_id, read_after):
+    """read_after 之后变化的已读水位：自己在其他设备上的已读，以及对方对自己消息的已读"""
+    columns = (
+        ReadState.user_id, ReadState.partner_id,
+        ReadState.last_read_message_id, ReadState.updated_at
+    )
+    # 两个方向分别走 (用户, 更新时间) 索引
+    mine = db.session.query(*columns).filter(
+        ReadState.user_id == user_id,
+        ReadState.updated_at > read_after
+    )
+    theirs = db.session.query(*columns).filter(
+        ReadState.partner_id == user_id,
+        ReadState.updated_at > read_after
+    )
+    return mine.union_all(theirs).all()
+
+
+def _message_watermarks(user_id, messages):
+    """消息所在会话中接收者的已读水位，返回 {(阅读者ID, 发送者ID): 水位}"""
+    partners = {row.receiver_id if row.sender_id == user_id else row.sender_id for row in messages}
+    if not partners:
+        return {}
+    rows = db.session.query(
+        ReadState.user_id, ReadState.partner_id, ReadState.last_read_message_id
+    ).filter(
+        or_(
+            and_(ReadState.user_id == user_id, ReadState.partner_id.in_(partners)),
+            and_(ReadState.partner_id == user_id, ReadState.user_id.in_(partners))
+        )
+    ).all()
+    return {(row.user_id, row.partner_id): row.last_read_message_id for row in rows}
+
+
+@sync_bp.route('', methods=['GET'])
+@jwt_required()
+def sync():
+    """增量同步：一次返回游标之后的新消息、群消息、已读水位变化和好友变更"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        
+        try:
+            last_message_id, last_change_id, read_after, last_group_message_id = _parse_since(
+                request.args.get('since')
+            )
+        except ValueError:
+            return jsonify({'error': '同步游标格式错误'}), 400
+        
+        # 早于该时间的行视为已提交，游标只推进到这里
+        horizon = settle_horizon()
+        
+        # 新消息（收到的以及从其他设备发出的）
+        messages = db.session.query(*Message.list_columns()).filter(
+            or_(Message.sender_id == current_user_id, Message.receiver_id == current_user_id),
+            Message.id > last_message_id
+        ).order_by(Message.id).limit(SYNC_MESSAGE_LIMIT + 1).all()
+        messages, message_cursor, messages_more = _page(messages, SYNC_MESSAGE_LIMIT, last_message_id, horizon)
+        
+        # 所在群的新群消息
+        my_groups = db.session.query(GroupMember.group_id).filter(GroupMember.user_id == current_user_id)
+        group_messages = db.session.query(*GroupMessage.list_columns()).filter(
+            GroupMessage.group_id.in_(my_groups),
+            GroupMessage.id > last_group_message_id
+        ).order_by(GroupMessage.id).limit(SYNC_MESSAGE_LIMIT + 1).all()
+        group_messages, group_cursor, group_more = _page(
+            group_messages, SYNC_MESSAGE_LIMIT, last_group_message_id, horizon
+        )
+        
+        # 变化的已读水位，按更新时间在数据库中过滤
+        changed_reads = _changed_read_states(current_user_id, read_after)
+        latest_read = max((row.updated_at for row in changed_reads if row.updated_at), default=read_after)
+        read_cursor = max(read_after, min(latest_read, horizon))
+        
+        # 好友变更，同一好友只保留最后一次
+        changes = db.session.query(
+            FriendshipChange.id, FriendshipChange.friend_id, FriendshipChange.action, FriendshipChange.created_at
+        ).filter(
+            FriendshipChange.user_id == current_user_id,
+            FriendshipChange.id > last_change_id
+        ).order_by(FriendshipChange.id).limit(SYNC_FRIENDSHIP_LIMIT + 1).all()
+        changes, change_cursor, changes_more = _page(changes, SYNC_FRIENDSHIP_LIMIT, last_change_id, horizon)
+        friendships = {change.friend_id: change.action for change in changes}
+        
+        # 消息的已读状态由接收者的水位推导（含尚未落库的部分）
+        watermarks = _message_watermarks(current_user_id, messages)
+        
+        def read_watermark(row):
+            stored = watermarks.get((row.receiver_id, row.sender_id), 0)
+            return read_receipts.watermark(row.receiver_id, row.sender_id, stored)
+        
+        # 群消息所在群中自己的已读水位
+        group_ids = {row.group_id for row in group_messages}
+        group_reads = []
+        if group_ids:
+            group_reads = [
+                {
+                    'group_id': group_id,
+                    'last_read_message_id': group_read_receipts.watermark(group_id, current_user_id, last_read_id)
+                }
+                for group_id, last_read_id in db.session.query(
+                    GroupMember.group_id, GroupMember.last_read_message_id
+                ).filter(
+                    GroupMember.user_id == current_user_id,
+                    GroupMember.group_id.in_(group_ids)
+                )
+            ]
+        
+        next_cursor = encode_cursor(
+            message_cursor,
+            change_cursor,
+            (read_cursor - EPOCH) // timedelta(microseconds=1),
+            group_cursor
+        )
+        
+        return jsonify({
+            'messages': [Message.row_to_dict(row, read_watermark(row)) for row in messages],
+            'group_messages': [GroupMessage.row_to_dict(row) for row in group_messages],
+            'read_states': [
+                {
+                    'user_id': row.user_id,
+                    'partner_id': row.partner_id,
+                    'last_read_message_id': row.last_read_message_id
+                }
+                for row in changed_reads
+            ],
+            'group_read_states': group_reads,
+            'friendships': [
+                {'friend_id': friend_id, 'action': action}
+                for friend_id, action in friendships.items()
+            ],
+            'cursor': next_cursor,
+            'has_more': messages_more or group_more or changes_more
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'同步失败: {str(e)}'}), 500
@@ -0,0 +1,100 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from models.user import User
+from database import db
+from services.block_list import block_list
+from services.user_cache import user_cache
+
+user_bp = Blueprint('user', __name__)
+
+# 批量查询一次最多的用户数
+USER_BATCH_LIMIT = 200
+
+# 通讯录匹配一次最多的哈希数，以及每条 IN 查询的哈希数
+CONTACT_MATCH_LIMIT = 5000
+CONTACT_MATCH_CHUNK = 500
+
+
+@user_bp.route('/batch', methods=['GET'])
+@jwt_required()
+def get_users_batch():
+    """按ID批量获取用户公开资料，未命中缓存的用户用一次 IN 查询加载"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        ids = request.args.get('ids', '')
+        
+        try:
+            # 去重并保持请求中的顺序
+            user_ids = list(dict.fromkeys(int(user_id) for user_id in ids.split(',') if user_id.strip()))
+        except ValueError:
+            return jsonify({'error': '用户ID格式错误'}), 400
+        
+        if not user_ids:
+            return jsonify({'error': '用户ID列表不能为空'}), 400
+        
+        if len(user_ids) > USER_BATCH_LIMIT:
+            return jsonify({'error': f'一次最多查询{USER_BATCH_LIMIT}个用户'}), 400
+        
+        users = user_cache.get_many(user_ids)
+        # 屏蔽了自己的用户按不存在处理
+        blocked_by = block_list.blocked_by(current_user_id)
+        
+        found, missing = [], []
+        for user_id in user_ids:
+            if user_id in users and user_id not in blocked_by:
+                found.append(users[user_id].to_public_dict())
+            else:
+                missing.append(user_id)
+        
+        return jsonify({
+            'users': found,
+            'missing': missing
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'批量获取用户失败: {str(e)}'}), 500
+
+
+@user_bp.route('/match', methods=['POST'])
+@jwt_required()
+def match_contacts():
+    """通讯录匹配：按用户名或邮箱的哈希批量查找已注册用户"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        data = request.get_json()
+        hashes = data.get('hashes') if data else None
+        
+        if not isinstance(hashes, list) or not hashes:
+            return jsonify({'error': '哈希列表不能为空'}), 400
+        
+        if len(hashes) > CONTACT_MATCH_LIMIT:
+            return jsonify({'error': f'一次最多匹配{CONTACT_MATCH_LIMIT}个联系人'}), 400
+        
+        if not all(isinstance(value, str) and len(value) == 64 for value in hashes):
+            return jsonify({'error': '哈希格式错误，应为 SHA-256 十六进制字符串'}), 400
+        
+        hashes = list(dict.fromkeys(value.lower() for value in hashes))
+        
+        # 分块 IN 查询，用户名和邮箱分别走各自的索引
+        matches = {}
+        for start in range(0, len(hashes), CONTACT_MATCH_CHUNK):
+            chunk = hashes[start:start + CONTACT_MATCH_CHUNK]
+            for column in (User.email_hash, User.username_hash):
+                for user_id, value in db.session.query(User.id, column).filter(column.in_(chunk)):
+                    matches.setdefault(value, user_id)
+        
+        # 不返回自己和屏蔽了自己的用户
+        blocked_by = block_list.blocked_by(current_user_id)
+        result = [
+            {'hash': value, 'user_id': user_id}
+            for value, user_id in matches.items()
+            if user_id != current_user_id and user_id not in blocked_by
+        ]
+        
+        return jsonify({
+            'matches': result,
+            'count': len(result)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'通讯录匹配失败: {str(e)}'}), 500
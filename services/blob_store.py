@@ -0,0 +1,119 @@
+import hashlib
+import os
+import tempfile
+
+try:
+    from PIL import Image
+except ImportError:  # 可选依赖，未安装时不生成缩略图
+    Image = None
+
+
+# 可以在浏览器中直接显示的位图格式：(文件头特征, MIME 类型)，WebP 另外判断
+IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+
+
+class BlobTooLargeError(ValueError):
+    """上传内容超过大小上限"""
+
+
+class BlobStore:
+    """按内容寻址的本地文件存储
+    
+    文件以 SHA-256 命名保存在 <根目录>/ab/cd/<sha256>，内容相同的文件只存一份。
+    上传时边读边写临时文件边计算哈希，不把整个文件读进内存。
+    """
+    
+    chunk_size = 64 * 1024
+    
+    def __init__(self, app=None):
+        self.root = None
+        self.max_size = 50 * 1024 * 1024
+        
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        self.root = os.path.abspath(
+            app.config.get('ATTACHMENT_DIR') or os.path.join(app.instance_path, 'attachments')
+        )
+        self.max_size = app.config.get('ATTACHMENT_MAX_SIZE', self.max_size)
+        os.makedirs(os.path.join(self.root, 'tmp'), exist_ok=True)
+    
+    def path(self, digest):
+        """内容的存放路径"""
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+    
+    def save(self, stream):
+        """保存流中的内容，返回 (sha256, 字节数)
+        
+        超过大小上限时抛出 BlobTooLargeError，已存在相同内容时直接复用。
+        """
+        hasher = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.root, 'tmp'))
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                while True:
+                    chunk = stream.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_size:
+                        raise BlobTooLargeError('文件大小超过上限')
+                    hasher.update(chunk)
+                    tmp.write(chunk)
+            
+            digest = hasher.hexdigest()
+            target = self.path(digest)
+            if os.path.exists(target):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(tmp_path, target)
+            return digest, size
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    
+    def sniff_image_type(self, digest):
+        """按文件头识别 PNG / JPEG / GIF / WebP，返回 MIME 类型，其他内容返回 None"""
+        with open(self.path(digest), 'rb') as f:
+            header = f.read(12)
+        for signature, mime_type in IMAGE_SIGNATURES:
+            if header.startswith(signature):
+                return mime_type
+        if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+            return 'image/webp'
+        return None
+    
+    def thumbnail(self, digest, size):
+        """按需生成并缓存缩略图，返回路径；无法生成时返回 None"""
+        if Image is None:
+            return None
+        
+        thumb_path = os.path.join(self.root, 'thumbs', f'{digest}_{size}.jpg')
+        if os.path.exists(thumb_path):
+            return thumb_path
+        
+        os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.root, 'tmp'))
+        try:
+            with os.fdopen(fd, 'wb') as tmp, Image.open(self.path(digest)) as image:
+                image.thumbnail((size, size))
+                image.convert('RGB').save(tmp, 'JPEG', quality=85)
+            os.replace(tmp_path, thumb_path)
+            return thumb_path
+        except (OSError, ValueError, Image.DecompressionBombError):
+            # 不是可识别的图片
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return None
+
+
+blob_store = BlobStore()
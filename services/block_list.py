@@ -0,0 +1,89 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from models.friendship import Friendship
+
+
+class BlockSet:
+    """有序整数数组实现的只读用户ID集合，比 set 占用的内存小得多"""
+    
+    __slots__ = ('_ids',)
+    
+    def __init__(self, user_ids=()):
+        self._ids = array('q', sorted(set(user_ids)))
+    
+    def __contains__(self, user_id):
+        index = bisect_left(self._ids, user_id)
+        return index < len(self._ids) and self._ids[index] == user_id
+    
+    def __iter__(self):
+        return iter(self._ids)
+    
+    def __len__(self):
+        return len(self._ids)
+
+
+EMPTY = BlockSet()
+
+
+class BlockList:
+    """用户屏蔽关系缓存
+    
+    每个用户缓存两份集合：自己屏蔽的用户、屏蔽了自己的用户。发消息、加好友和搜索时
+    只查缓存，未命中时用一次查询加载；屏蔽关系变化后调用 invalidate 清除双方的缓存，
+    多 worker 部署时其他进程的缓存最多在 BLOCK_CACHE_TTL 秒后过期。
+    """
+    
+    def __init__(self, app=None):
+        self.ttl = 300
+        self.max_size = 10000
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        self.ttl = app.config.get('BLOCK_CACHE_TTL', self.ttl)
+        self.max_size = app.config.get('BLOCK_CACHE_SIZE', self.max_size)
+    
+    def blocked(self, user_id):
+        """user_id 屏蔽的用户"""
+        return self._get(user_id)[0]
+    
+    def blocked_by(self, user_id):
+        """屏蔽了 user_id 的用户"""
+        return self._get(user_id)[1]
+    
+    def is_blocked(self, user_a, user_b):
+        """两个用户之间是否有任意一方屏蔽了另一方"""
+        blocked, blocked_by = self._get(user_a)
+        return user_b in blocked or user_b in blocked_by
+    
+    def invalidate(self, *user_ids):
+        """屏蔽关系变化后清除相关用户的缓存（在事务提交之后调用）"""
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+    
+    def _get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            item = self._entries.get(user_id)
+            if item is not None and item[1] > now:
+                self._entries.move_to_end(user_id)
+                return item[0]
+        
+        blocked, blocked_by = Friendship.block_lists(user_id)
+        sets = (BlockSet(blocked) if blocked else EMPTY, BlockSet(blocked_by) if blocked_by else EMPTY)
+        with self._lock:
+            self._entries[user_id] = (sets, now + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return sets
+
+
+block_list = BlockList()
@@ -0,0 +1,97 @@
+import gzip
+import zlib
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # 可选依赖，未安装时只支持 gzip
+    brotli = None
+
+
+class Compression:
+    """响应压缩
+    
+    根据请求的 Accept-Encoding 协商 br / gzip，对超过大小阈值的 JSON 等文本响应压缩；
+    流式响应逐块压缩，不需要先在内存中拼出完整响应体。
+    """
+    
+    def __init__(self, app=None):
+        self.min_size = 1024
+        self.level = 6
+        self.mimetypes = {'application/json', 'text/plain', 'text/html'}
+        
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        self.min_size = app.config.get('COMPRESS_MIN_SIZE', self.min_size)
+        self.level = app.config.get('COMPRESS_LEVEL', self.level)
+        app.after_request(self._compress_response)
+    
+    def _choose_encoding(self):
+        """按 Accept-Encoding 的权重选择压缩算法，同权重时优先 br"""
+        accepted = request.accept_encodings
+        candidates = []
+        if brotli is not None and accepted['br'] > 0:
+            candidates.append((accepted['br'], 1, 'br'))
+        if accepted['gzip'] > 0:
+            candidates.append((accepted['gzip'], 0, 'gzip'))
+        if not candidates:
+            return None
+        return max(candidates)[2]
+    
+    def _should_compress(self, response):
+        if response.status_code < 200 or response.status_code in (204, 304):
+            return False
+        if response.mimetype not in self.mimetypes:
+            return False
+        if 'Content-Encoding' in response.headers or response.direct_passthrough:
+            return False
+        if not response.is_streamed and response.content_length is not None \
+                and response.content_length < self.min_size:
+            return False
+        return True
+    
+    def _compress_response(self, response):
+        if not self._should_compress(response):
+            return response
+        
+        encoding = self._choose_encoding()
+        response.vary.add('Accept-Encoding')
+        if encoding is None:
+            return response
+        
+        if response.is_streamed:
+            response.response = self._compress_stream(response.response, encoding)
+            response.headers.pop('Content-Length', None)
+        else:
+            response.set_data(self._compress_bytes(response.get_data(), encoding))
+        
+        response.headers['Content-Encoding'] = encoding
+        return response
+    
+    def _compress_bytes(self, data, encoding):
+        if encoding == 'br':
+            return brotli.compress(data, quality=min(self.level, 11))
+        return gzip.compress(data, compresslevel=self.level)
+    
+    def _compress_stream(self, chunks, encoding):
+        """逐块压缩流式响应"""
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=min(self.level, 11))
+            compress, finish = compressor.process, compressor.finish
+        else:
+            # wbits=31 表示输出带 gzip 头的格式
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+            compress, finish = compressor.compress, compressor.flush
+        
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = compress(chunk)
+            if data:
+                yield data
+        yield finish()
+
+
+compression = Compression()
@@ -0,0 +1,42 @@
+import base64
+import json
+from datetime import datetime, timedelta
+
+# 自增ID在插入时分配、提交后才可见，较小的ID可能比较大的ID晚提交。增量同步的游标只推进到
+# 创建时间早于 SETTLE_SECONDS 秒之前的行，更新的行下次同步会再次下发（客户端按ID去重或覆盖），
+# 晚提交的行因此不会被跳过
+SETTLE_SECONDS = 5
+
+
+def encode_cursor(*values):
+    """把分页/同步位置编码为不透明的游标字符串"""
+    raw = json.dumps(values, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """解码游标，返回长度为 size 的列表，格式错误时抛出 ValueError"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except Exception:
+        raise ValueError('游标格式错误')
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError('游标格式错误')
+    return values
+
+
+def settle_horizon():
+    """早于该时间创建或更新的行视为已经提交"""
+    return datetime.utcnow() - timedelta(seconds=SETTLE_SECONDS)
+
+
+def settled_cursor(rows, previous, horizon=None):
+    """按ID升序的 rows 中，创建时间早于稳定窗口的连续前缀的最后一个ID，没有时返回 previous"""
+    horizon = horizon or settle_horizon()
+    cursor = previous
+    for row in rows:
+        if row.created_at is None or row.created_at > horizon:
+            break
+        cursor = row.id
+    return cursor
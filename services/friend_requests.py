@@ -0,0 +1,42 @@
+from models.friendship import Friendship
+from services.ttl_store import create_store
+
+
+class PendingRequestCounter:
+    """待处理好友请求数缓存
+    
+    数量保存在带过期时间的存储中（默认进程内存，可配置为 Redis 共享），
+    未命中时按索引计数并写回；请求状态变化后需要调用 invalidate。
+    """
+    
+    def __init__(self, app=None):
+        self.store = None
+        self.ttl = 600
+        
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        self.ttl = app.config.get('FRIEND_REQUEST_COUNT_TTL', self.ttl)
+        self.store = create_store(app.config.get('SHARED_STORE_URL'))
+    
+    @staticmethod
+    def _key(user_id):
+        return f'friend_requests:pending:{user_id}'
+    
+    def get(self, user_id):
+        """user_id 收到的待处理好友请求数"""
+        cached = self.store.get(self._key(user_id))
+        if cached is not None:
+            return int(cached)
+        count = Friendship.pending_count(user_id)
+        self.store.set(self._key(user_id), count, self.ttl)
+        return count
+    
+    def invalidate(self, *user_ids):
+        """请求发出、接受、拒绝或撤回后清除相关用户的计数（在事务提交之后调用）"""
+        for user_id in user_ids:
+            self.store.delete(self._key(user_id))
+
+
+pending_requests = PendingRequestCounter()
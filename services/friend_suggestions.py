@@ -0,0 +1,206 @@
+import heapq
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from database import db
+from models.friendship import Friendship
+from models.friend_suggestion import FriendSuggestion
+
+try:
+    import numpy as np
+except ImportError:  # 可选依赖，未安装时使用标准库 array 实现
+    np = None
+
+
+class FriendGraph:
+    """好友关系图的紧凑邻接表（CSR）
+    
+    offsets[u] 到 offsets[u + 1] 之间的 neighbors 是用户 u 的相邻用户ID（升序）。
+    安装了 NumPy 时使用 NumPy 数组，否则使用标准库 array。
+    """
+    
+    def __init__(self, edges, size):
+        """edges 为无向边 (a, b) 列表，size 为最大用户ID + 1"""
+        self.size = size
+        if np is not None:
+            edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+            src = np.concatenate([edges[:, 0], edges[:, 1]])
+            dst = np.concatenate([edges[:, 1], edges[:, 0]])
+            order = np.lexsort((dst, src))
+            self.neighbors = dst[order]
+            self.offsets = np.zeros(size + 1, dtype=np.int64)
+            np.cumsum(np.bincount(src, minlength=size), out=self.offsets[1:])
+        else:
+            adjacency = {}
+            for a, b in edges:
+                adjacency.setdefault(a, []).append(b)
+                adjacency.setdefault(b, []).append(a)
+            self.neighbors = array('q')
+            self.offsets = array('q', [0]) * (size + 1)
+            for user_id in range(size):
+                self.neighbors.extend(sorted(adjacency.get(user_id, ())))
+                self.offsets[user_id + 1] = len(self.neighbors)
+    
+    def of(self, user_id):
+        """用户的相邻用户ID（升序）"""
+        if not 0 <= user_id < self.size:
+            return self.neighbors[0:0]
+        return self.neighbors[self.offsets[user_id]:self.offsets[user_id + 1]]
+    
+    def degree(self, user_id):
+        return len(self.of(user_id))
+
+
+def _contains(sorted_ids, user_id):
+    """在升序数组中二分查找"""
+    index = bisect_left(sorted_ids, user_id)
+    return index < len(sorted_ids) and sorted_ids[index] == user_id
+
+
+def suggest(friends, related, user_id, limit):
+    """按共同好友数为 user_id 推荐 limit 个用户，返回 [(用户ID, 共同好友数), ...]
+    
+    friends 为已接受好友关系的图，related 为包含所有关系行（请求中、已屏蔽）的图，
+    已有关系的用户不会被推荐。共同好友数相同时按用户ID排序。
+    """
+    my_friends = friends.of(user_id)
+    if not len(my_friends):
+        return []
+    excluded = related.of(user_id)
+    
+    if np is not None:
+        candidates = np.concatenate([friends.of(int(friend_id)) for friend_id in my_friends])
+        ids, counts = np.unique(candidates, return_counts=True)
+        keep = (ids != user_id) & ~np.isin(ids, excluded, assume_unique=True)
+        ids, counts = ids[keep], counts[keep]
+        top = np.lexsort((ids, -counts))[:limit]
+        return [(int(ids[i]), int(counts[i])) for i in top]
+    
+    counter = Counter()
+    for friend_id in my_friends:
+        counter.update(friends.of(friend_id))
+    candidates = (
+        (candidate_id, count) for candidate_id, count in counter.items()
+        if candidate_id != user_id and not _contains(excluded, candidate_id)
+    )
+    return heapq.nsmallest(limit, candidates, key=lambda item: (-item[1], item[0]))
+
+
+class FriendSuggestionJob:
+    """好友推荐后台任务
+    
+    读取整个 friendships 表构建邻接表，为每个用户计算前 FRIEND_SUGGESTION_LIMIT 个推荐
+    并写入 friend_suggestions 表。默认由 cron 定时执行 suggest_friends.py；
+    FRIEND_SUGGESTION_INTERVAL 大于 0 时在应用进程的后台线程中每隔该秒数计算一次（只适合单 worker 部署）。
+    """
+    
+    def __init__(self, app=None):
+        self.app = None
+        self.interval = 0
+        self.limit = 20
+        self.batch_size = 500
+        self._worker = None
+        self._worker_pid = None
+        self._lock = threading.Lock()
+        
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config.get('FRIEND_SUGGESTION_INTERVAL', self.interval)
+        self.limit = app.config.get('FRIEND_SUGGESTION_LIMIT', self.limit)
+        if self.interval > 0:
+            app.before_request(self._ensure_worker)
+    
+    def load_graphs(self):
+        """读取 friendships 表，返回 (好友关系图, 所有关系图)"""
+        accepted, related = [], []
+        size = 0
+        rows = db.session.query(
+            Friendship.user_id, Friendship.friend_id, Friendship.user_status, Friendship.friend_status
+        ).execution_options(stream_results=True).yield_per(10000)
+        for user_id, friend_id, user_status, friend_status in rows:
+            related.append((user_id, friend_id))
+            if user_status == Friendship.ACCEPTED and friend_status == Friendship.ACCEPTED:
+                accepted.append((user_id, friend_id))
+            size = max(size, friend_id + 1)
+        return FriendGraph(accepted, size), FriendGraph(related, size)
+    
+    def rebuild(self):
+        """重新计算所有用户的推荐，需要在应用上下文中调用，返回写入的用户数"""
+        started_at = datetime.utcnow()
+        friends, related = self.load_graphs()
+        table = FriendSuggestion.__table__
+        
+        written = 0
+        user_ids = [user_id for user_id in range(friends.size) if friends.degree(user_id)]
+        for start in range(0, len(user_ids), self.batch_size):
+            batch = user_ids[start:start + self.batch_size]
+            rows = []
+            for user_id in batch:
+                items = suggest(friends, related, user_id, self.limit)
+                if items:
+                    rows.append({
+                        'user_id': user_id,
+                        'suggestions': FriendSuggestion.encode(items),
+                        'computed_at': started_at
+                    })
+            self._replace_batch(batch, rows)
+            written += len(rows)
+        
+        # 已经没有好友的用户清除旧结果；只按用户删除，不会删掉同时运行的另一轮计算刚写入的行
+        computed = set(user_ids)
+        stale = [
+            user_id for user_id, in db.session.query(FriendSuggestion.user_id)
+            if user_id not in computed
+        ]
+        for start in range(0, len(stale), self.batch_size):
+            db.session.execute(table.delete().where(table.c.user_id.in_(stale[start:start + self.batch_size])))
+            db.session.commit()
+        return written
+    
+    def _replace_batch(self, user_ids, rows):
+        """替换一批用户的推荐，与同时运行的另一轮计算冲突时重试"""
+        table = FriendSuggestion.__table__
+        for attempt in range(3):
+            try:
+                db.session.execute(table.delete().where(table.c.user_id.in_(user_ids)))
+                if rows:
+                    db.session.execute(table.insert(), rows)
+                db.session.commit()
+                return
+            except IntegrityError:
+                db.session.rollback()
+                if attempt == 2:
+                    raise
+    
+    def _ensure_worker(self):
+        """before_request 钩子：按需启动后台线程（fork 之后会在子进程中重新启动）"""
+        if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+                return
+            self._worker_pid = os.getpid()
+            self._worker = threading.Thread(target=self._run, name='FriendSuggestionJob', daemon=True)
+            self._worker.start()
+    
+    def _run(self):
+        # 第一次计算推迟一个间隔，worker 重启时不会立即重算
+        while True:
+            time.sleep(self.interval)
+            try:
+                with self.app.app_context():
+                    count = self.rebuild()
+                self.app.logger.info(f'好友推荐已更新: {count} 个用户')
+            except Exception as e:
+                self.app.logger.error(f'好友推荐计算失败: {e}')
+
+
+friend_suggestions = FriendSuggestionJob()
@@ -0,0 +1,98 @@
+import threading
+from datetime import datetime, timedelta
+from flask import request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import bindparam, or_
+from database import db
+from models.user import User
+from services.write_behind import WriteBehindBuffer
+
+
+class LastSeenBuffer(WriteBehindBuffer):
+    """最后在线时间的写后缓冲区
+    
+    每个已认证请求只在内存中记录 last_seen，同一用户的多次记录合并为最新值，
+    由后台线程定期批量 UPDATE 到 users 表，读取时优先读内存。
+    是否在线只由 services.presence 的心跳判断，last_seen 仅用于展示最后活跃时间；
+    在线状态接口（心跳、输入状态）本身不计入最后活跃时间。
+    """
+    
+    # 不记录最后活跃时间的蓝图
+    exempt_blueprints = ('presence',)
+    
+    interval_config = 'LAST_SEEN_FLUSH_INTERVAL'
+    batch_size_config = 'LAST_SEEN_BATCH_SIZE'
+    
+    def __init__(self, app=None, flush_interval=30.0, batch_size=1000):
+        self.online_window = timedelta(seconds=300)
+        # 本进程见过的最近活跃时间，刷写后在 online_window 内仍保留，减少读取时的数据库查询
+        self._recent = {}
+        self._recent_lock = threading.Lock()
+        super().__init__(app, flush_interval=flush_interval, batch_size=batch_size)
+    
+    def init_app(self, app):
+        super().init_app(app)
+        self.online_window = timedelta(seconds=app.config.get('ONLINE_WINDOW_SECONDS', 300))
+        app.after_request(self._record_request)
+    
+    def merge(self, old, new):
+        return max(old, new)
+    
+    def write_batch(self, items):
+        users = User.__table__
+        db.session.execute(
+            users.update()
+            .where(users.c.id == bindparam('user_id'))
+            .where(or_(users.c.last_seen.is_(None), users.c.last_seen < bindparam('seen_at')))
+            .values(last_seen=bindparam('seen_at')),
+            [{'user_id': user_id, 'seen_at': seen_at} for user_id, seen_at in items.items()]
+        )
+        db.session.commit()
+        
+        # 顺带清理已经离线的内存记录
+        expired_before = datetime.utcnow() - self.online_window
+        with self._recent_lock:
+            for user_id in [uid for uid, seen_at in self._recent.items() if seen_at < expired_before]:
+                del self._recent[user_id]
+    
+    def touch(self, user_id, seen_at=None):
+        """记录用户在 seen_at（默认现在）时在线"""
+        seen_at = seen_at or datetime.utcnow()
+        with self._recent_lock:
+            if self._recent.get(user_id, seen_at) <= seen_at:
+                self._recent[user_id] = seen_at
+        self.put(user_id, seen_at)
+        return seen_at
+    
+    def get_last_seen(self, user_ids):
+        """批量获取最后在线时间，优先读内存，缺失的再查一次数据库
+        
+        返回 {用户ID: datetime 或 None}
+        """
+        user_ids = set(user_ids)
+        with self._recent_lock:
+            result = {uid: self._recent[uid] for uid in user_ids if uid in self._recent}
+        
+        missing = user_ids - set(result)
+        if missing:
+            rows = db.session.query(User.id, User.last_seen).filter(User.id.in_(missing)).all()
+            result.update(dict(rows))
+            for user_id in missing - set(result):
+                result[user_id] = None
+        return result
+    
+    def _record_request(self, response):
+        """after_request 钩子：已认证的请求都记作一次活跃"""
+        if request.blueprint in self.exempt_blueprints:
+            return response
+        try:
+            identity = get_jwt_identity()
+        except RuntimeError:
+            # 未经过 jwt_required 的请求
+            return response
+        if identity is not None:
+            self.touch(int(identity))
+        return response
+
+
+last_seen_buffer = LastSeenBuffer()
@@ -0,0 +1,72 @@
+from services.ttl_store import create_store
+
+
+class PresenceService:
+    """在线状态与输入状态服务
+    
+    状态只保存在带过期时间的存储中（默认进程内存，可配置为 Redis 共享），
+    心跳和输入状态的读写都不访问关系数据库。
+    """
+    
+    ONLINE = 'online'
+    OFFLINE = 'offline'
+    
+    def __init__(self, app=None):
+        self.store = None
+        self.presence_ttl = 60
+        self.typing_ttl = 8
+        
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        self.presence_ttl = app.config.get('PRESENCE_TTL_SECONDS', self.presence_ttl)
+        self.typing_ttl = app.config.get('TYPING_TTL_SECONDS', self.typing_ttl)
+        self.store = create_store(app.config.get('SHARED_STORE_URL'))
+    
+    @staticmethod
+    def _presence_key(user_id):
+        return f'presence:{user_id}'
+    
+    @staticmethod
+    def _typing_key(user_id, partner_id):
+        return f'typing:{user_id}:{partner_id}'
+    
+    def heartbeat(self, user_id):
+        """心跳：在 presence_ttl 秒内视为在线"""
+        self.store.set(self._presence_key(user_id), self.ONLINE, self.presence_ttl)
+    
+    def go_offline(self, user_id):
+        """主动下线（输入状态会随过期自然清除）"""
+        self.store.delete(self._presence_key(user_id))
+    
+    def set_typing(self, user_id, partner_id, typing=True):
+        """设置用户在与 partner_id 的会话中是否正在输入"""
+        key = self._typing_key(user_id, partner_id)
+        if typing:
+            self.store.set(key, '1', self.typing_ttl)
+        else:
+            self.store.delete(key)
+    
+    def is_typing(self, user_id, partner_id):
+        """用户是否正在给 partner_id 输入消息"""
+        return self.store.get(self._typing_key(user_id, partner_id)) is not None
+    
+    def get_status(self, user_ids):
+        """批量获取在线状态，返回 {用户ID: 'online' 或 'offline'}"""
+        user_ids = list(user_ids)
+        online = self.store.get_many([self._presence_key(user_id) for user_id in user_ids])
+        return {
+            user_id: self.ONLINE if self._presence_key(user_id) in online else self.OFFLINE
+            for user_id in user_ids
+        }
+    
+    def conversation_state(self, user_id, partner_id):
+        """会话中对方的状态，附加在消息接口的响应中"""
+        return {
+            'partner_status': self.get_status([partner_id])[partner_id],
+            'partner_typing': self.is_typing(partner_id, user_id)
+        }
+
+
+presence = PresenceService()
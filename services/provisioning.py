@@ -0,0 +1,170 @@
+import csv
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from database import db
+from models.user import User
+from services.registration_filter import registration_filter
+
+
+def read_users(data, filename=''):
+    """解析待导入的用户文件，返回字典列表
+    
+    支持 CSV（表头包含 username,email,password）和 JSON Lines（每行一个对象）。
+    """
+    if isinstance(data, bytes):
+        data = data.decode('utf-8-sig')
+    if filename.endswith(('.jsonl', '.json')) or data.lstrip().startswith('{'):
+        users = []
+        for line_number, line in enumerate(data.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                users.append(json.loads(line))
+            except ValueError:
+                raise ValueError(f'第{line_number}行不是合法的 JSON')
+        return users
+    return list(csv.DictReader(io.StringIO(data)))
+
+
+class UserProvisioner:
+    """批量创建用户
+    
+    按批处理：校验并用一次查询排除已存在的用户名和邮箱，在进程池中并行计算 bcrypt 哈希
+    （workers=1 时在当前线程中计算，不创建进程池），再用一条批量 INSERT 写入并提交。批量写入与并发注册冲突时退回逐行插入，
+    每一行的失败原因都会记录在结果中，不影响其他行。
+    """
+    
+    def __init__(self, app=None):
+        self.workers = os.cpu_count() or 1
+        self.batch_size = 1000
+        
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        self.workers = app.config.get('PROVISION_WORKERS') or self.workers
+        self.batch_size = app.config.get('PROVISION_BATCH_SIZE', self.batch_size)
+    
+    def provision(self, users, workers=None, progress=None):
+        """导入用户，需要在应用上下文中调用
+        
+        users 为 {'username', 'email', 'password'} 字典列表，行号从 1 开始；
+        progress(已处理行数, 已创建数, 失败数) 在每批完成后调用。
+        返回 {'created': 创建数, 'failed': 失败数, 'errors': [{'row', 'username', 'error'}, ...]}
+        """
+        errors = []
+        created = 0
+        seen = set()
+        workers = workers or self.workers
+        pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        try:
+            for start in range(0, len(users), self.batch_size):
+                batch = list(enumerate(users[start:start + self.batch_size], start=start + 1))
+                created += self._provision_batch(batch, pool, workers, errors, seen)
+                if progress:
+                    progress(start + len(batch), created, len(errors))
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        errors.sort(key=lambda error: error['row'])
+        return {'created': created, 'failed': len(errors), 'errors': errors}
+    
+    @staticmethod
+    def _validate(item, seen):
+        """校验一行数据，返回 (用户名, 邮箱, 密码) 或错误信息"""
+        if not isinstance(item, dict):
+            return '格式错误'
+        username, email, password = (
+            '' if item.get(field) is None else str(item[field])
+            for field in ('username', 'email', 'password')
+        )
+        username, email = username.strip(), email.strip()
+        if not username or not email or not password:
+            return '用户名、邮箱和密码都是必需的'
+        if len(username) > User.username.type.length or len(email) > User.email.type.length:
+            return '用户名或邮箱过长'
+        if '@' not in email:
+            return '邮箱格式错误'
+        # 文件内重复的用户名或邮箱只导入第一次出现的行
+        keys = ('u:' + username.lower(), 'e:' + email.lower())
+        if any(key in seen for key in keys):
+            return '文件中的用户名或邮箱重复'
+        seen.update(keys)
+        return username, email, password
+    
+    def _provision_batch(self, batch, pool, workers, errors, seen):
+        valid = []
+        for row_number, item in batch:
+            result = self._validate(item, seen)
+            if isinstance(result, str):
+                username = item.get('username') if isinstance(item, dict) else None
+                errors.append({'row': row_number, 'username': username, 'error': result})
+            else:
+                valid.append((row_number, *result))
+        if not valid:
+            return 0
+        
+        # 一次查询排除已存在的用户名和邮箱
+        taken = db.session.query(User.username, User.email).filter(or_(
+            User.username.in_([username for _, username, _, _ in valid]),
+            User.email.in_([email for _, _, email, _ in valid])
+        )).all()
+        taken_usernames = {row.username.lower() for row in taken}
+        taken_emails = {row.email.lower() for row in taken}
+        pending = []
+        for row_number, username, email, password in valid:
+            if username.lower() in taken_usernames:
+                errors.append({'row': row_number, 'username': username, 'error': '用户名已存在'})
+            elif email.lower() in taken_emails:
+                errors.append({'row': row_number, 'username': username, 'error': '邮箱已存在'})
+            else:
+                pending.append((row_number, username, email, password))
+        if not pending:
+            return 0
+        
+        # bcrypt 是 CPU 密集型计算，分散到进程池中并行执行
+        passwords = [password for _, _, _, password in pending]
+        if pool is None:
+            hashes = map(User.hash_password, passwords)
+        else:
+            chunksize = max(1, len(pending) // (workers * 4))
+            hashes = pool.map(User.hash_password, passwords, chunksize=chunksize)
+        rows = [
+            {
+                'username': username,
+                'email': email,
+                'password_hash': password_hash,
+                'username_hash': User.contact_hash(username),
+                'email_hash': User.contact_hash(email)
+            }
+            for (_, username, email, _), password_hash in zip(pending, hashes)
+        ]
+        
+        insert = User.__table__.insert()
+        try:
+            db.session.execute(insert, rows)
+            db.session.commit()
+            inserted = pending
+        except IntegrityError:
+            # 与并发注册冲突，逐行插入找出冲突的行
+            db.session.rollback()
+            inserted = []
+            for entry, row in zip(pending, rows):
+                try:
+                    with db.session.begin_nested():
+                        db.session.execute(insert, row)
+                    inserted.append(entry)
+                except IntegrityError:
+                    errors.append({'row': entry[0], 'username': entry[1], 'error': '用户名或邮箱已存在'})
+            db.session.commit()
+        
+        for _, username, email, _ in inserted:
+            registration_filter.add(username, email)
+        return len(inserted)
+
+
+provisioner = UserProvisioner()
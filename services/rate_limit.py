@@ -0,0 +1,104 @@
+import math
+from flask import request, jsonify
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from services.ttl_store import create_store
+
+# 时间单位对应的秒数
+PERIODS = {
+    's': 1, 'sec': 1, 'second': 1,
+    'm': 60, 'min': 60, 'minute': 60,
+    'h': 3600, 'hour': 3600,
+}
+
+
+def parse_limit(value):
+    """解析 "次数/时间单位"（如 30/minute），返回 (每秒补充的令牌数, 桶容量)"""
+    count, _, period = value.strip().partition('/')
+    count = int(count)
+    seconds = PERIODS.get(period.strip().lower())
+    if count <= 0 or seconds is None:
+        raise ValueError(f'无法解析的限流规则: {value}')
+    return count / seconds, count
+
+
+def parse_rules(value):
+    """解析 "端点或蓝图=次数/时间单位;..." 形式的规则配置"""
+    if isinstance(value, dict):
+        return {name: parse_limit(limit) for name, limit in value.items()}
+    rules = {}
+    for item in value.split(';'):
+        if not item.strip():
+            continue
+        name, _, limit = item.partition('=')
+        rules[name.strip()] = parse_limit(limit)
+    return rules
+
+
+class RateLimiter:
+    """令牌桶限流
+    
+    规则按端点（如 message.send_message）、蓝图（如 friend）、全局默认的顺序匹配；
+    已登录的请求按用户计数（同一用户从不同IP发起的请求共用一个配额），未登录的按客户端IP计数。
+    部署在反向代理之后时需要配置 TRUSTED_PROXIES，否则所有客户端共用代理的IP。
+    令牌桶保存在带过期时间的存储中，配置 SHARED_STORE_URL 后多个 worker 共享。
+    """
+    
+    def __init__(self, app=None):
+        self.store = None
+        self.enabled = True
+        self.rules = {}
+        self.default = None
+        
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        self.enabled = app.config.get('RATE_LIMIT_ENABLED', True)
+        self.rules = parse_rules(app.config.get('RATE_LIMITS', ''))
+        default = app.config.get('RATE_LIMIT_DEFAULT')
+        self.default = parse_limit(default) if default else None
+        self.store = create_store(app.config.get('SHARED_STORE_URL'))
+        app.before_request(self._check_request)
+    
+    def _match_rule(self):
+        """当前请求适用的 (规则名, (速率, 容量))，没有规则时返回 None"""
+        for name in (request.endpoint, request.blueprint):
+            if name and name in self.rules:
+                return name, self.rules[name]
+        if self.default:
+            return '*', self.default
+        return None
+    
+    @staticmethod
+    def _client_key():
+        """已登录按用户ID，否则按IP"""
+        try:
+            verify_jwt_in_request(optional=True, verify_type=False)
+            identity = get_jwt_identity()
+        except Exception:
+            # token 无效或过期，交给视图里的 jwt_required 返回具体错误
+            identity = None
+        if identity is not None:
+            return f'user:{identity}'
+        return f'ip:{request.remote_addr}'
+    
+    def _check_request(self):
+        """before_request 钩子：令牌不足时返回 429"""
+        if not self.enabled or request.method == 'OPTIONS':
+            return None
+        matched = self._match_rule()
+        if matched is None:
+            return None
+        
+        name, (rate, capacity) = matched
+        wait = self.store.take_token(f'ratelimit:{name}:{self._client_key()}', rate, capacity)
+        if wait <= 0:
+            return None
+        
+        response = jsonify({'error': '请求过于频繁，请稍后再试'})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(max(1, math.ceil(wait)))
+        return response
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,44 @@
+from database import db
+from models.read_state import ReadState
+from models.group import GroupMember
+from services.write_behind import WriteBehindBuffer
+
+
+class ReadReceiptPipeline(WriteBehindBuffer):
+    """已读回执管道
+    
+    以会话键记录已读到的最大消息ID（高水位），同一会话的多次已读只保留最大值，
+    由后台线程调用 model.advance(*键, 消息ID) 批量写入数据库。
+    单聊的键为 (阅读者ID, 发送者ID)，写入 ReadState；群聊为 (群ID, 成员ID)，写入 GroupMember。
+    """
+    
+    interval_config = 'READ_RECEIPT_FLUSH_INTERVAL'
+    batch_size_config = 'READ_RECEIPT_BATCH_SIZE'
+    
+    def __init__(self, model, app=None):
+        self.model = model
+        super().__init__(app)
+    
+    def merge(self, old, new):
+        return max(old, new)
+    
+    def write_batch(self, items):
+        for key, last_read_id in items.items():
+            self.model.advance(*key, last_read_id)
+        db.session.commit()
+    
+    def mark_read(self, key_a, key_b, last_read_id):
+        """记录 (key_a, key_b) 会话已读到 last_read_id（含）为止的消息"""
+        self.put((key_a, key_b), last_read_id)
+    
+    def pending_watermark(self, key_a, key_b):
+        """尚未落库的已读水位，没有时返回 None"""
+        return self.peek((key_a, key_b))
+    
+    def watermark(self, key_a, key_b, stored=0):
+        """合并已落库的水位与尚未落库的水位"""
+        return max(stored, self.pending_watermark(key_a, key_b) or 0)
+
+
+read_receipts = ReadReceiptPipeline(ReadState)
+group_read_receipts = ReadReceiptPipeline(GroupMember)
@@ -0,0 +1,138 @@
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+from sqlalchemy import or_, and_, desc, func
+from database import db
+from models.message import Message
+
+
+class CachedMessage(namedtuple('CachedMessage', Message.serialize_columns)):
+    """缓存的消息快照（只读），字段与 Message.serialize_columns 一致"""
+    
+    __slots__ = ()
+
+
+# 一次读取的结果：按ID升序的 CachedMessage 列表、会话消息总数、
+# {发送者ID: 发给对方的最新消息ID}（取自数据库，不受缓存影响）
+RecentMessages = namedtuple('RecentMessages', ['messages', 'total', 'latest_ids'])
+
+
+class RecentConversation:
+    """一个会话最近的消息：定长环形缓冲区（按ID升序）和会话的消息总数"""
+    
+    __slots__ = ('messages', 'total', 'expires_at')
+    
+    def __init__(self, messages, total, size, expires_at):
+        self.messages = deque(messages, maxlen=size)
+        self.total = total
+        self.expires_at = expires_at
+    
+    @property
+    def last_id(self):
+        return self.messages[-1].id if self.messages else 0
+    
+    def extend(self, messages):
+        self.messages.extend(messages)
+        self.total += len(messages)
+
+
+class RecentMessageCache:
+    """热门会话的最近消息缓存
+    
+    每个会话在进程内保存最近 RECENT_MESSAGES_PER_CONVERSATION 条消息，按 LRU 淘汰整个会话，
+    最多缓存 RECENT_CONVERSATIONS_MAX 个会话。/api/message/last 和聊天记录第一页从缓冲区返回，
+    已读状态不缓存，读取时按水位计算。
+    
+    多个 worker 各自缓存，读取时先在 (发送者, 接收者, ID) 索引上查出两个方向的最新消息ID：
+    与缓冲区一致时直接返回，有新消息时只补读新增的部分。发送消息时不直接追加到缓冲区，
+    否则其他进程先写入的消息会被跳过。同一会话的并发写入乱序提交时，
+    先分配ID后提交的消息最多在 RECENT_MESSAGES_TTL 秒后随整体重新加载出现。
+    """
+    
+    def __init__(self, app=None):
+        self.size = 50
+        self.max_conversations = 10000
+        self.ttl = 30
+        self._conversations = OrderedDict()
+        self._lock = threading.Lock()
+        
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        self.size = app.config.get('RECENT_MESSAGES_PER_CONVERSATION', self.size)
+        self.max_conversations = app.config.get('RECENT_CONVERSATIONS_MAX', self.max_conversations)
+        self.ttl = app.config.get('RECENT_MESSAGES_TTL', self.ttl)
+    
+    @staticmethod
+    def _key(user_a, user_b):
+        return (user_a, user_b) if user_a < user_b else (user_b, user_a)
+    
+    @staticmethod
+    def _conversation_filter(user_a, user_b):
+        return or_(
+            and_(Message.sender_id == user_a, Message.receiver_id == user_b),
+            and_(Message.sender_id == user_b, Message.receiver_id == user_a)
+        )
+    
+    def get(self, user_a, user_b):
+        """两个用户之间最近的消息，返回 RecentMessages，需要在应用上下文中调用"""
+        key = self._key(user_a, user_b)
+        latest_ids = Message.latest_ids_between(*key)
+        newest_id = max(latest_ids.values())
+        now = time.monotonic()
+        
+        with self._lock:
+            conversation = self._conversations.get(key)
+            if conversation is not None and conversation.expires_at <= now:
+                conversation = None
+            if conversation is not None:
+                self._conversations.move_to_end(key)
+                last_id = conversation.last_id
+                if last_id == newest_id:
+                    return RecentMessages(list(conversation.messages), conversation.total, latest_ids)
+        
+        if conversation is not None and last_id < newest_id:
+            # 其他进程写入了新消息：只补读缓冲区之后的部分，新增超过一个缓冲区时整体重新加载
+            rows = db.session.query(*Message.list_columns()).filter(
+                self._conversation_filter(*key),
+                Message.id > last_id,
+                Message.id <= newest_id
+            ).order_by(Message.id).limit(self.size).all()
+            if len(rows) < self.size:
+                with self._lock:
+                    if conversation.last_id == last_id:
+                        conversation.extend([CachedMessage(*row) for row in rows])
+                    if conversation.last_id == newest_id:
+                        return RecentMessages(list(conversation.messages), conversation.total, latest_ids)
+        
+        messages, total = self._load(key, newest_id)
+        with self._lock:
+            self._conversations[key] = RecentConversation(messages, total, self.size, now + self.ttl)
+            self._conversations.move_to_end(key)
+            while len(self._conversations) > self.max_conversations:
+                self._conversations.popitem(last=False)
+        return RecentMessages(messages, total, latest_ids)
+    
+    def invalidate(self, user_a, user_b):
+        """会话中的消息被修改或删除后调用"""
+        key = self._key(user_a, user_b)
+        with self._lock:
+            self._conversations.pop(key, None)
+    
+    def _load(self, key, newest_id):
+        """加载 newest_id 及之前最近的消息，与探测到的最新ID保持一致"""
+        conversation = self._conversation_filter(*key)
+        rows = db.session.query(*Message.list_columns()).filter(
+            conversation,
+            Message.id <= newest_id
+        ).order_by(desc(Message.id)).limit(self.size).all()
+        messages = [CachedMessage(*row) for row in reversed(rows)]
+        # 不足一个缓冲区时就是全部消息，不需要再计数
+        total = len(messages)
+        if total == self.size:
+            total = db.session.query(func.count(Message.id)).filter(conversation, Message.id <= newest_id).scalar()
+        return messages, total
+
+
+recent_messages = RecentMessageCache()
@@ -0,0 +1,112 @@
+import os
+import threading
+from database import db
+from models.user import User
+from services.bloom import BloomFilter
+
+
+class RegistrationFilter:
+    """已占用用户名和邮箱的布隆过滤器
+    
+    注册时先查过滤器：判断为一定不存在时跳过查重查询直接插入，可能存在时才查数据库。
+    过滤器由后台线程按 users 表构建（每个 worker 进程收到第一个请求时启动），
+    构建完成前一律按“可能存在”处理，注册走原来的查重查询。
+    本进程注册的用户随插入加入（构建期间的插入在构建完成后补入）；
+    其他进程注册的用户由插入时的唯一约束冲突兜底。元素数超过容量时在后台重建。
+    """
+    
+    def __init__(self, app=None):
+        self.app = None
+        self.capacity = 1000000
+        self._bloom = None
+        self._bloom_capacity = 0
+        # 构建期间本进程插入的键，构建完成后补入
+        self._pending = None
+        self._worker = None
+        self._worker_pid = None
+        self._lock = threading.Lock()
+        
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        self.app = app
+        self.capacity = app.config.get('REGISTRATION_BLOOM_CAPACITY', self.capacity)
+        app.before_request(self._ensure_built)
+    
+    @staticmethod
+    def _keys(username, email):
+        # 统一转小写，与大小写不敏感的排序规则保持一致（多出的误判只会多一次查询）
+        return f'u:{username.lower()}', f'e:{email.lower()}'
+    
+    def might_exist(self, username, email):
+        """用户名或邮箱是否可能已被占用，False 表示一定未被占用"""
+        bloom = self._bloom
+        if bloom is None:
+            return True
+        return any(key in bloom for key in self._keys(username, email))
+    
+    def add(self, username, email):
+        """新用户插入后调用"""
+        keys = self._keys(username, email)
+        with self._lock:
+            if self._pending is not None:
+                self._pending.extend(keys)
+            bloom = self._bloom
+            if bloom is None:
+                return
+            for key in keys:
+                bloom.add(key)
+            if bloom.count > self._bloom_capacity:
+                self._bloom = None
+        if bloom.count > self._bloom_capacity:
+            self._start_build()
+    
+    def rebuild(self):
+        """按 users 表重建过滤器，需要在应用上下文中调用"""
+        with self._lock:
+            self._pending = []
+        try:
+            users = db.session.query(db.func.count(User.id)).scalar()
+            # 每个用户两个键，预留一倍余量
+            capacity = max(self.capacity, users * 4)
+            bloom = BloomFilter(capacity)
+            rows = db.session.query(User.username, User.email).execution_options(
+                stream_results=True
+            ).yield_per(10000)
+            for username, email in rows:
+                for key in self._keys(username, email):
+                    bloom.add(key)
+            with self._lock:
+                for key in self._pending:
+                    bloom.add(key)
+                self._bloom = bloom
+                self._bloom_capacity = capacity
+            return bloom
+        finally:
+            with self._lock:
+                self._pending = None
+    
+    def _ensure_built(self):
+        """before_request 钩子：过滤器未就绪时在后台构建（fork 之后会在子进程中重新启动）"""
+        if self._bloom is None:
+            self._start_build()
+    
+    def _start_build(self):
+        with self._lock:
+            if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+                return
+            self._worker_pid = os.getpid()
+            self._worker = threading.Thread(target=self._run, name='RegistrationFilterBuild', daemon=True)
+            self._worker.start()
+    
+    def _run(self):
+        try:
+            with self.app.app_context():
+                bloom = self.rebuild()
+            self.app.logger.info(f'注册过滤器已构建: {bloom.count} 个键')
+        except Exception as e:
+            self.app.logger.error(f'注册过滤器构建失败: {e}')
+
+
+registration_filter = RegistrationFilter()
@@ -0,0 +1,61 @@
+from datetime import date
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # 可选依赖，未安装时退回标准库 json
+    orjson = None
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """快速 JSON 序列化
+    
+    安装了 orjson 时用它序列化（原生支持 datetime），否则退回标准库 json。
+    两种实现都把 datetime 输出为 ISO 8601 字符串，模型的 to_dict()
+    和按列序列化的结果可以直接返回 datetime 对象，不必逐个调用 isoformat()。
+    """
+    
+    sort_keys = False
+    ensure_ascii = False
+    
+    def __init__(self, app, backend='auto'):
+        super().__init__(app)
+        self.use_orjson = orjson is not None and backend in ('auto', 'orjson')
+        if backend == 'orjson' and orjson is None:
+            raise RuntimeError('JSON_BACKEND=orjson，但未安装 orjson 包')
+    
+    @staticmethod
+    def default(o):
+        if isinstance(o, date):
+            return o.isoformat()
+        return DefaultJSONProvider.default(o)
+    
+    def dumps(self, obj, **kwargs):
+        if self.use_orjson and not kwargs:
+            return self.dumps_bytes(obj).decode('utf-8')
+        return super().dumps(obj, **kwargs)
+    
+    def dumps_bytes(self, obj, indent=False):
+        """序列化为 UTF-8 字节串，避免一次多余的编解码"""
+        if self.use_orjson:
+            option = orjson.OPT_NON_STR_KEYS
+            if indent:
+                option |= orjson.OPT_INDENT_2
+            return orjson.dumps(obj, default=self.default, option=option)
+        
+        if indent:
+            return super().dumps(obj, indent=2).encode('utf-8')
+        return super().dumps(obj, separators=(',', ':')).encode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        if self.use_orjson and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(
+            self.dumps_bytes(obj, indent=indent) + b'\n', mimetype=self.mimetype
+        )
+
@@ -0,0 +1,98 @@
+import threading
+from functools import wraps
+from flask import current_app, request
+from flask_jwt_extended import get_jwt_identity
+
+
+class _Call:
+    """一次进行中的计算，结果为 (响应体, 状态码, 响应头)"""
+    
+    __slots__ = ('done', 'result')
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+class SingleFlight:
+    """相同并发读请求的合并
+    
+    同一用户对同一端点、相同参数的 GET 请求同时到达时（如多个设备同时打开应用），
+    只有第一个请求执行视图，其余请求等待它完成后各自拿到一份响应体的副本，
+    响应压缩等 after_request 处理仍按各自的请求头进行。只在同一 worker 进程内合并，
+    未登录的请求、流式响应不合并；等待超过 SINGLE_FLIGHT_TIMEOUT 秒或第一个请求出错时自行执行。
+    每个 sync worker 同时只处理一个请求，不会有可合并的并发请求，需要 gthread / gevent 等并发 worker。
+    """
+    
+    def __init__(self, app=None):
+        self.enabled = True
+        self.timeout = 10
+        self._calls = {}
+        self._lock = threading.Lock()
+        
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        self.enabled = app.config.get('SINGLE_FLIGHT_ENABLED', self.enabled)
+        self.timeout = app.config.get('SINGLE_FLIGHT_TIMEOUT', self.timeout)
+    
+    def coalesce(self, view):
+        """视图装饰器，放在 jwt_required 的下方"""
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = self._key(kwargs)
+            if key is None:
+                return view(*args, **kwargs)
+            
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+            
+            if not leader:
+                if call.done.wait(self.timeout) and call.result is not None:
+                    return self._copy(call.result)
+                return view(*args, **kwargs)
+            
+            try:
+                response = current_app.make_response(view(*args, **kwargs))
+                # 服务端错误不共享，等待的请求各自重试
+                if response.status_code < 500 and not response.is_streamed and not response.direct_passthrough:
+                    call.result = (response.get_data(), response.status_code, list(response.headers.items()))
+                return response
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call.done.set()
+        return wrapper
+    
+    def _key(self, view_args):
+        """用户 + 端点 + 参数，不合并时返回 None"""
+        if not self.enabled or request.method not in ('GET', 'HEAD'):
+            return None
+        try:
+            # 复用外层 jwt_required 已经验证过的令牌
+            identity = get_jwt_identity()
+        except RuntimeError:
+            # 没有经过 jwt_required 的视图
+            identity = None
+        if identity is None:
+            return None
+        return (
+            str(identity),
+            request.method,
+            request.endpoint,
+            tuple(sorted(view_args.items())),
+            tuple(sorted(request.args.items(multi=True)))
+        )
+    
+    @staticmethod
+    def _copy(result):
+        """每个等待的请求使用独立的响应对象，after_request 的修改互不影响"""
+        data, status, headers = result
+        return current_app.response_class(data, status=status, headers=headers)
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,29 @@
+from flask import current_app, stream_with_context
+
+
+def stream_json_list(key, rows, serialize, extra=None, chunk_size=100):
+    """流式输出 {"<key>": [...], "count": N, ...extra}
+    
+    rows 一般是带 yield_per 的查询，在生成响应体时才逐批从服务端游标读取，
+    每攒够 chunk_size 条就输出一块，单个请求占用的内存与结果总数无关。
+    """
+    dumps = current_app.json.dumps_bytes
+    
+    def generate():
+        yield b'{"' + key.encode('utf-8') + b'":['
+        count = 0
+        chunk = []
+        for row in rows:
+            chunk.append(dumps(serialize(row)))
+            count += 1
+            if len(chunk) >= chunk_size:
+                yield (b',' if count > len(chunk) else b'') + b','.join(chunk)
+                chunk = []
+        if chunk:
+            yield (b',' if count > len(chunk) else b'') + b','.join(chunk)
+        tail = dict(extra or {}, count=count)
+        yield b'],' + dumps(tail)[1:] + b'\n'
+    
+    return current_app.response_class(
+        stream_with_context(generate()), mimetype='application/json'
+    )
@@ -0,0 +1,197 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from flask import jsonify
+from sqlalchemy import event, func
+from database import db
+from models.revoked_token import RevokedToken
+from services.bloom import BloomFilter
+
+EPOCH = datetime(1970, 1, 1)
+
+# 签发时令牌中附带的签发时间（Unix 微秒）。标准的 iat 只精确到秒，
+# 按用户吊销后同一秒内签发的新令牌无法与旧令牌区分
+ISSUED_AT_CLAIM = 'iat_us'
+
+
+def _now_us():
+    return time.time_ns() // 1000
+
+
+class TokenBlocklist:
+    """令牌吊销名单
+    
+    每个请求的吊销检查依次经过：布隆过滤器（绝大多数未吊销的令牌在这里直接放行）、
+    精确结果的 LRU 缓存、数据库。布隆过滤器每隔 REVOCATION_SYNC_INTERVAL 秒
+    增量加载其他进程新增的吊销记录，每小时重建一次，同时清理相关令牌都已过期的记录。
+    本进程的吊销随调用方的事务提交后才写入过滤器和缓存，回滚时丢弃。
+    """
+    
+    def __init__(self, app=None):
+        self.sync_interval = 5
+        self.rebuild_interval = 3600
+        self.capacity = 100000
+        self.cache_size = 10000
+        self.max_token_lifetime = timedelta(days=30)
+        self._bloom = BloomFilter(self.capacity)
+        self._revoked_before = OrderedDict()
+        self._last_id = 0
+        self._last_sync = None
+        self._last_rebuild = None
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        """需要在 JWTManager 初始化之后调用"""
+        self.sync_interval = app.config.get('REVOCATION_SYNC_INTERVAL', self.sync_interval)
+        self.capacity = app.config.get('REVOCATION_BLOOM_CAPACITY', self.capacity)
+        self.max_token_lifetime = max(
+            app.config['JWT_ACCESS_TOKEN_EXPIRES'] or timedelta(0),
+            app.config['JWT_REFRESH_TOKEN_EXPIRES'] or timedelta(0)
+        )
+        self._bloom = BloomFilter(self.capacity)
+        
+        jwt_manager = app.extensions['flask-jwt-extended']
+        jwt_manager.token_in_blocklist_loader(self.is_revoked)
+        jwt_manager.revoked_token_loader(self._token_revoked)
+        jwt_manager.additional_claims_loader(self._issue_claims)
+        
+        event.listen(db.session, 'after_commit', self._after_commit)
+        event.listen(db.session, 'after_soft_rollback', self._after_rollback)
+    
+    def revoke_token(self, jwt_data):
+        """吊销单个令牌（不提交事务）"""
+        expires = jwt_data.get('exp') or int(time.time() + self.max_token_lifetime.total_seconds())
+        # 签发时间必然早于过期时间，因此该 jti 的令牌都会被判定为已吊销
+        self._add(jwt_data['jti'], expires * 1000000, EPOCH + timedelta(seconds=expires))
+    
+    def revoke_user(self, user_id):
+        """吊销用户此前签发的全部令牌，如修改密码后（不提交事务）
+        
+        按微秒级的签发时间比较，调用方随后签发的新令牌不受影响。
+        """
+        self._add(
+            RevokedToken.user_key(user_id),
+            _now_us(),
+            datetime.utcnow() + self.max_token_lifetime
+        )
+    
+    def is_revoked(self, jwt_header, jwt_data):
+        """token_in_blocklist_loader 回调"""
+        self._maybe_sync()
+        issued_at = self._issued_at(jwt_data)
+        for key in (jwt_data['jti'], RevokedToken.user_key(jwt_data['sub'])):
+            if key in self._bloom and issued_at <= self._get_revoked_before(key):
+                return True
+        return False
+    
+    @staticmethod
+    def _issue_claims(identity):
+        """additional_claims_loader 回调：签发时记录微秒级的签发时间"""
+        return {ISSUED_AT_CLAIM: _now_us()}
+    
+    @staticmethod
+    def _issued_at(jwt_data):
+        """令牌的签发时间（微秒）；没有该声明的旧令牌按签发那一秒的末尾计算"""
+        if ISSUED_AT_CLAIM in jwt_data:
+            return int(jwt_data[ISSUED_AT_CLAIM])
+        return jwt_data.get('iat', 0) * 1000000 + 999999
+    
+    def _add(self, token_key, revoked_before, expires_at):
+        db.session.add(RevokedToken(token_key=token_key, revoked_before=revoked_before, expires_at=expires_at))
+        db.session.info.setdefault('revoked_tokens', []).append((token_key, revoked_before))
+    
+    def _after_commit(self, session):
+        # 保存点提交时外层事务仍可能回滚
+        if session.in_nested_transaction():
+            return
+        for token_key, revoked_before in session.info.pop('revoked_tokens', ()):
+            self._remember(token_key, revoked_before)
+    
+    def _after_rollback(self, session, previous_transaction):
+        if not previous_transaction.nested:
+            session.info.pop('revoked_tokens', None)
+    
+    def _remember(self, token_key, revoked_before):
+        with self._lock:
+            self._bloom.add(token_key)
+            self._store(token_key, max(self._revoked_before.get(token_key, 0), revoked_before))
+    
+    def _store(self, token_key, revoked_before):
+        """写入精确结果缓存，需要持有 self._lock"""
+        self._revoked_before[token_key] = revoked_before
+        self._revoked_before.move_to_end(token_key)
+        while len(self._revoked_before) > self.cache_size:
+            self._revoked_before.popitem(last=False)
+    
+    def _get_revoked_before(self, token_key):
+        """布隆过滤器命中后的精确查询：先查缓存，再查数据库"""
+        with self._lock:
+            if token_key in self._revoked_before:
+                self._revoked_before.move_to_end(token_key)
+                return self._revoked_before[token_key]
+        
+        revoked_before = db.session.query(func.max(RevokedToken.revoked_before)).filter(
+            RevokedToken.token_key == token_key
+        ).scalar() or 0
+        with self._lock:
+            self._store(token_key, max(self._revoked_before.get(token_key, 0), revoked_before))
+        return revoked_before
+    
+    def _maybe_sync(self):
+        now = time.monotonic()
+        if self._last_sync is not None and now - self._last_sync < self.sync_interval:
+            return
+        # 只让一个线程去同步，其他线程继续使用当前的过滤器
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_sync = now
+            if self._last_rebuild is None or now - self._last_rebuild >= self.rebuild_interval:
+                self._last_rebuild = now
+                self._rebuild()
+            else:
+                self._load_new()
+        finally:
+            self._sync_lock.release()
+    
+    def _rebuild(self):
+        """清理过期的吊销记录，按未过期的记录重建布隆过滤器"""
+        # 在独立的连接中删除并提交，不影响当前请求的会话
+        with db.engine.begin() as connection:
+            connection.execute(
+                RevokedToken.__table__.delete().where(RevokedToken.expires_at < datetime.utcnow())
+            )
+        
+        rows = db.session.query(
+            RevokedToken.id, RevokedToken.token_key, RevokedToken.revoked_before
+        ).filter(RevokedToken.expires_at >= datetime.utcnow()).all()
+        
+        bloom = BloomFilter(max(self.capacity, len(rows) * 2))
+        for row in rows:
+            bloom.add(row.token_key)
+        with self._lock:
+            self._bloom = bloom
+            self._revoked_before.clear()
+            self._last_id = max([self._last_id] + [row.id for row in rows])
+    
+    def _load_new(self):
+        """增量加载其他进程新增的吊销记录"""
+        rows = db.session.query(
+            RevokedToken.id, RevokedToken.token_key, RevokedToken.revoked_before
+        ).filter(RevokedToken.id > self._last_id).order_by(RevokedToken.id).all()
+        for row in rows:
+            self._remember(row.token_key, row.revoked_before)
+        if rows:
+            self._last_id = rows[-1].id
+    
+    @staticmethod
+    def _token_revoked(jwt_header, jwt_data):
+        return jsonify({'error': '令牌已失效，请重新登录'}), 401
+
+
+token_blocklist = TokenBlocklist()
@@ -0,0 +1,136 @@
+import threading
+import time
+
+try:
+    import redis
+except ImportError:  # 可选依赖，未安装时只能使用内存存储
+    redis = None
+
+
+class MemoryTTLStore:
+    """进程内的带过期时间的键值存储"""
+    
+    # 每写入多少次顺带清理一次过期键
+    sweep_every = 1000
+    
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+        self._writes = 0
+    
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._writes += 1
+            if self._writes % self.sweep_every == 0:
+                self._sweep()
+    
+    def get(self, key):
+        return self.get_many([key]).get(key)
+    
+    def get_many(self, keys):
+        now = time.monotonic()
+        result = {}
+        with self._lock:
+            for key in keys:
+                item = self._data.get(key)
+                if item is None:
+                    continue
+                if item[1] <= now:
+                    del self._data[key]
+                    continue
+                result[key] = item[0]
+        return result
+    
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+    
+    def take_token(self, key, rate, capacity):
+        """令牌桶：取一个令牌，成功返回 0，否则返回需要等待的秒数
+        
+        rate 为每秒补充的令牌数，capacity 为桶容量。
+        """
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[1] <= now:
+                tokens, updated_at = capacity, now
+            else:
+                tokens, updated_at = item[0]
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            # 桶补满之后与新桶无异，可以过期
+            self._data[key] = ((tokens, now), now + capacity / rate)
+            self._writes += 1
+            if self._writes % self.sweep_every == 0:
+                self._sweep()
+            return wait
+    
+    def _sweep(self):
+        now = time.monotonic()
+        for key in [key for key, (_, expires_at) in self._data.items() if expires_at <= now]:
+            del self._data[key]
+
+
+class RedisTTLStore:
+    """基于 Redis 的共享存储，多个 worker 之间共享状态"""
+    
+    # 令牌桶在 Redis 端原子执行：补充令牌、尝试取出、刷新过期时间
+    TAKE_TOKEN_SCRIPT = """
+        local rate = tonumber(ARGV[1])
+        local capacity = tonumber(ARGV[2])
+        local now = tonumber(ARGV[3])
+        local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+        local tokens = tonumber(bucket[1]) or capacity
+        local updated_at = tonumber(bucket[2]) or now
+        tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+        local wait = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+        else
+            wait = (1 - tokens) / rate
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+        redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+        return tostring(wait)
+    """
+    
+    def __init__(self, url, prefix='chat:'):
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self._take_token = self.client.register_script(self.TAKE_TOKEN_SCRIPT)
+    
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, value, px=max(int(ttl * 1000), 1))
+    
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+    
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = self.client.mget([self.prefix + key for key in keys])
+        return {key: value for key, value in zip(keys, values) if value is not None}
+    
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+    
+    def take_token(self, key, rate, capacity):
+        """令牌桶：取一个令牌，成功返回 0，否则返回需要等待的秒数"""
+        return float(self._take_token(keys=[self.prefix + key], args=[rate, capacity, time.time()]))
+
+
+def create_store(url=None):
+    """根据配置创建存储：配置了 redis:// 地址且安装了 redis 时使用共享存储"""
+    if url and url.startswith(('redis://', 'rediss://', 'unix://')):
+        if redis is None:
+            raise RuntimeError('SHARED_STORE_URL 指向 Redis，但未安装 redis 包')
+        return RedisTTLStore(url)
+    return MemoryTTLStore()
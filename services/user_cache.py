@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from flask import g, has_app_context, jsonify
+from database import db
+from models.user import User
+
+
+class CachedUser(namedtuple('CachedUser', User.serialize_columns)):
+    """缓存的用户信息快照（只读，不含密码哈希）"""
+    
+    __slots__ = ()
+    
+    def to_dict(self):
+        return User.row_to_dict(self)
+    
+    def to_public_dict(self):
+        return User.row_to_public_dict(self)
+
+
+class UserCache:
+    """已登录用户的缓存
+    
+    作为 Flask-JWT-Extended 的 user_lookup_loader：同一请求内只解析一次，
+    进程内按 LRU 缓存 USER_CACHE_TTL 秒，用户信息修改后需要调用 invalidate。
+    多 worker 部署时其他进程的缓存最多在 TTL 后过期。
+    """
+    
+    def __init__(self, app=None):
+        self.ttl = 300
+        self.max_size = 10000
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+        
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        """需要在 JWTManager 初始化之后调用"""
+        self.ttl = app.config.get('USER_CACHE_TTL', self.ttl)
+        self.max_size = app.config.get('USER_CACHE_SIZE', self.max_size)
+        jwt_manager = app.extensions['flask-jwt-extended']
+        jwt_manager.user_lookup_loader(self._lookup_user)
+        jwt_manager.user_lookup_error_loader(self._user_not_found)
+    
+    def get(self, user_id):
+        """获取用户信息，不存在时返回 None"""
+        return self.get_many([user_id]).get(user_id)
+    
+    def get_many(self, user_ids):
+        """批量获取用户信息，未命中的用一次查询加载，返回 {用户ID: CachedUser}"""
+        now = time.monotonic()
+        result = {}
+        with self._lock:
+            for user_id in user_ids:
+                item = self._users.get(user_id)
+                if item is None:
+                    continue
+                if item[1] <= now:
+                    del self._users[user_id]
+                    continue
+                self._users.move_to_end(user_id)
+                result[user_id] = item[0]
+        
+        missing = set(user_ids) - set(result)
+        if missing:
+            rows = db.session.query(*User.list_columns()).filter(User.id.in_(missing)).all()
+            loaded = {row.id: CachedUser(*row) for row in rows}
+            with self._lock:
+                for user_id, user in loaded.items():
+                    self._users[user_id] = (user, now + self.ttl)
+                    self._users.move_to_end(user_id)
+                while len(self._users) > self.max_size:
+                    self._users.popitem(last=False)
+            result.update(loaded)
+        return result
+    
+    def invalidate(self, user_id):
+        """用户信息修改后清除缓存"""
+        with self._lock:
+            self._users.pop(user_id, None)
+        if has_app_context():
+            g.get('_cached_users', {}).pop(user_id, None)
+    
+    def _lookup_user(self, jwt_header, jwt_data):
+        """user_lookup_loader 回调：先查请求内缓存，再查进程缓存"""
+        user_id = int(jwt_data['sub'])
+        request_users = g.setdefault('_cached_users', {})
+        if user_id not in request_users:
+            request_users[user_id] = self.get(user_id)
+        return request_users[user_id]
+    
+    
+    @staticmethod
+    def _user_not_found(jwt_header, jwt_data):
+        """token 对应的用户已不存在"""
+        return jsonify({'error': '用户不存在'}), 404
+
+
+user_cache = UserCache()
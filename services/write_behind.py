@@ -0,0 +1,119 @@
+import atexit
+import os
+import threading
+
+
+class WriteBehindBuffer:
+    """写后缓冲区
+    
+    按键合并待写入的数据，由后台线程定期批量刷写到数据库。
+    子类实现 `merge` 和 `write_batch` 即可。
+    """
+    
+    # 对应的配置项名称，由子类覆盖
+    interval_config = None
+    batch_size_config = None
+    
+    def __init__(self, app=None, flush_interval=1.0, batch_size=500):
+        self.app = None
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker = None
+        self._worker_pid = None
+        
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        """绑定应用并读取配置"""
+        self.app = app
+        if self.interval_config:
+            self.flush_interval = app.config.get(self.interval_config, self.flush_interval)
+        if self.batch_size_config:
+            self.batch_size = app.config.get(self.batch_size_config, self.batch_size)
+        atexit.register(self.flush)
+    
+    def merge(self, old, new):
+        """合并同一个键的新旧值，默认保留新值"""
+        return new
+    
+    def write_batch(self, items):
+        """把一批 {键: 值} 写入数据库，由子类实现"""
+        raise NotImplementedError
+    
+    def put(self, key, value):
+        """写入缓冲区，同一个键的多次写入会被合并"""
+        with self._lock:
+            if key in self._pending:
+                value = self.merge(self._pending[key], value)
+            self._pending[key] = value
+            pending_count = len(self._pending)
+        
+        # 刷写间隔 <= 0 时退化为同步写入
+        if self.flush_interval <= 0:
+            self.flush()
+            return
+        
+        self._ensure_worker()
+        if pending_count >= self.batch_size:
+            self._wakeup.set()
+    
+    def peek(self, key):
+        """查看尚未刷写的值，不存在时返回 None"""
+        with self._lock:
+            return self._pending.get(key)
+    
+    def peek_many(self, keys):
+        """批量查看尚未刷写的值"""
+        with self._lock:
+            return {key: self._pending[key] for key in keys if key in self._pending}
+    
+    def discard(self, key):
+        """丢弃尚未刷写的值（通常是因为已经同步写入）"""
+        with self._lock:
+            self._pending.pop(key, None)
+    
+    def flush(self):
+        """立即把缓冲区中的数据分批写入数据库"""
+        with self._lock:
+            items, self._pending = self._pending, {}
+        
+        if not items or self.app is None:
+            return
+        
+        keys = list(items)
+        for start in range(0, len(keys), self.batch_size):
+            batch = {key: items[key] for key in keys[start:start + self.batch_size]}
+            try:
+                with self.app.app_context():
+                    self.write_batch(batch)
+            except Exception as e:
+                self.app.logger.error(f'{type(self).__name__} 刷写失败: {e}')
+                # 放回缓冲区，等待下一轮重试
+                with self._lock:
+                    for key, value in batch.items():
+                        if key in self._pending:
+                            value = self.merge(value, self._pending[key])
+                        self._pending[key] = value
+    
+    def _ensure_worker(self):
+        """按需启动后台刷写线程（fork 之后会在子进程中重新启动）"""
+        if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+                return
+            self._worker_pid = os.getpid()
+            self._worker = threading.Thread(
+                target=self._run, name=f'{type(self).__name__}-flusher', daemon=True
+            )
+            self._worker.start()
+    
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
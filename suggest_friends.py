@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+重新计算好友推荐（可能认识的人）
+
+应用进程默认不计算推荐（FRIEND_SUGGESTION_INTERVAL=0），由 cron 定时执行本脚本：
+    0 * * * * cd /path/to/app && python suggest_friends.py
+"""
+
+import time
+from app import app, create_tables
+from services.friend_suggestions import friend_suggestions, np
+
+if __name__ == "__main__":
+    create_tables()
+    started = time.monotonic()
+    with app.app_context():
+        count = friend_suggestions.rebuild()
+    backend = "NumPy" if np is not None else "array"
+    print(f"✅ 好友推荐已更新: {count} 个用户，耗时 {time.monotonic() - started:.1f} 秒（{backend}）")
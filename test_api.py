@@ -88,6 +88,15 @@ class ChatAPITester:
         print(f"响应: {response.json()}")
         print()
         
+    def test_accept_friend(self, requester_id):
+        """测试同意好友请求"""
+        print("=== 测试同意好友请求 ===")
+        data = {"user_id": requester_id}
+        response = self.session.post(f"{BASE_URL}/friend/accept", json=data)
+        print(f"状态码: {response.status_code}")
+        print(f"响应: {response.json()}")
+        print()
+        
     def test_get_friends(self):
         """测试获取好友列表"""
         print("=== 测试获取好友列表 ===")
@@ -161,6 +170,8 @@ def main():
     
     # 好友管理测试
     tester.test_add_friend("user2")
+    # 好友请求需要对方同意后才能互发消息
+    tester2.test_accept_friend(tester.user_id)
     tester.test_get_friends()
     tester.test_search_users("user")
     
@@ -89,14 +89,24 @@ def test_complete_workflow():
         # Alice 添加 Bob 为好友
         alice_session = requests.Session()
         alice_session.headers.update({'Authorization': f'Bearer {user_tokens["alice"]}'})
+        bob_session = requests.Session()
+        bob_session.headers.update({'Authorization': f'Bearer {user_tokens["bob"]}'})
         
         try:
             response = alice_session.post(f"{BASE_URL}/friend/add", 
                                         json={"friend_username": "bob"})
             if response.status_code == 200:
-                print("✅ Alice 成功添加 Bob 为好友")
+                print("✅ Alice 已向 Bob 发送好友请求")
             else:
                 print(f"❌ 添加好友失败: {response.json()}")
+            
+            # Bob 同意好友请求
+            response = bob_session.post(f"{BASE_URL}/friend/accept",
+                                      json={"user_id": user_ids["alice"]})
+            if response.status_code == 200:
+                print("✅ Bob 同意了 Alice 的好友请求")
+            else:
+                print(f"❌ 同意好友请求失败: {response.json()}")
         except Exception as e:
             print(f"❌ 添加好友时出错: {e}")
         
@@ -129,9 +139,6 @@ def test_complete_workflow():
                 print(f"❌ 发送消息时出错: {e}")
         
         # Bob 回复消息
-        bob_session = requests.Session()
-        bob_session.headers.update({'Authorization': f'Bearer {user_tokens["bob"]}'})
-        
         try:
             response = bob_session.post(f"{BASE_URL}/message/send", 
                                       json={